@@ -0,0 +1,72 @@
+import logging
+import os
+from collections import Counter
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Adaptive sampling settings (override via environment)
+# Opt-in: the analysed frame set, and so the report counts, depends on the scene
+ADAPTIVE_SKIP_ENABLED = os.getenv("ADAPTIVE_SKIP", "0") == "1"
+ADAPTIVE_SKIP_MIN = int(os.getenv("ADAPTIVE_SKIP_MIN", "1"))
+ADAPTIVE_SKIP_MAX = int(os.getenv("ADAPTIVE_SKIP_MAX", "8"))
+# Largest move of the fastest vehicle between analysed frames (px at DISPLAY_WIDTH);
+# well under a car's length so the tracker's IoU matching keeps its IDs
+ADAPTIVE_SKIP_TARGET_PX = float(os.getenv("ADAPTIVE_SKIP_TARGET_PX", "24"))
+ADAPTIVE_SKIP_DENSE_TRACKS = 25  # Busy scenes never go above the base skip
+ADAPTIVE_SKIP_RAISE_AFTER = 5  # Analysed frames a larger skip must stay justified before stepping up
+CANDIDATE_ANGLE_DIFF = 90  # A mover this far off its flow may be about to turn into a violation
+
+
+class AdaptiveSkip:
+    """
+    Per-job frame skip, chosen from what the last analysed frame showed.
+
+    The skip drops at once (to the minimum while a wrong-way candidate is in view, or
+    to what keeps the fastest vehicle's step under ADAPTIVE_SKIP_TARGET_PX) and rises
+    one frame at a time once a larger value has held for a few frames. An empty road
+    goes to the maximum. Speeds are normalised by elapsed source frames (TrackStore),
+    so they do not depend on the skip in use.
+    """
+    def __init__(self, base: int, min_skip: int = ADAPTIVE_SKIP_MIN, max_skip: int = ADAPTIVE_SKIP_MAX,
+                 target_px: float = ADAPTIVE_SKIP_TARGET_PX):
+        self.base = base
+        self.min_skip = max(1, min_skip)
+        self.max_skip = max(self.min_skip, max_skip)
+        self.target_px = target_px
+        self.skip = base
+        self._calm = 0
+        self.used = Counter()  # skip -> analysed frames sampled with it
+
+    def target(self, px_per_frame, candidate: bool) -> int:
+        """Skip the scene calls for: px_per_frame holds the speed of every tracked vehicle."""
+        if candidate:
+            return self.min_skip
+        if len(px_per_frame) == 0:
+            return self.max_skip
+        fastest = float(max(px_per_frame))
+        target = int(self.target_px // fastest) if fastest > 0 else self.max_skip
+        if len(px_per_frame) >= ADAPTIVE_SKIP_DENSE_TRACKS:
+            target = min(target, self.base)
+        return min(max(target, self.min_skip), self.max_skip)
+
+    def update(self, px_per_frame, candidate: bool = False):
+        """Called once per analysed frame; sets the skip for the frames sampled next."""
+        self.used[self.skip] += 1
+        target = self.target(px_per_frame, candidate)
+        if target < self.skip:
+            self.skip = target
+            self._calm = 0
+        elif target > self.skip:
+            self._calm += 1
+            if self._calm >= ADAPTIVE_SKIP_RAISE_AFTER:
+                self.skip += 1
+                self._calm = 0
+        else:
+            self._calm = 0
+
+    def metrics(self):
+        frames = sum(self.used.values())
+        mean = sum(skip * n for skip, n in self.used.items()) / frames if frames else float(self.skip)
+        return {"skip": self.skip, "mean_skip": round(mean, 2), "histogram": dict(sorted(self.used.items()))}
@@ -0,0 +1,418 @@
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from typing import Optional
+from urllib.parse import urlsplit, urlunsplit
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Analytics store settings (override via environment)
+ANALYTICS_ENABLED = os.getenv("ANALYTICS_ENABLED", "1") != "0"
+ANALYTICS_DB = os.getenv("ANALYTICS_DB", "analytics.db")
+ANALYTICS_BATCH_ROWS = int(os.getenv("ANALYTICS_BATCH_ROWS", "500"))  # Rows a job buffers before handing them to the writer
+ANALYTICS_QUERY_LIMIT = 1000  # Default rows per query
+ANALYTICS_MAX_ROWS = 10000  # Upper bound of a query's limit
+ANALYTICS_STOP_TIMEOUT_S = 30
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS videos (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    kind TEXT NOT NULL,  -- file | stream
+    status TEXT NOT NULL,  -- running | done
+    started_at REAL NOT NULL,  -- Unix time the analysis started
+    finished_at REAL,
+    total INTEGER,
+    forward INTEGER,
+    backward INTEGER,
+    stationary INTEGER,
+    violations INTEGER,
+    average_speed REAL,
+    full_video TEXT,
+    cloud_video_url TEXT
+);
+CREATE INDEX IF NOT EXISTS videos_name ON videos (name);
+CREATE INDEX IF NOT EXISTS videos_started ON videos (started_at);
+
+CREATE TABLE IF NOT EXISTS tracks (
+    video_id INTEGER NOT NULL,
+    track_id INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    direction TEXT NOT NULL,  -- forward | backward | stationary
+    violated INTEGER NOT NULL,
+    max_speed REAL,
+    first_time REAL,  -- Seconds into the video (streams: since the stream started)
+    last_time REAL,
+    PRIMARY KEY (video_id, track_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS tracks_time ON tracks (video_id, first_time);
+CREATE INDEX IF NOT EXISTS tracks_type ON tracks (type, violated, video_id);
+CREATE INDEX IF NOT EXISTS tracks_violated ON tracks (video_id) WHERE violated = 1;
+
+CREATE TABLE IF NOT EXISTS violations (
+    video_id INTEGER NOT NULL,
+    track_id INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    start_time REAL NOT NULL,
+    end_time REAL NOT NULL,
+    start_frame INTEGER,
+    end_frame INTEGER,
+    clip TEXT
+);
+CREATE INDEX IF NOT EXISTS violations_time ON violations (video_id, start_time);
+CREATE INDEX IF NOT EXISTS violations_type ON violations (type, video_id);
+
+CREATE TABLE IF NOT EXISTS flow (
+    video_id INTEGER NOT NULL,
+    minute INTEGER NOT NULL,  -- Minute of the video the vehicles were counted / violations started in
+    type TEXT NOT NULL,
+    vehicles INTEGER NOT NULL,
+    violations INTEGER NOT NULL,
+    PRIMARY KEY (video_id, minute, type)
+) WITHOUT ROWID;
+-- Covering: per-minute totals are read from the index alone
+CREATE INDEX IF NOT EXISTS flow_type ON flow (type, minute, vehicles, violations);
+"""
+
+INSERT_VIDEO = "INSERT INTO videos (id, name, kind, status, started_at) VALUES (?, ?, ?, 'running', ?)"
+INSERT_TRACK = "INSERT OR REPLACE INTO tracks VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+INSERT_VIOLATION = "INSERT INTO violations VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+UPSERT_FLOW = """INSERT INTO flow VALUES (?, ?, ?, ?, ?) ON CONFLICT (video_id, minute, type)
+    DO UPDATE SET vehicles = vehicles + excluded.vehicles, violations = violations + excluded.violations"""
+FINISH_VIDEO = """UPDATE videos SET status = 'done', finished_at = ?, total = ?, forward = ?, backward = ?,
+    stationary = ?, violations = ?, average_speed = ?, full_video = ?, cloud_video_url = ? WHERE id = ?"""
+# Re-analysing a file replaces its earlier results
+SUPERSEDED = "SELECT id FROM videos WHERE name = ? AND kind = 'file' AND id != ?"
+DELETE_VIDEO = [f"DELETE FROM {table} WHERE {column} = ?" for table, column in
+                (("tracks", "video_id"), ("violations", "video_id"), ("flow", "video_id"), ("videos", "id"))]
+
+
+def stream_name(source: str) -> str:
+    """Name a stream is stored under: its URL without credentials."""
+    parts = urlsplit(source)
+    if parts.username or parts.password:
+        parts = parts._replace(netloc=parts.hostname + (f":{parts.port}" if parts.port else ""))
+    return urlunsplit(parts)
+
+
+class VideoRecorder:
+    """
+    Collects one analysis's per-track summaries, violations and per-minute flow counts,
+    and hands them to the store's writer every `batch_rows` rows, so long jobs and live
+    streams are persisted as they run without holding their results in memory.
+    """
+    def __init__(self, store, video_id: int, name: str, kind: str, batch_rows: int = ANALYTICS_BATCH_ROWS):
+        self.store = store
+        self.video_id = video_id
+        self.name = name
+        self.kind = kind
+        self.batch_rows = batch_rows
+        self.tracks = []
+        self.violations = []
+        self.flow = defaultdict(lambda: [0, 0])  # (minute, type) -> [vehicles, violations]
+        self.closed = False
+        self.aborted = False
+
+    def track(self, track_id: int, vehicle_type: str, direction: str, violated: bool, max_speed: Optional[float],
+              first_time: Optional[float], last_time: Optional[float]):
+        self.tracks.append((self.video_id, int(track_id), vehicle_type, direction, int(violated),
+                            max_speed, first_time, last_time))
+        self._maybe_flush()
+
+    def violation(self, detail: dict):
+        """One entry of the report's violation_list."""
+        self.violations.append((self.video_id, detail["id"], detail["type"], detail["start_time"],
+                                detail["end_time"], detail["start_frame"], detail["end_frame"], detail.get("clip")))
+        self.flow[(int(detail["start_time"] // 60), detail["type"])][1] += 1
+        self._maybe_flush()
+
+    def vehicle(self, time_s: float, vehicle_type: str):
+        """A vehicle counted at time_s, for the per-minute flow."""
+        self.flow[(int(time_s // 60), vehicle_type)][0] += 1
+
+    def _maybe_flush(self):
+        if len(self.tracks) + len(self.violations) >= self.batch_rows:
+            self.flush()
+
+    def flush(self):
+        if self.aborted:
+            # A replay thread still running after its job was cancelled: its rows are discarded
+            self.tracks, self.violations = [], []
+            self.flow.clear()
+            return
+        ops = []
+        if self.tracks:
+            ops.append((INSERT_TRACK, self.tracks))
+        if self.violations:
+            ops.append((INSERT_VIOLATION, self.violations))
+        if self.flow:
+            ops.append((UPSERT_FLOW, [(self.video_id, minute, vehicle_type, vehicles, violations)
+                                      for (minute, vehicle_type), (vehicles, violations) in self.flow.items()]))
+        if ops:
+            self.store.submit(ops)
+        self.tracks, self.violations = [], []
+        self.flow.clear()
+
+    def finish(self, summary: dict):
+        """Writes what is left and the report totals; the analysis becomes visible as done."""
+        if self.closed:
+            return
+        self.closed = True
+        self.flush()
+        row = (time.time(), summary["total"], summary["forward"], summary["backward"], summary["stationary"],
+               summary["violations"], summary["average_speed"], summary.get("full_video"),
+               summary.get("cloud_video_url"), self.video_id)
+        self.store.submit([(FINISH_VIDEO, [row])],
+                          replace=(self.name, self.video_id) if self.kind == "file" else None)
+
+    def abort(self):
+        """The job stopped without a report: everything it wrote is deleted."""
+        if self.closed:
+            return
+        self.closed = self.aborted = True
+        self.tracks, self.violations = [], []
+        self.flow.clear()
+        self.store.submit([(sql, [(self.video_id,)]) for sql in DELETE_VIDEO])
+
+
+class AnalyticsStore:
+    """
+    Embedded SQLite database of analysis results, queryable across every processed video.
+
+    Jobs write through a VideoRecorder; all writes go through one writer thread, which
+    commits whatever is queued (up to a batch) in a single transaction with executemany.
+    The database runs in WAL mode, so queries (on per-thread connections) never wait for
+    the writer. Tables are indexed for the dashboard's filters: video, time range,
+    vehicle type and violation flag.
+    """
+    def __init__(self, path: str = ANALYTICS_DB, batch_rows: int = ANALYTICS_BATCH_ROWS):
+        self.path = path
+        self.batch_rows = batch_rows
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._local = threading.local()
+        conn = self._connection()
+        conn.executescript(SCHEMA)
+        # Analyses cut short by a restart never finish
+        with conn:
+            for (video_id,) in conn.execute("SELECT id FROM videos WHERE status = 'running'").fetchall():
+                for sql in DELETE_VIDEO:
+                    conn.execute(sql, (video_id,))
+        self._next_id = (conn.execute("SELECT MAX(id) FROM videos").fetchone()[0] or 0) + 1
+        self._id_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self.rows_written = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.last_commit_ms = 0.0
+        self._thread = threading.Thread(target=self._writer, name="analytics-writer", daemon=True)
+        self._thread.start()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def record(self, name: str, kind: str = "file") -> VideoRecorder:
+        """Starts recording one analysis (kind: file | stream)."""
+        with self._id_lock:
+            video_id = self._next_id
+            self._next_id += 1
+        self.submit([(INSERT_VIDEO, [(video_id, name, kind, time.time())])])
+        return VideoRecorder(self, video_id, name, kind, self.batch_rows)
+
+    def submit(self, ops, replace=None):
+        """Queues [(sql, rows)] for the writer; `replace` (name, id) drops earlier analyses of a file."""
+        self._queue.put((ops, replace))
+
+    def _writer(self):
+        conn = self._connection()
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            # Everything already queued goes into the same transaction, up to a batch
+            items = [item]
+            rows = sum(len(r) for _, r in item[0])
+            stop = False
+            while rows < self.batch_rows:
+                try:
+                    more = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if more is None:
+                    stop = True
+                    break
+                items.append(more)
+                rows += sum(len(r) for _, r in more[0])
+            start = time.perf_counter()
+            try:
+                with conn:
+                    for ops, replace in items:
+                        for sql, params in ops:
+                            conn.executemany(sql, params)
+                        if replace:
+                            for (old_id,) in conn.execute(SUPERSEDED, replace).fetchall():
+                                for sql in DELETE_VIDEO:
+                                    conn.execute(sql, (old_id,))
+                self.rows_written += rows
+                self.batches += 1
+                self.last_commit_ms = (time.perf_counter() - start) * 1000
+            except sqlite3.Error as e:
+                self.failed_batches += 1
+                logger.error(f"Analytics write failed ({rows} rows dropped): {e}")
+            for _ in items:
+                self._queue.task_done()
+            if stop:
+                self._queue.task_done()
+                return
+
+    def flush(self):
+        """Blocks until everything submitted so far is committed."""
+        if self._thread.is_alive():
+            self._queue.join()
+
+    def stop(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=ANALYTICS_STOP_TIMEOUT_S)
+
+    def _query(self, sql, params):
+        return [dict(row) for row in self._connection().execute(sql, params).fetchall()]
+
+    @staticmethod
+    def _video_filters(video, since, until):
+        """WHERE terms on the videos table (v)."""
+        where, params = ["1"], []
+        if video is not None:
+            where.append("v.name = ?")
+            params.append(video)
+        if since is not None:
+            where.append("v.started_at >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("v.started_at < ?")
+            params.append(until)
+        return where, params
+
+    @staticmethod
+    def _limit(limit):
+        return max(1, min(int(limit), ANALYTICS_MAX_ROWS))
+
+    def videos(self, name: str = None, since: float = None, until: float = None,
+               limit: int = ANALYTICS_QUERY_LIMIT):
+        """Analyses, newest first. since / until are Unix times of the analysis."""
+        where, params = self._video_filters(name, since, until)
+        return self._query(f"SELECT v.* FROM videos v WHERE {' AND '.join(where)} ORDER BY v.id DESC LIMIT ?",
+                           params + [self._limit(limit)])
+
+    def violations(self, video: str = None, vehicle_type: str = None, start: float = None, end: float = None,
+                   since: float = None, until: float = None, limit: int = ANALYTICS_QUERY_LIMIT):
+        """
+        Violations, newest analysis first. start / end select violations overlapping that
+        range of seconds into the video; since / until select analyses by when they ran.
+        """
+        where, params = self._video_filters(video, since, until)
+        if vehicle_type is not None:
+            where.append("x.type = ?")
+            params.append(vehicle_type)
+        if start is not None:
+            where.append("x.end_time >= ?")
+            params.append(start)
+        if end is not None:
+            where.append("x.start_time <= ?")
+            params.append(end)
+        return self._query(
+            f"SELECT v.name AS video, x.* FROM violations x JOIN videos v ON v.id = x.video_id "
+            f"WHERE {' AND '.join(where)} ORDER BY x.video_id DESC, x.start_time LIMIT ?",
+            params + [self._limit(limit)])
+
+    def tracks(self, video: str = None, vehicle_type: str = None, violated: bool = None, min_speed: float = None,
+               start: float = None, end: float = None, since: float = None, until: float = None,
+               limit: int = ANALYTICS_QUERY_LIMIT):
+        """Per-track summaries (type, direction, max speed, time on screen), newest analysis first."""
+        where, params = self._video_filters(video, since, until)
+        if vehicle_type is not None:
+            where.append("t.type = ?")
+            params.append(vehicle_type)
+        if violated is not None:
+            # A literal, so the partial index on violators can be used
+            where.append(f"t.violated = {int(bool(violated))}")
+        if min_speed is not None:
+            where.append("t.max_speed >= ?")
+            params.append(min_speed)
+        if start is not None:
+            where.append("t.last_time >= ?")
+            params.append(start)
+        if end is not None:
+            where.append("t.first_time <= ?")
+            params.append(end)
+        return self._query(
+            f"SELECT v.name AS video, t.* FROM tracks t JOIN videos v ON v.id = t.video_id "
+            f"WHERE {' AND '.join(where)} ORDER BY t.video_id DESC, t.first_time LIMIT ?",
+            params + [self._limit(limit)])
+
+    def flow(self, video: str = None, vehicle_type: str = None, start_minute: int = None, end_minute: int = None,
+             since: float = None, until: float = None):
+        """Vehicles counted and violations started per minute of video and type, summed over the matching analyses."""
+        where, params = self._video_filters(video, since, until)
+        if vehicle_type is not None:
+            where.append("f.type = ?")
+            params.append(vehicle_type)
+        if start_minute is not None:
+            where.append("f.minute >= ?")
+            params.append(start_minute)
+        if end_minute is not None:
+            where.append("f.minute <= ?")
+            params.append(end_minute)
+        # Totals over every video need no join: they come straight from the flow_type index
+        join = "JOIN videos v ON v.id = f.video_id" if video is not None or since is not None or until is not None else ""
+        return self._query(
+            f"SELECT f.minute, f.type, SUM(f.vehicles) AS vehicles, SUM(f.violations) AS violations, "
+            f"COUNT(*) AS videos FROM flow f {join} "
+            f"WHERE {' AND '.join(where)} GROUP BY f.minute, f.type ORDER BY f.minute, f.type", params)
+
+    def metrics(self):
+        try:
+            size = sum(os.path.getsize(p) for p in (self.path, self.path + "-wal") if os.path.exists(p))
+        except OSError:
+            size = 0
+        return {
+            "path": self.path,
+            "size_mb": round(size / (1024 * 1024), 2),
+            "queued": self._queue.qsize(),
+            "rows_written": self.rows_written,
+            "batches": self.batches,
+            "mean_batch_rows": round(self.rows_written / self.batches, 1) if self.batches else 0.0,
+            "last_commit_ms": round(self.last_commit_ms, 2),
+            "failed_batches": self.failed_batches,
+        }
+
+
+# Process-wide singleton, built on first use
+_analytics_store = None
+_analytics_store_lock = threading.Lock()
+
+
+def get_analytics_store() -> Optional[AnalyticsStore]:
+    """Returns the shared AnalyticsStore, or None when ANALYTICS_ENABLED=0."""
+    global _analytics_store
+    if not ANALYTICS_ENABLED:
+        return None
+    if _analytics_store is None:
+        with _analytics_store_lock:
+            if _analytics_store is None:
+                _analytics_store = AnalyticsStore()
+    return _analytics_store
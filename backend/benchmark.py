@@ -0,0 +1,1106 @@
+"""
+Performance benchmarks for the TrafficGuard backend.
+
+Usage (from the backend directory):
+    python benchmark.py health-latency --video uploads/sample.mp4 --jobs 3
+    python benchmark.py decode --video uploads/sample.mp4 --skip 3
+    python benchmark.py batch --video uploads/sample.mp4 --sizes 1 4 8
+    python benchmark.py shard --video uploads/long.mp4 --workers 1 2 4
+    python benchmark.py cache --video uploads/sample.mp4
+    python benchmark.py tracks --vehicles 50 150 300
+    python benchmark.py soak --frames 60000
+    python benchmark.py stream --source uploads/sample.mp4
+    python benchmark.py upload --size-mb 512
+    python benchmark.py jobs --video uploads/sample.mp4 --jobs 8
+    python benchmark.py protocol --video uploads/sample.mp4
+    python benchmark.py motion --video uploads/highway.mp4
+    python benchmark.py skip --video uploads/highway.mp4 uploads/night.mp4
+    python benchmark.py backend --video uploads/sample.mp4 --int8
+    python benchmark.py encode --video uploads/sample.mp4 --presets ultrafast veryfast medium
+    python benchmark.py storage --video uploads/sample.mp4 --bandwidth-mbps 10
+    python benchmark.py startup --video uploads/sample.mp4
+    python benchmark.py kalman --vehicles 50 --noise-px 2
+    python benchmark.py analytics --videos 2000 --tracks 200
+"""
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+import numpy as np
+
+logging.basicConfig(level=logging.WARNING)
+
+
+def _percentiles(samples_ms):
+    arr = np.asarray(samples_ms, dtype=np.float64)
+    if arr.size == 0:
+        return {"count": 0}
+    return {
+        "count": int(arr.size),
+        "p50_ms": round(float(np.percentile(arr, 50)), 2),
+        "p95_ms": round(float(np.percentile(arr, 95)), 2),
+        "p99_ms": round(float(np.percentile(arr, 99)), 2),
+        "max_ms": round(float(arr.max()), 2),
+    }
+
+
+def _print_table(title, rows):
+    print(f"\n== {title} ==")
+    for name, values in rows:
+        print(f"{name:<28} " + "  ".join(f"{k}={v}" for k, v in values.items()))
+
+
+# -- health-latency --
+async def _health_latency(video, jobs, interval):
+    import httpx
+    from main import app
+    from processor import VideoProcessor
+
+    async def run_job():
+        frames = 0
+        async for result in VideoProcessor().process_video(video):
+            if "objects" in result:
+                frames += 1
+        return frames
+
+    async def probe(stop):
+        samples = []
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            while not stop.is_set():
+                start = time.perf_counter()
+                await client.get("/health")
+                samples.append((time.perf_counter() - start) * 1000)
+                await asyncio.sleep(interval)
+        return samples
+
+    idle_stop = asyncio.Event()
+    idle_task = asyncio.create_task(probe(idle_stop))
+    await asyncio.sleep(2.0)
+    idle_stop.set()
+    idle = await idle_task
+
+    busy_stop = asyncio.Event()
+    busy_task = asyncio.create_task(probe(busy_stop))
+    start = time.perf_counter()
+    frames = await asyncio.gather(*(run_job() for _ in range(jobs)))
+    elapsed = time.perf_counter() - start
+    busy_stop.set()
+    busy = await busy_task
+
+    _print_table("/health latency", [
+        ("idle", _percentiles(idle)),
+        (f"{jobs} concurrent job(s)", _percentiles(busy)),
+    ])
+    print(f"processed {sum(frames)} frames in {elapsed:.1f}s ({sum(frames) / elapsed:.1f} fps total)")
+
+
+# -- decode --
+def _decode(video, skip, modes):
+    import cv2
+    from frame_source import FrameSampler
+
+    rows = []
+    reference = None
+    for mode in modes:
+        cap = cv2.VideoCapture(video)
+        sampler = FrameSampler(cap, skip, mode=mode)
+        start = time.perf_counter()
+        sampled = [(idx, round(ts, 3)) for idx, ts, _ in sampler]
+        elapsed = time.perf_counter() - start
+        cap.release()
+
+        if reference is None:
+            reference = sampled
+        rows.append((mode, {
+            "analysed": len(sampled),
+            "decoded": sampler.frames_decoded,
+            "source_fps": round(sampler.frames_advanced / elapsed, 1),
+            "decoded_fps": round(sampler.frames_decoded / elapsed, 1),
+            "analysed_fps": round(len(sampled) / elapsed, 1),
+            "matches_read": sampled == reference,
+        }))
+    _print_table(f"frame sampling (skip={skip})", rows)
+
+
+# -- batch --
+async def _run_job(processor, video, **kwargs):
+    """Runs one job to completion; returns (analysed frames, elapsed seconds, report summary)."""
+    frames = 0
+    summary = None
+    start = time.perf_counter()
+    async for result in processor.process_video(video, **kwargs):
+        if result.get("type") == "report":
+            summary = result["summary"]
+        elif "objects" in result:
+            frames += 1
+    return frames, time.perf_counter() - start, summary
+
+
+def _comparable(summary):
+    keys = ("total", "forward", "backward", "stationary", "violations", "class_breakdown")
+    return {k: summary.get(k) for k in keys} if summary else None
+
+
+def _batch(video, sizes, max_latency_ms):
+    from processor import VideoProcessor
+
+    rows = []
+    reference = None
+    for size in sizes:
+        processor = VideoProcessor(batch_size=size, batch_max_latency_ms=max_latency_ms)
+        frames, elapsed, summary = asyncio.run(_run_job(processor, video))
+        if reference is None:
+            reference = _comparable(summary)
+        rows.append((f"batch={size}", {
+            "frames": frames,
+            "fps": round(frames / elapsed, 1),
+            "vehicles": summary["total"] if summary else None,
+            "violations": summary["violations"] if summary else None,
+            "matches_first": _comparable(summary) == reference,
+        }))
+    _print_table(f"batched inference (max latency {max_latency_ms:.0f}ms)", rows)
+
+
+# -- shard --
+async def _run_sharded(processor, video, workers):
+    summary = None
+    start = time.perf_counter()
+    async for result in processor.process_video_sharded(video, workers=workers):
+        if result.get("type") == "report":
+            summary = result["summary"]
+    return time.perf_counter() - start, summary
+
+
+def _shard(video, worker_counts):
+    from processor import VideoProcessor
+
+    _, baseline_s, baseline = asyncio.run(_run_job(VideoProcessor(), video))
+    rows = [("single process", {"wall_s": round(baseline_s, 1), "speedup": 1.0,
+                                "vehicles": baseline["total"], "violations": baseline["violations"]})]
+    for workers in worker_counts:
+        elapsed, summary = asyncio.run(_run_sharded(VideoProcessor(), video, workers))
+        rows.append((f"sharded x{workers}", {
+            "wall_s": round(elapsed, 1),
+            "speedup": round(baseline_s / elapsed, 2),
+            "vehicles": summary["total"],
+            "violations": summary["violations"],
+            "vehicle_diff": summary["total"] - baseline["total"],
+        }))
+    _print_table("time-segment sharding", rows)
+
+
+# -- cache --
+def _cache(video):
+    import tempfile
+    from detection_cache import DetectionCache
+    from processor import VideoProcessor
+
+    cache = DetectionCache(cache_dir=tempfile.mkdtemp(prefix="bench_cache_"))
+    rows = []
+    for label, direction in (("cold (auto)", None), ("warm (90 deg)", 90.0), ("warm (270 deg)", 270.0)):
+        processor = VideoProcessor(detection_cache=cache)
+        start = time.perf_counter()
+        summary = None
+
+        async def consume():
+            nonlocal summary
+            async for result in processor.process_video(video, manual_direction=direction):
+                if result.get("type") == "report":
+                    summary = result["summary"]
+
+        asyncio.run(consume())
+        rows.append((label, {"wall_s": round(time.perf_counter() - start, 2),
+                             "vehicles": summary["total"], "violations": summary["violations"]}))
+    rows.append(("cache", cache.metrics()))
+    _print_table("detection cache re-analysis", rows)
+
+
+# -- tracks --
+def _tracks(vehicle_counts, frames):
+    from processor import VideoProcessor, SKIP_FRAMES
+
+    rng = np.random.default_rng(0)
+    rows = []
+    for count in vehicle_counts:
+        processor = VideoProcessor()
+        job = {"manual_direction": None, "active_violations": {}, "total_frames": frames,
+               "base_video_name": "bench", "violations_dir": "generated_violations"}
+        # Vehicles drive along straight lines; a tenth of them against the flow
+        start = rng.uniform(0, 640, size=(count, 2))
+        velocity = np.where(np.arange(count)[:, None] % 10 == 0, -1, 1) * rng.uniform(2, 6, size=(count, 2))
+        ids = np.arange(1, count + 1, dtype=np.int32)
+        clss = np.full(count, 2, dtype=np.int32)
+        samples = []
+        for frame_idx in range(frames):
+            boxes = np.column_stack([start + velocity * frame_idx, np.full((count, 2), 40.0)]).astype(np.float32)
+            packet = {"frame_idx": frame_idx * SKIP_FRAMES, "time": frame_idx / 30, "frame_height": 360}
+            t0 = time.perf_counter()
+            processor._analyze_frame(packet, boxes, ids, clss, job)
+            samples.append((time.perf_counter() - t0) * 1000)
+        stats = _percentiles(samples)
+        stats["detections_per_s"] = round(count * frames / (sum(samples) / 1000))
+        rows.append((f"{count} vehicles", stats))
+    _print_table(f"per-frame track analysis ({frames} frames)", rows)
+
+
+# -- soak --
+def _rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+def _soak(frames, live, lifetime, checkpoints):
+    from processor import VideoProcessor, SKIP_FRAMES
+
+    processor = VideoProcessor()
+    job = {"manual_direction": None, "active_violations": {}, "total_frames": frames,
+           "base_video_name": "soak", "violations_dir": "generated_violations"}
+    spawn_every = max(1, lifetime // live)
+    rows = []
+    start = time.perf_counter()
+    for frame_idx in range(frames):
+        # A new vehicle enters every spawn_every frames and leaves after `lifetime` frames;
+        # every tenth one drives against the flow
+        first = max(0, (frame_idx - lifetime) // spawn_every + 1)
+        ids = np.arange(first, frame_idx // spawn_every + 1, dtype=np.int32)
+        age = frame_idx - ids * spawn_every
+        sign = np.where(ids % 10 == 0, -1.0, 1.0)
+        x = np.where(sign > 0, 0, 640) + sign * age * 5.0
+        y = 40.0 + (ids % 8) * 40
+        boxes = np.column_stack([x, y, np.full(len(ids), 40.0), np.full(len(ids), 30.0)]).astype(np.float32)
+        packet = {"frame_idx": frame_idx * SKIP_FRAMES, "time": frame_idx / 30, "frame_height": 360}
+        processor._analyze_frame(packet, boxes, ids + 1, np.full(len(ids), 2, dtype=np.int32), job)
+
+        if (frame_idx + 1) % max(1, frames // checkpoints) == 0:
+            state = sum(len(processor.stats[k]) for k in ("total_vehicles", "forward_vehicles", 
+                                                          "backward_vehicles", "violated_vehicles"))
+            rows.append((f"frame {frame_idx + 1}", {
+                "rss_mb": round(_rss_mb(), 1),
+                "vehicles_seen": int(ids[-1]) + 1,
+                "tracked_state": state + len(processor.vehicle_classes),
+                "slots": processor.tracks.capacity,
+                "fps": round((frame_idx + 1) / (time.perf_counter() - start)),
+            }))
+    summary = processor._generate_final_report(None)["summary"]
+    rows.append(("report", {k: summary[k] for k in ("total", "forward", "backward", "violations")}))
+    _print_table(f"soak ({live} live vehicles, {lifetime}-frame lifetime)", rows)
+
+
+# -- stream --
+async def _stream(source, realtime):
+    from processor import VideoProcessor
+
+    latencies = []
+    dropped = 0
+    start = time.perf_counter()
+    async for result in VideoProcessor().process_stream(source, realtime=realtime):
+        if "objects" in result:
+            latencies.append(result["latency_ms"])
+            dropped = result["dropped_frames"]
+    elapsed = time.perf_counter() - start
+    stats = _percentiles(latencies)
+    stats.update({"dropped": dropped, "analysed_fps": round(len(latencies) / elapsed, 1)})
+    _print_table("live stream capture -> message latency", [(source, stats)])
+
+
+# -- upload --
+async def _upload(size_mb, chunk_mb, interval):
+    import tempfile
+    import httpx
+    from main import app
+
+    path = tempfile.mkstemp(prefix="bench_upload_", suffix=".bin")[1]
+    with open(path, "wb") as f:
+        for _ in range(size_mb):
+            f.write(os.urandom(1024 * 1024))
+    size = size_mb * 1024 * 1024
+
+    async def multipart(client):
+        with open(path, "rb") as f:
+            return await client.post("/upload", files={"file": (f"multipart_{time.time()}.bin", f)})
+
+    async def chunked(client):
+        session = (await client.post("/uploads", params={"filename": f"chunked_{time.time()}.bin",
+                                                         "size": size})).json()
+        chunk = chunk_mb * 1024 * 1024
+        with open(path, "rb") as f:
+            for offset in range(0, size, chunk):
+                await client.put(f"/uploads/{session['upload_id']}", params={"offset": offset},
+                                 content=f.read(chunk))
+        return await client.post(f"/uploads/{session['upload_id']}/complete")
+
+    rows = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for label, upload in (("POST /upload (multipart)", multipart), (f"PUT /uploads ({chunk_mb}MB chunks)", chunked)):
+            samples = []
+            done = asyncio.Event()
+
+            stalls = [0.0]
+
+            async def probe():
+                last = time.perf_counter()
+                while not done.is_set():
+                    start = time.perf_counter()
+                    await client.get("/health")
+                    samples.append((time.perf_counter() - start) * 1000)
+                    await asyncio.sleep(interval)
+                    # A blocked event loop also delays the probe itself
+                    now = time.perf_counter()
+                    stalls.append((now - last - interval) * 1000)
+                    last = now
+
+            probe_task = asyncio.create_task(probe())
+            start = time.perf_counter()
+            response = await upload(client)
+            elapsed = time.perf_counter() - start
+            done.set()
+            await probe_task
+            health = _percentiles(samples)
+            rows.append((label, {"MB_per_s": round(size_mb / elapsed, 1), "status": response.status_code,
+                                 "health_p99_ms": health.get("p99_ms"), "loop_stall_max_ms": round(max(stalls), 1)}))
+    os.remove(path)
+    _print_table(f"upload throughput ({size_mb}MB file)", rows)
+
+
+# -- jobs --
+async def _jobs(video, jobs, slots):
+    from job_scheduler import JobScheduler, JOB_WORKER_SLOTS
+    from processor import VideoProcessor
+
+    async def direct():
+        start = time.perf_counter()
+        frames, _, _ = await _run_job(VideoProcessor(), video)
+        return frames, time.perf_counter() - start
+
+    async def scheduled(scheduler):
+        start = time.perf_counter()
+        job = scheduler.submit(lambda: VideoProcessor().process_video(video), os.path.basename(video))
+        frames = 0
+        async for message in scheduler.subscribe(job):
+            if "objects" in message:
+                frames += 1
+        return frames, time.perf_counter() - start
+
+    scheduler = JobScheduler(slots=slots or JOB_WORKER_SLOTS, max_queued=jobs)
+    scheduler.start()
+    rows = []
+    for name, run in ((f"{jobs} unscheduled", direct), (f"{jobs} on {scheduler.slots} slot(s)", lambda: scheduled(scheduler))):
+        start = time.perf_counter()
+        results = await asyncio.gather(*(run() for _ in range(jobs)))
+        elapsed = time.perf_counter() - start
+        done_ms = [t * 1000 for _, t in results]
+        rows.append((name, {
+            "total_fps": round(sum(f for f, _ in results) / elapsed, 1),
+            "wall_s": round(elapsed, 1),
+            "first_done_s": round(min(done_ms) / 1000, 1),
+            "median_done_s": round(float(np.median(done_ms)) / 1000, 1),
+        }))
+    await scheduler.stop()
+    _print_table(f"throughput under overload ({jobs} jobs)", rows)
+
+
+# -- protocol --
+def _protocol(video):
+    from processor import VideoProcessor
+    from wire_protocol import BinaryDecoder, make_encoder, PROTOCOLS
+
+    async def collect():
+        return [m async for m in VideoProcessor().process_video(video) if "objects" in m]
+
+    frames = asyncio.run(collect())
+    objects = sum(len(f["objects"]) for f in frames)
+    rows = []
+    for protocol in PROTOCOLS:
+        encoder = make_encoder(protocol)
+        start = time.perf_counter()
+        payloads = [encoder.encode(frame) for frame in frames]
+        elapsed = time.perf_counter() - start
+        sizes = [sum(len(p) for p in frame_payloads) for frame_payloads in payloads]
+        preview = [size for size, frame in zip(sizes, frames) if "image" in frame]
+        plain = [size for size, frame in zip(sizes, frames) if "image" not in frame]
+        row = {
+            "bytes_per_frame": round(float(np.mean(sizes)), 1),
+            "no_preview_bytes": round(float(np.mean(plain)), 1) if plain else None,
+            "preview_bytes": round(float(np.mean(preview)), 1) if preview else None,
+            "serialize_us_per_frame": round(elapsed / len(frames) * 1e6, 1),
+        }
+        if protocol == "binary":
+            decoder = BinaryDecoder()
+            decoded = []
+            for frame_payloads in payloads:
+                for payload in frame_payloads:
+                    decoder.decode(payload)
+                decoded.append(decoder.frame)
+            row["round_trip_ok"] = all(
+                sorted(o["id"] for o in d["objects"]) == sorted(o["id"] for o in f["objects"])
+                and d.get("image") == f.get("image")
+                for d, f in zip(decoded, frames))
+        rows.append((protocol, row))
+    _print_table(f"wire protocols ({len(frames)} frames, {objects / max(len(frames), 1):.1f} objects/frame)", rows)
+
+
+# -- motion --
+def _motion(videos, batch_size):
+    from processor import VideoProcessor
+
+    rows = []
+    for video in videos:
+        reference = None
+        for gated in (False, True):
+            processor = VideoProcessor(batch_size=batch_size, motion_gate=gated)
+            frames, elapsed, summary = asyncio.run(_run_job(processor, video))
+            if reference is None:
+                reference = summary
+            gate = processor.motion_gate.metrics() if gated else {}
+            rows.append((f"{os.path.basename(video)} gate={'on' if gated else 'off'}", {
+                "frames": frames,
+                "fps": round(frames / elapsed, 1),
+                "detections_skipped": gate.get("skipped", 0),
+                "vehicles": summary["total"] if summary else None,
+                "violations": summary["violations"] if summary else None,
+                "vehicles_diff": summary["total"] - reference["total"] if summary else None,
+                "violations_diff": summary["violations"] - reference["violations"] if summary else None,
+            }))
+    _print_table(f"motion-gated inference (batch={batch_size})", rows)
+
+
+# -- skip --
+def _skip(videos):
+    from processor import VideoProcessor
+
+    rows = []
+    for video in videos:
+        reference = None
+        for adaptive in (False, True):
+            processor = VideoProcessor(adaptive_skip=adaptive)
+            frames, elapsed, summary = asyncio.run(_run_job(processor, video))
+            if reference is None:
+                reference = summary
+            skip = processor.frame_skip.metrics() if adaptive else {}
+            rows.append((f"{os.path.basename(video)} skip={'adaptive' if adaptive else 'fixed'}", {
+                "frames": frames,
+                "fps": round(frames / elapsed, 1),
+                "wall_s": round(elapsed, 2),
+                "mean_skip": skip.get("mean_skip"),
+                "vehicles": summary["total"] if summary else None,
+                "violations": summary["violations"] if summary else None,
+                "vehicles_diff": summary["total"] - reference["total"] if summary else None,
+                "violations_diff": summary["violations"] - reference["violations"] if summary else None,
+            }))
+    _print_table("fixed vs adaptive frame skip", rows)
+
+
+# -- backend --
+AGREEMENT_IOU = 0.5
+AGREEMENT_CONFIDENCE = 0.25  # Detections ByteTrack can start a track from
+
+
+def _box_iou(a, b):
+    """IoU matrix of (N, 4) and (M, 4) xyxy boxes."""
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(rb - lt, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+def _agreement(reference, other):
+    """(matched detections, detections, summed IoU): greedy same-class matching at AGREEMENT_IOU."""
+    (ref_boxes, ref_cls), (boxes, cls) = reference, other
+    if len(ref_boxes) == 0 or len(boxes) == 0:
+        return 0, max(len(ref_boxes), len(boxes)), 0.0
+    iou = _box_iou(ref_boxes, boxes) * (ref_cls[:, None] == cls[None, :])
+    matched, iou_sum = 0, 0.0
+    while True:
+        i, j = np.unravel_index(np.argmax(iou), iou.shape)
+        if iou[i, j] < AGREEMENT_IOU:
+            break
+        matched += 1
+        iou_sum += float(iou[i, j])
+        iou[i, :] = 0
+        iou[:, j] = 0
+    return matched, max(len(ref_boxes), len(boxes)), iou_sum
+
+
+def _backend(video, backends, int8, calibration, frame_count):
+    import shutil
+    import tempfile
+
+    import cv2
+    from ultralytics import YOLO
+    from detector_backend import resolve_weights
+    from frame_source import FrameSampler, resize_to_width
+    from model_pool import MODEL_WEIGHTS, VEHICLE_CLASS_IDS
+    from processor import DISPLAY_WIDTH, SKIP_FRAMES
+
+    cap = cv2.VideoCapture(video)
+    frames = []
+    for _, _, frame in FrameSampler(cap, SKIP_FRAMES):
+        frames.append(resize_to_width(frame, DISPLAY_WIDTH))
+        if len(frames) >= frame_count:
+            break
+    cap.release()
+
+    variants = [(backend, False) for backend in backends]
+    if int8:
+        variants += [(backend, True) for backend in backends if backend != "torch"]
+    # Cold exports: a scratch export directory, not the server's cache
+    export_dir = tempfile.mkdtemp(prefix="model_exports_")
+    rows = []
+    reference = None
+    baseline_fps = None
+    try:
+        for backend, quantize in variants:
+            start = time.perf_counter()
+            weights, in_use = resolve_weights(MODEL_WEIGHTS, backend, quantize, calibration or video, export_dir)
+            export_s = time.perf_counter() - start
+            start = time.perf_counter()
+            model = YOLO(weights, task="detect")
+            model.predict(frames[0], classes=VEHICLE_CLASS_IDS, verbose=False)
+            load_s = time.perf_counter() - start
+
+            detections = []
+            start = time.perf_counter()
+            for frame in frames:
+                boxes = model.predict(frame, conf=AGREEMENT_CONFIDENCE, classes=VEHICLE_CLASS_IDS,
+                                      verbose=False)[0].boxes
+                detections.append((boxes.xyxy.cpu().numpy(), boxes.cls.cpu().numpy()))
+            fps = len(frames) / (time.perf_counter() - start)
+
+            if reference is None:
+                reference, baseline_fps = detections, fps
+            scores = np.array([_agreement(ref, det) for ref, det in zip(reference, detections)])
+            matched, total, iou_sum = scores.sum(axis=0) if len(scores) else (0, 0, 0.0)
+            rows.append((f"{backend}{'-int8' if quantize else ''}", {
+                "in_use": in_use,
+                "export_s": round(export_s, 2),
+                "startup_s": round(load_s, 2),
+                "fps": round(fps, 1),
+                "speedup": round(fps / baseline_fps, 2),
+                "detections": int(sum(len(boxes) for boxes, _ in detections)),
+                "agreement": round(matched / total, 3) if total else 1.0,
+                "mean_iou": round(iou_sum / matched, 3) if matched else None,
+            }))
+    finally:
+        shutil.rmtree(export_dir, ignore_errors=True)
+    _print_table(f"detector backends vs {variants[0][0]} ({len(frames)} frames, {MODEL_WEIGHTS})", rows)
+
+
+# -- encode --
+def _mp4_boxes(path):
+    """Top-level MP4 box types, in file order ('moov' before 'mdat' = faststart)."""
+    boxes = []
+    with open(path, "rb") as f:
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                return boxes
+            size = int.from_bytes(header[:4], "big")
+            boxes.append(header[4:].decode("latin-1"))
+            if size == 1:
+                size = int.from_bytes(f.read(8), "big") - 8
+            elif size < 8:
+                return boxes
+            f.seek(size - 8, os.SEEK_CUR)
+
+
+def _encode(video, frame_count, presets, threads):
+    import shutil
+    import tempfile
+
+    import cv2
+    import video_encoder
+    from frame_source import FrameSampler, resize_to_width
+    from processor import DISPLAY_WIDTH, SKIP_FRAMES
+
+    cap = cv2.VideoCapture(video)
+    fps = (cap.get(cv2.CAP_PROP_FPS) or 30.0) / SKIP_FRAMES
+    frames = []
+    for _, _, frame in FrameSampler(cap, SKIP_FRAMES):
+        frames.append(resize_to_width(frame, DISPLAY_WIDTH))
+        if len(frames) >= frame_count:
+            break
+    cap.release()
+    size = (frames[0].shape[1], frames[0].shape[0])
+    duration = len(frames) / fps
+
+    out_dir = tempfile.mkdtemp(prefix="encode_")
+    writers = [("opencv", lambda path: video_encoder.open_opencv_writer(path, fps, size))]
+    if video_encoder.FFMPEG_BINARY:
+        writers += [(f"ffmpeg {preset}", lambda path, preset=preset: video_encoder.FfmpegWriter(
+            path, fps, size, preset=preset, threads=threads)) for preset in presets]
+        writers.append((f"ffmpeg {presets[0]} +hls", lambda path: video_encoder.FfmpegWriter(
+            path, fps, size, playlist=os.path.join(out_dir, "hls", video_encoder.HLS_PLAYLIST),
+            preset=presets[0], threads=threads)))
+    else:
+        print("ffmpeg not found (set FFMPEG_BINARY): only the OpenCV writer is measured")
+    rows = []
+    try:
+        for name, open_writer in writers:
+            path = os.path.join(out_dir, name.replace(" ", "_").replace("+", "") + ".mp4")
+            start = time.perf_counter()
+            writer = open_writer(path)
+            for frame in frames:
+                writer.write(frame)
+            writer.release()
+            elapsed = time.perf_counter() - start
+            boxes = _mp4_boxes(path) if os.path.exists(path) else []
+            check = cv2.VideoCapture(path)
+            codec = int(check.get(cv2.CAP_PROP_FOURCC)).to_bytes(4, "little").decode("latin-1").strip("\x00")
+            check.release()
+            rows.append((name, {
+                "encode_fps": round(len(frames) / elapsed, 1),
+                "size_kb": round(os.path.getsize(path) / 1024, 1) if os.path.exists(path) else None,
+                "kbps": round(os.path.getsize(path) * 8 / 1000 / duration, 1) if os.path.exists(path) else None,
+                "codec": codec,
+                "faststart": "moov" in boxes and "mdat" in boxes and boxes.index("moov") < boxes.index("mdat"),
+            }))
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+    _print_table(f"video encoding ({len(frames)} frames {size[0]}x{size[1]} @ {fps:.1f} fps, threads={threads})",
+                 rows)
+
+
+# -- storage --
+def _storage(video, frame_count, process_fps, bandwidth_mbps, concurrency):
+    import shutil
+    import tempfile
+
+    import cv2
+    import video_encoder
+    from frame_source import FrameSampler, resize_to_width
+    from processor import DISPLAY_WIDTH, SKIP_FRAMES
+    from storage import LocalStorage, StorageManager
+
+    if not video_encoder.FFMPEG_BINARY:
+        print("ffmpeg not found (set FFMPEG_BINARY): segmented upload needs it")
+        return
+    cap = cv2.VideoCapture(video)
+    fps = (cap.get(cv2.CAP_PROP_FPS) or 30.0) / SKIP_FRAMES
+    frames = []
+    for _, _, frame in FrameSampler(cap, SKIP_FRAMES):
+        frames.append(resize_to_width(frame, DISPLAY_WIDTH))
+        if len(frames) >= frame_count:
+            break
+    cap.release()
+    size = (frames[0].shape[1], frames[0].shape[0])
+
+    work_dir = tempfile.mkdtemp(prefix="upload_")
+    rows = []
+    try:
+        for mode in ("after processing", "segmented"):
+            out_dir = os.path.join(work_dir, mode.replace(" ", "_"))
+            storage = StorageManager(LocalStorage(os.path.join(out_dir, "remote"), bandwidth_mbps=bandwidth_mbps),
+                                     concurrency=concurrency, retry_dir=os.path.join(out_dir, "retry"))
+            path = os.path.join(out_dir, "processed.mp4")
+            playlist = os.path.join(out_dir, "processed", video_encoder.HLS_PLAYLIST)
+            segmented = mode == "segmented"
+            writer = video_encoder.FfmpegWriter(path, fps, size, playlist=playlist if segmented else None)
+            uploader = storage.segments(playlist, "processed") if segmented else None
+            start = time.perf_counter()
+            for i, frame in enumerate(frames):
+                # Paced like a job analysing process_fps frames per second
+                time.sleep(max(0.0, start + i / process_fps - time.perf_counter()))
+                writer.write(frame)
+            final_frame = time.perf_counter()
+            writer.release()
+            video_upload = storage.submit(path, "processed.mp4")
+            playlist_s = None
+            if uploader:
+                uploader.finish()
+                playlist_s = time.perf_counter() - final_frame
+            video_upload.result()
+            video_s = time.perf_counter() - final_frame
+            storage.stop()
+            uploaded = storage.metrics()
+            rows.append((mode, {
+                "processing_s": round(final_frame - start, 2),
+                "playlist_url_after_s": round(playlist_s, 2) if playlist_s is not None else None,
+                "video_url_after_s": round(video_s, 2),
+                "uploads": uploaded["uploads"],
+                "uploaded_mb": uploaded["uploaded_mb"],
+            }))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    _print_table(f"upload after final frame ({len(frames)} frames at {process_fps} fps, "
+                 f"{bandwidth_mbps} Mbit/s, {concurrency} concurrent)", rows)
+
+
+# -- kalman --
+def _kalman(vehicles, frames, skip, noise_px, turn_deg):
+    from model_pool import ModelWorker
+    from motion_model import KalmanTracks
+    from processor import TRACK_HISTORY_LEN, MIN_SPEED_THRESHOLD, WRONG_WAY_ANGLE_DIFF, DISPLAY_WIDTH
+    from track_store import TrackStore, SPEED_SCALE
+
+    # Vehicles appear at random times and drive at 1-6 px per source frame, turning at up to
+    # turn_deg degrees per frame; centers are measured with Gaussian noise on every `skip`-th frame
+    rng = np.random.default_rng(0)
+    birth = rng.integers(0, frames * skip * 3 // 4, size=vehicles)
+    death = birth + rng.integers(30, 100, size=vehicles) * skip
+    start = rng.uniform(100, 540, size=(vehicles, 2))
+    heading = rng.uniform(0, 2 * np.pi, size=vehicles)
+    speed = rng.uniform(1, 6, size=vehicles)
+    turn = np.radians(rng.uniform(-turn_deg, turn_deg, size=vehicles))
+    turn = np.where(np.abs(turn) < 1e-9, 1e-9, turn)
+
+    def truth(ids, frame_idx):
+        """(positions, speeds, headings) of vehicles `ids` at frame_idx (constant speed and turn rate)."""
+        h = heading[ids] + turn[ids] * (frame_idx - birth[ids])
+        radius = (speed[ids] / turn[ids])[:, None]
+        positions = start[ids] + radius * np.column_stack([np.sin(h) - np.sin(heading[ids]),
+                                                           np.cos(heading[ids]) - np.cos(h)])
+        return positions, speed[ids] * skip * SPEED_SCALE, np.degrees(h) % 360
+
+    rows = []
+    for kalman in (False, True):
+        store = TrackStore(TRACK_HISTORY_LEN, frame_step=skip, kalman=kalman)
+        # The filter alone (TrackStore runs it in both modes, for predictions)
+        motion = KalmanTracks(vehicles)
+        speed_err, heading_err, hold_err, predict_err, update_s, filter_s, predict_s = [], [], [], [], [], [], []
+        for frame_idx in range(skip, frames * skip + 1, skip):
+            ids = np.flatnonzero((birth <= frame_idx) & (frame_idx < death))
+            if len(ids) == 0:
+                continue
+            positions, true_speed, true_heading = truth(ids, frame_idx)
+            measured = positions + rng.normal(0, noise_px, size=(len(ids), 2))
+            t0 = time.perf_counter()
+            store.advance()
+            _, lengths, speeds, directions = store.update(ids.tolist(), measured, MIN_SPEED_THRESHOLD, frame_idx)
+            update_s.append(time.perf_counter() - t0)
+            t0 = time.perf_counter()
+            motion.update(ids, measured, frame_idx)
+            filter_s.append(time.perf_counter() - t0)
+            measurable = lengths > 2
+            speed_err.extend((np.abs(speeds - true_speed) / true_speed)[measurable].tolist())
+            diff = np.abs(directions - true_heading)
+            heading_err.extend(np.where(diff > 180, 360 - diff, diff)[measurable].tolist())
+            # Frames until the next analysed one: Kalman prediction vs holding the last box
+            for ahead in range(1, skip):
+                t0 = time.perf_counter()
+                predicted = store.predict(ids.tolist(), frame_idx + ahead)
+                predict_s.append(time.perf_counter() - t0)
+                actual = truth(ids, frame_idx + ahead)[0]
+                predict_err.extend(np.hypot(*(predicted - actual).T).tolist())
+                hold_err.extend(np.hypot(*(measured - actual).T).tolist())
+        heading_err = np.asarray(heading_err)
+        row = {
+            "speed_err_pct": round(100 * float(np.mean(speed_err)), 1),
+            "heading_err_deg": round(float(np.mean(heading_err)), 1),
+            "heading_p99_deg": round(float(np.percentile(heading_err, 99)), 1),
+            "false_wrong_way_pct": round(100 * float(np.mean(heading_err > WRONG_WAY_ANGLE_DIFF)), 2),
+            "update_us": round(1e6 * float(np.mean(update_s)), 1),
+        }
+        if kalman:
+            row.update({"filter_us": round(1e6 * float(np.mean(filter_s)), 1),"between_frames_px": round(float(np.mean(predict_err)), 2),
+                        "hold_last_px": round(float(np.mean(hold_err)), 2),
+                        "predict_us": round(1e6 * float(np.mean(predict_s)), 1)})
+        rows.append(("kalman" if kalman else "history", row))
+
+    worker = ModelWorker(0)
+    frame = np.zeros((DISPLAY_WIDTH * 9 // 16, DISPLAY_WIDTH, 3), dtype=np.uint8)
+    worker.warm_up(frame.shape)
+    samples = []
+    for _ in range(10):
+        t0 = time.perf_counter()
+        worker.model.predict(frame, verbose=False)
+        samples.append(time.perf_counter() - t0)
+    rows.append(("one inference", {"inference_us": round(1e6 * float(np.median(samples)), 1)}))
+    _print_table(f"kinematics ({vehicles} vehicles, {frames} analysed frames, skip {skip}, "
+                 f"center noise {noise_px}px, turns up to {turn_deg} deg/frame)", rows)
+
+
+# -- startup --
+# Run in a fresh interpreter per mode: times are from interpreter start of `import main`
+STARTUP_PROBE = """
+import asyncio, json, sys, time
+from contextlib import aclosing
+start = time.perf_counter()
+import main
+imported = time.perf_counter() - start
+heavy = [name for name in ("torch", "ultralytics", "cloudinary") if name in sys.modules]
+
+async def run():
+    from processor import VideoProcessor
+    async with main.app.router.lifespan_context(main.app):
+        ready = time.perf_counter() - start
+        health = await main.health_check()
+        first_frame = None
+        async with aclosing(VideoProcessor().process_video(sys.argv[1])) as messages:
+            async for message in messages:
+                if "objects" in message:
+                    first_frame = time.perf_counter() - start
+                    break
+    return ready, health["model_ready"], first_frame
+
+ready, model_ready, first_frame = asyncio.run(run())
+print(json.dumps({"import_s": round(imported, 2), "heavy_imports": ",".join(heavy) or "-",
+                  "serving_s": round(ready, 2), "model_ready_when_serving": model_ready,
+                  "first_frame_s": round(first_frame, 2) if first_frame else None}))
+"""
+
+
+def _startup(video, modes):
+    import json
+    import subprocess
+    import sys
+
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    rows = []
+    for mode in modes:
+        env = dict(os.environ, MODEL_LOAD=mode, DETECTION_CACHE_ENABLED="0",
+                   PYTHONPATH=os.pathsep.join(filter(None, (backend_dir, os.environ.get("PYTHONPATH")))))
+        done = subprocess.run([sys.executable, "-c", STARTUP_PROBE, video], env=env, capture_output=True, text=True)
+        if done.returncode != 0:
+            print(done.stderr[-2000:])
+            raise SystemExit(f"startup probe failed for MODEL_LOAD={mode}")
+        rows.append((f"MODEL_LOAD={mode}", json.loads(done.stdout.strip().splitlines()[-1])))
+    _print_table(f"server startup (STORAGE_BACKEND={os.getenv('STORAGE_BACKEND', 'auto')})", rows)
+
+
+# -- analytics --
+def _fill_analytics(store, videos, tracks, violations, minutes, rng):
+    """Records synthetic analyses through the store's recorders; returns the rows written."""
+    types = ["Car", "Car", "Car", "Truck", "Bus", "Motorcycle"]
+    vehicle_types = [types[t % len(types)] for t in range(tracks)]
+    rows = 0
+    for v in range(videos):
+        recorder = store.record(f"video_{v}.mp4")
+        firsts = rng.uniform(0, minutes * 60.0 - 10, tracks).tolist()
+        lengths = rng.uniform(2, 10, tracks).tolist()
+        speeds = rng.uniform(20, 160, tracks).tolist()
+        for t, (vehicle_type, first, length, speed) in enumerate(zip(vehicle_types, firsts, lengths, speeds)):
+            violated = t < violations
+            recorder.vehicle(first, vehicle_type)
+            recorder.track(t, vehicle_type, "backward" if violated else "forward", violated, speed,
+                           first, first + length)
+            if violated:
+                recorder.violation({"id": t, "type": vehicle_type, "start_time": first + 1, "end_time": first + 3,
+                                    "start_frame": int(first * 30) + 30, "end_frame": int(first * 30) + 90,
+                                    "clip": None})
+        rows += tracks + violations + len(recorder.flow) + 1
+        recorder.finish({"total": tracks, "forward": tracks - violations, "backward": violations,
+                         "stationary": 0, "violations": violations, "average_speed": 90.0,
+                         "full_video": f"processed_video_{v}.mp4"})
+    return rows
+
+
+def _analytics(videos, tracks, violations, minutes, repeats):
+    import sqlite3
+    import tempfile
+    from analytics_store import AnalyticsStore
+
+    rng = np.random.default_rng(0)
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        # Ingest: batched recorder / writer vs one INSERT and commit per row, the same schema
+        path = os.path.join(tmp, "analytics.db")
+        store = AnalyticsStore(path)
+        start = time.perf_counter()
+        written = _fill_analytics(store, videos, tracks, violations, minutes, rng)
+        store.flush()
+        elapsed = time.perf_counter() - start
+        rows.append(("ingest batched", {"rows": written, "rows_per_s": round(written / elapsed),
+                                        "batches": store.batches, "db_mb": store.metrics()["size_mb"]}))
+
+        naive = sqlite3.connect(os.path.join(tmp, "naive.db"))
+        naive.execute("PRAGMA journal_mode=WAL")
+        naive.execute("PRAGMA synchronous=NORMAL")
+        naive.executescript("CREATE TABLE tracks (video_id, track_id, type, direction, violated, max_speed, "
+                            "first_time, last_time, PRIMARY KEY (video_id, track_id)) WITHOUT ROWID;"
+                            "CREATE INDEX tracks_type ON tracks (type, violated, video_id);")
+        sample = min(written, 5000)
+        start = time.perf_counter()
+        for i in range(sample):
+            naive.execute("INSERT INTO tracks VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                          (i // tracks, i % tracks, "Car", "forward", 0, 50.0, 1.0, 2.0))
+            naive.commit()
+        elapsed = time.perf_counter() - start
+        naive.close()
+        rows.append(("ingest per-row commit", {"rows": sample, "rows_per_s": round(sample / elapsed)}))
+
+        newest = store.videos(limit=1)[0]["started_at"]
+        oldest = newest - (time.time() - newest + 1)
+        queries = {
+            "violations of a video": lambda: store.violations(video=f"video_{rng.integers(videos)}.mp4"),
+            "violations by type": lambda: store.violations(vehicle_type="Bus", limit=100),
+            "violations, video time": lambda: store.violations(start=60, end=120, limit=100),
+            "violators by type": lambda: store.tracks(vehicle_type="Truck", violated=True, limit=100),
+            "tracks of a video, time": lambda: store.tracks(video=f"video_{rng.integers(videos)}.mp4",
+                                                            start=30, end=90),
+            "fast tracks, recent runs": lambda: store.tracks(min_speed=150, since=oldest, limit=100),
+            "flow, all videos": lambda: store.flow(),
+            "flow by type, minutes": lambda: store.flow(vehicle_type="Car", start_minute=2, end_minute=4),
+        }
+
+        def measure(label):
+            for name, query in queries.items():
+                samples = []
+                for _ in range(repeats):
+                    t0 = time.perf_counter()
+                    result = query()
+                    samples.append((time.perf_counter() - t0) * 1000)
+                stats = _percentiles(samples)
+                rows.append((f"{label}: {name}", {"rows": len(result), "p50_ms": stats["p50_ms"],
+                                                 "p99_ms": stats["p99_ms"]}))
+
+        measure("indexed")
+        # The same queries once the secondary indexes are dropped
+        conn = sqlite3.connect(path)
+        for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL").fetchall():
+            conn.execute(f"DROP INDEX {name}")
+        conn.commit()
+        conn.close()
+        repeats = max(1, repeats // 10)
+        measure("no indexes")
+        store.stop()
+    _print_table(f"analytics store ({videos} videos x {tracks} tracks, {violations} violations, "
+                 f"{minutes} min each)", rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TrafficGuard backend benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("health-latency", help="p50/p99 of /health while videos are processed")
+    p.add_argument("--video", required=True)
+    p.add_argument("--jobs", type=int, default=2)
+    p.add_argument("--interval", type=float, default=0.02, help="Seconds between probes")
+
+    p = sub.add_parser("decode", help="Decoded frames per second for each frame sampler mode")
+    p.add_argument("--video", required=True)
+    p.add_argument("--skip", type=int, default=3)
+    p.add_argument("--modes", nargs="+", default=["read", "grab", "seek"])
+
+    p = sub.add_parser("batch", help="Frames per second for different inference batch sizes")
+    p.add_argument("--video", required=True)
+    p.add_argument("--sizes", type=int, nargs="+", default=[1, 2, 4, 8])
+    p.add_argument("--max-latency-ms", type=float, default=100.0)
+
+    p = sub.add_parser("shard", help="Wall-clock scaling of process-pool sharding vs a single process")
+    p.add_argument("--video", required=True)
+    p.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+
+    p = sub.add_parser("cache", help="Cold run vs cached re-analysis with other directions")
+    p.add_argument("--video", required=True)
+
+    p = sub.add_parser("tracks", help="Per-frame kinematics / wrong-way cost for crowded scenes")
+    p.add_argument("--vehicles", type=int, nargs="+", default=[50, 150, 300])
+    p.add_argument("--frames", type=int, default=300)
+
+    p = sub.add_parser("soak", help="RSS and per-track state over a long synthetic stream")
+    p.add_argument("--frames", type=int, default=60000)
+    p.add_argument("--live", type=int, default=60, help="Vehicles in the scene at any time")
+    p.add_argument("--lifetime", type=int, default=120, help="Frames each vehicle stays in the scene")
+    p.add_argument("--checkpoints", type=int, default=10)
+
+    p = sub.add_parser("stream", help="Capture-to-message latency and dropped frames in live mode")
+    p.add_argument("--source", required=True, help="Stream URL, or a video file played back in real time")
+
+    p = sub.add_parser("upload", help="Upload throughput and /health latency: multipart vs chunked API")
+    p.add_argument("--size-mb", type=int, default=256)
+    p.add_argument("--chunk-mb", type=int, default=8)
+    p.add_argument("--interval", type=float, default=0.01, help="Seconds between /health probes")
+
+    p = sub.add_parser("jobs", help="Aggregate fps and completion times: unscheduled vs job scheduler")
+    p.add_argument("--video", required=True)
+    p.add_argument("--jobs", type=int, default=8)
+    p.add_argument("--slots", type=int, default=None, help="Defaults to JOB_WORKER_SLOTS")
+
+    p = sub.add_parser("protocol", help="Bytes per frame and serialize time: JSON vs binary WebSocket protocol")
+    p.add_argument("--video", required=True)
+
+    p = sub.add_parser("motion", help="Effective fps and count differences with the motion gate off vs on")
+    p.add_argument("--video", nargs="+", required=True)
+    p.add_argument("--batch-size", type=int, default=1)
+
+    p = sub.add_parser("skip", help="Wall time and count differences with a fixed vs adaptive frame skip")
+    p.add_argument("--video", nargs="+", required=True)
+
+    p = sub.add_parser("backend", help="Export / startup time, fps and detection agreement per detector backend")
+    p.add_argument("--video", required=True)
+    p.add_argument("--backends", nargs="+", default=["torch", "onnx", "openvino"])
+    p.add_argument("--int8", action="store_true", help="Also INT8-quantized exports")
+    p.add_argument("--calibration", default=None, help="INT8 calibration video (defaults to --video)")
+    p.add_argument("--frames", type=int, default=200)
+
+    p = sub.add_parser("encode", help="Encode fps and output size: OpenCV VideoWriter vs ffmpeg pipe presets")
+    p.add_argument("--video", required=True)
+    p.add_argument("--frames", type=int, default=600)
+    p.add_argument("--presets", nargs="+", default=["ultrafast", "veryfast", "medium"])
+    p.add_argument("--threads", type=int, default=None, help="Defaults to FFMPEG_THREADS")
+
+    p = sub.add_parser("storage", help="Final frame -> URL latency: upload after processing vs segmented upload")
+    p.add_argument("--video", required=True)
+    p.add_argument("--frames", type=int, default=600)
+    p.add_argument("--process-fps", type=float, default=30.0, help="Simulated analysis speed")
+    p.add_argument("--bandwidth-mbps", type=float, default=10.0, help="Simulated uplink of the local backend")
+    p.add_argument("--concurrency", type=int, default=4)
+
+    p = sub.add_parser("startup", help="Import time, time to serving and to the first frame per MODEL_LOAD mode")
+    p.add_argument("--video", required=True)
+    p.add_argument("--modes", nargs="+", default=["eager", "background", "lazy"])
+
+    p = sub.add_parser("kalman", help="Speed / heading error and cost: history vs Kalman, plus predicted positions")
+    p.add_argument("--vehicles", type=int, default=50)
+    p.add_argument("--frames", type=int, default=600, help="Analysed frames")
+    p.add_argument("--skip", type=int, default=3)
+    p.add_argument("--noise-px", type=float, default=2.0, help="Std of the measured box centers")
+    p.add_argument("--turn-deg", type=float, default=0.5, help="Largest turn rate, degrees per source frame")
+
+    p = sub.add_parser("analytics", help="Analytics store ingest rate (batched vs per-row) and query latency")
+    p.add_argument("--videos", type=int, default=2000)
+    p.add_argument("--tracks", type=int, default=200, help="Counted tracks per video")
+    p.add_argument("--violations", type=int, default=5, help="Violations per video")
+    p.add_argument("--minutes", type=int, default=10, help="Length of each video")
+    p.add_argument("--repeats", type=int, default=50, help="Runs of each query")
+
+    args = parser.parse_args()
+    if args.command == "health-latency":
+        asyncio.run(_health_latency(args.video, args.jobs, args.interval))
+    elif args.command == "decode":
+        _decode(args.video, args.skip, args.modes)
+    elif args.command == "batch":
+        _batch(args.video, args.sizes, args.max_latency_ms)
+    elif args.command == "shard":
+        _shard(args.video, args.workers)
+    elif args.command == "cache":
+        _cache(args.video)
+    elif args.command == "tracks":
+        _tracks(args.vehicles, args.frames)
+    elif args.command == "soak":
+        _soak(args.frames, args.live, args.lifetime, args.checkpoints)
+    elif args.command == "stream":
+        asyncio.run(_stream(args.source, realtime="://" not in args.source))
+    elif args.command == "upload":
+        asyncio.run(_upload(args.size_mb, args.chunk_mb, args.interval))
+    elif args.command == "jobs":
+        asyncio.run(_jobs(args.video, args.jobs, args.slots))
+    elif args.command == "protocol":
+        _protocol(args.video)
+    elif args.command == "motion":
+        _motion(args.video, args.batch_size)
+    elif args.command == "skip":
+        _skip(args.video)
+    elif args.command == "backend":
+        _backend(args.video, args.backends, args.int8, args.calibration, args.frames)
+    elif args.command == "encode":
+        from video_encoder import FFMPEG_THREADS
+        _encode(args.video, args.frames, args.presets, FFMPEG_THREADS if args.threads is None else args.threads)
+    elif args.command == "storage":
+        _storage(args.video, args.frames, args.process_fps, args.bandwidth_mbps, args.concurrency)
+    elif args.command == "startup":
+        _startup(args.video, args.modes)
+    elif args.command == "kalman":
+        _kalman(args.vehicles, args.frames, args.skip, args.noise_px, args.turn_deg)
+    elif args.command == "analytics":
+        _analytics(args.videos, args.tracks, args.violations, args.minutes, args.repeats)
+
+
+if __name__ == "__main__":
+    main()
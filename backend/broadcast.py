@@ -0,0 +1,101 @@
+import asyncio
+import logging
+from collections import deque
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SUBSCRIBER_BUFFER_SIZE = 8  # Frame updates held per subscriber; older ones are coalesced away
+FINAL_MESSAGE_TYPES = ("report", "error", "cancelled")
+
+
+def is_final(message) -> bool:
+    return message.get("type") in FINAL_MESSAGE_TYPES
+
+
+def is_frame(message) -> bool:
+    """Frame updates supersede each other, so a slow client only needs the newest."""
+    return "objects" in message
+
+
+class Subscription:
+    """
+    One client's buffer. Frame updates beyond `maxsize` evict the oldest buffered frame;
+    every other message (status, report, error) is always kept, in order.
+    """
+    def __init__(self, maxsize: int = SUBSCRIBER_BUFFER_SIZE):
+        self.maxsize = maxsize
+        self.dropped = 0
+        self._buffer = deque()
+        self._frames = 0
+        self._ready = asyncio.Event()
+
+    def push(self, message):
+        if is_frame(message):
+            if self._frames >= self.maxsize:
+                self._evict_oldest_frame()
+            self._frames += 1
+        self._buffer.append(message)
+        self._ready.set()
+
+    def _evict_oldest_frame(self):
+        for i, buffered in enumerate(self._buffer):
+            if is_frame(buffered):
+                del self._buffer[i]
+                self._frames -= 1
+                self.dropped += 1
+                return
+
+    async def get(self):
+        while not self._buffer:
+            self._ready.clear()
+            await self._ready.wait()
+        message = self._buffer.popleft()
+        if is_frame(message):
+            self._frames -= 1
+        return message
+
+
+class BroadcastHub:
+    """
+    Fans one producer's messages out to any number of subscribers without ever waiting
+    on them: publish() only appends to per-subscriber buffers, so a slow WebSocket
+    costs that client intermediate frames, not processing speed for everyone.
+    The latest frame and the final message are kept for subscribers that join late.
+    """
+    def __init__(self, buffer_size: int = SUBSCRIBER_BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self.subscribers = set()
+        self.latest = None  # Most recent frame update
+        self.final = None  # Report / error / cancellation, once published
+
+    def publish(self, message):
+        if is_frame(message):
+            self.latest = message
+        elif is_final(message):
+            self.final = message
+        for subscription in self.subscribers:
+            subscription.push(message)
+
+    def subscribe(self) -> Subscription:
+        subscription = Subscription(self.buffer_size)
+        if self.final is not None:
+            subscription.push(self.final)
+        elif self.latest is not None:
+            subscription.push(self.latest)
+        self.subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self.subscribers.discard(subscription)
+        if subscription.dropped:
+            logger.info(f"Subscriber left after {subscription.dropped} coalesced frame update(s)")
+
+    async def listen(self, subscription: Subscription):
+        """Async generator of a subscription's messages, ending after the final one."""
+        while True:
+            message = await subscription.get()
+            yield message
+            if is_final(message):
+                return
@@ -5,6 +5,7 @@ from dotenv import load_dotenv
 import os
 import logging
 from typing import Optional, Dict
+import threading
 import time
 
 # Configure logging
@@ -35,7 +36,8 @@ class CloudStorage:
         logger.info(f"CloudStorage initialized with cloud: {self.cloud_name}")
     
     def upload_video(self, file_path: str, public_id: Optional[str] = None, 
-                    folder: str = "traffisense", max_retries: int = 3) -> Optional[Dict]:
+                    folder: str = "traffisense", max_retries: int = 3,
+                    chunk_size: Optional[int] = None) -> Optional[Dict]:
         """
         Upload video to Cloudinary with retry logic.
         
@@ -44,6 +46,7 @@ class CloudStorage:
             public_id: Optional custom ID for the video
             folder: Cloudinary folder name
             max_retries: Number of retry attempts
+            chunk_size: Upload in chunks of this many bytes (upload_large)
             
         Returns:
             Dict with upload result or None if failed
@@ -64,7 +67,9 @@ class CloudStorage:
             try:
                 logger.info(f"Uploading {file_path} to Cloudinary (attempt {attempt + 1}/{max_retries})...")
                 
-                result = cloudinary.uploader.upload(
+                upload = cloudinary.uploader.upload_large if chunk_size else cloudinary.uploader.upload
+                options = {"chunk_size": chunk_size} if chunk_size else {}
+                result = upload(
                     file_path,
                     resource_type="video",
                     public_id=full_public_id,
@@ -72,7 +77,8 @@ class CloudStorage:
                     format="mp4",
                     transformation=[
                         {"quality": "auto", "fetch_format": "mp4"}
-                    ]
+                    ],
+                    **options
                 )
                 
                 logger.info(f"Upload successful! URL: {result.get('secure_url')}")
@@ -90,6 +96,29 @@ class CloudStorage:
         
         return None
     
+    def upload_raw(self, file_path: str, public_id: str, folder: str = "traffisense") -> Optional[Dict]:
+        """
+        Upload a file as-is (e.g. HLS playlist or segment), without transformation.
+        
+        Args:
+            file_path: Local path to the file
+            public_id: ID including the file extension
+            folder: Cloudinary folder name
+            
+        Returns:
+            Dict with upload result or None if failed
+        """
+        try:
+            return cloudinary.uploader.upload(
+                file_path,
+                resource_type="raw",
+                public_id=f"{folder}/{public_id}",
+                overwrite=True
+            )
+        except Exception as e:
+            logger.error(f"Raw upload of {file_path} failed: {str(e)}")
+            return None
+    
     def get_video_url(self, public_id: str, folder: str = "traffisense", 
                      signed: bool = True, expiration: int = 3600) -> Optional[str]:
         """
@@ -172,14 +201,24 @@ class CloudStorage:
             return None
 
 
-# Singleton instance
-cloud_storage = CloudStorage()
+# Process-wide singleton, built on first use (raises ValueError without credentials)
+_cloud_storage = None
+_cloud_storage_lock = threading.Lock()
+
+
+def get_cloud_storage() -> CloudStorage:
+    global _cloud_storage
+    if _cloud_storage is None:
+        with _cloud_storage_lock:
+            if _cloud_storage is None:
+                _cloud_storage = CloudStorage()
+    return _cloud_storage
 
 
 if __name__ == "__main__":
     # Test the cloud storage
     print("Testing Cloudinary connection...")
-    stats = cloud_storage.get_upload_stats()
+    stats = get_cloud_storage().get_upload_stats()
     if stats:
         print(f"✅ Connected to Cloudinary!")
         print(f"Storage used: {stats['storage_used_mb']:.2f} MB")
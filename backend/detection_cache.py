@@ -0,0 +1,193 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Cache configuration (override via environment)
+DETECTION_CACHE_DIR = os.getenv("DETECTION_CACHE_DIR", "detection_cache")
+DETECTION_CACHE_MAX_MB = int(os.getenv("DETECTION_CACHE_MAX_MB", "2048"))
+DETECTION_CACHE_ENABLED = os.getenv("DETECTION_CACHE_ENABLED", "1") != "0"
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_content_hash(path: str) -> str:
+    """SHA-256 of a file's bytes, read in 1MB chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DetectionCache:
+    """
+    Content-addressed on-disk store of per-frame tracking output.
+    Entries are compressed .npz files of flat arrays (boxes, ids, classes plus
+    per-frame offsets), keyed by video content hash + model + sampling settings,
+    and evicted least-recently-used once the directory exceeds max_bytes. An entry
+    can carry a small JSON render record describing the annotated video of the run
+    that produced it (see put_render).
+    """
+    def __init__(self, cache_dir: str = DETECTION_CACHE_DIR, max_mb: int = DETECTION_CACHE_MAX_MB):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_mb * 1024 * 1024
+        os.makedirs(cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(content_hash: str, **settings) -> str:
+        """Cache key for a video; any setting that changes tracking output must be passed in."""
+        material = json.dumps({"content": content_hash, **settings}, sort_keys=True)
+        return hashlib.sha256(material.encode()).hexdigest()[:32]
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def _render_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.render.json")
+
+    def put_render(self, key: str, info: dict):
+        """Records the annotated video rendered with an entry (file, direction setting, URLs)."""
+        tmp_path = self._render_path(key) + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(info, f)
+        os.replace(tmp_path, self._render_path(key))
+
+    def get_render(self, key: str):
+        """The entry's render record, or None if its run rendered no video."""
+        try:
+            with open(self._render_path(key)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def get(self, key: str):
+        """
+        Returns:
+            Dict with frame_height, total_frames and records
+            [(frame_idx, time_s, boxes_xywh, track_ids, class_ids, tracked)], or None on a miss;
+            tracked is False for frames whose tracks were carried over (motion gate)
+        """
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                offsets = np.concatenate([[0], np.cumsum(data["counts"])])
+                boxes, ids, clss = data["boxes"], data["ids"], data["classes"]
+                records = [
+                    (int(frame_idx), float(ts), boxes[a:b], ids[a:b], clss[a:b], bool(tracked))
+                    for frame_idx, ts, tracked, a, b in zip(data["frame_idx"], data["times"], data["tracked"],
+                                                            offsets[:-1], offsets[1:])
+                ]
+                entry = {
+                    "frame_height": int(data["frame_height"]),
+                    "total_frames": int(data["total_frames"]),
+                    "records": records,
+                }
+            os.utime(path)  # LRU: mtime is the last access time
+        except (FileNotFoundError, KeyError, ValueError, OSError):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        logger.info(f"Detection cache hit {key}: {len(records)} frames")
+        return entry
+
+    def put(self, key: str, records, frame_height: int, total_frames: int):
+        counts = np.array([len(r[3]) for r in records], dtype=np.int32)
+        boxes = [r[2] for r in records if len(r[3])]
+        ids = [r[3] for r in records if len(r[3])]
+        clss = [r[4] for r in records if len(r[3])]
+
+        tmp_path = self._path(key) + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(
+                f,
+                frame_idx=np.array([r[0] for r in records], dtype=np.int32),
+                times=np.array([r[1] for r in records], dtype=np.float64),
+                tracked=np.array([r[5] for r in records], dtype=bool),
+                counts=counts,
+                boxes=np.concatenate(boxes).astype(np.float32) if boxes else np.empty((0, 4), np.float32),
+                ids=np.concatenate(ids).astype(np.int32) if ids else np.empty(0, np.int32),
+                classes=np.concatenate(clss).astype(np.int16) if clss else np.empty(0, np.int16),
+                frame_height=np.int32(frame_height),
+                total_frames=np.int32(total_frames),
+            )
+        os.replace(tmp_path, self._path(key))
+        logger.info(f"Detection cache stored {key}: {len(records)} frames, "
+                    f"{os.path.getsize(self._path(key)) / 1024:.0f} KB")
+        self.evict()
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".npz"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def evict(self):
+        """Drop least-recently-used entries until the cache fits in max_bytes."""
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                    self.evictions += 1
+                except FileNotFoundError:
+                    pass
+                try:
+                    os.remove(path[:-len(".npz")] + ".render.json")
+                except FileNotFoundError:
+                    pass
+
+    def metrics(self):
+        entries = self._entries()
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(entries),
+            "size_mb": round(sum(size for _, size, _ in entries) / (1024 * 1024), 2),
+            "max_mb": round(self.max_bytes / (1024 * 1024), 2),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+# Process-wide singleton, built on first use
+_detection_cache = None
+_detection_cache_lock = threading.Lock()
+
+
+def get_detection_cache():
+    """Returns the shared DetectionCache, or None when DETECTION_CACHE_ENABLED=0."""
+    global _detection_cache
+    if not DETECTION_CACHE_ENABLED:
+        return None
+    if _detection_cache is None:
+        with _detection_cache_lock:
+            if _detection_cache is None:
+                _detection_cache = DetectionCache()
+    return _detection_cache
@@ -0,0 +1,186 @@
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import time
+from importlib.util import find_spec
+
+import cv2
+import numpy as np
+
+from detection_cache import file_content_hash
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Detector runtime (override via environment)
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "torch")  # torch | onnx | openvino
+MODEL_INT8 = os.getenv("MODEL_INT8", "0") == "1"  # Static INT8 quantization of an exported model
+MODEL_INT8_CALIBRATION = os.getenv("MODEL_INT8_CALIBRATION")  # Video whose frames calibrate INT8 activations
+MODEL_INT8_CALIBRATION_FRAMES = int(os.getenv("MODEL_INT8_CALIBRATION_FRAMES", "64"))
+MODEL_EXPORT_DIR = os.getenv("MODEL_EXPORT_DIR", "model_exports")
+MODEL_EXPORT_IMGSZ = 640  # Longest side the model sees; exports are dynamic, so 16:9 frames stay 640x384
+
+BACKENDS = ("torch", "onnx", "openvino")
+# Packages an export needs; without them the backend falls back to PyTorch (never auto-installed)
+BACKEND_PACKAGES = {"onnx": ("onnx", "onnxruntime"), "openvino": ("openvino",)}
+INT8_PACKAGES = {"onnx": ("onnxruntime",), "openvino": ("nncf",)}
+
+
+def _missing(packages):
+    return [name for name in packages if find_spec(name) is None]
+
+
+def export_name(weights_path: str, backend: str, int8: bool, calibration: str = None) -> str:
+    """Cache entry name: weights content + export settings (+ calibration video for INT8)."""
+    digest = hashlib.sha256(file_content_hash(weights_path).encode())
+    digest.update(f"{backend}:{MODEL_EXPORT_IMGSZ}".encode())
+    if int8:
+        digest.update(file_content_hash(calibration).encode())
+    stem = os.path.splitext(os.path.basename(weights_path))[0]
+    name = f"{stem}-{digest.hexdigest()[:12]}{'-int8' if int8 else ''}"
+    return f"{name}.onnx" if backend == "onnx" else f"{name}_openvino_model"
+
+
+def calibration_inputs(video_path: str, count: int = MODEL_INT8_CALIBRATION_FRAMES, width: int = MODEL_EXPORT_IMGSZ):
+    """
+    Model inputs for INT8 calibration: `count` frames spread over the video, resized to the
+    processing width and letterboxed exactly as the predictor does (RGB, NCHW, 0-1 floats).
+    """
+    from ultralytics.data.augment import LetterBox
+
+    cap = cv2.VideoCapture(video_path)
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    letterbox = LetterBox(MODEL_EXPORT_IMGSZ, auto=True, stride=32)
+    inputs = []
+    try:
+        for frame_idx in np.linspace(0, max(total - 1, 0), count).astype(int).tolist():
+            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
+            success, frame = cap.read()
+            if not success:
+                continue
+            frame = cv2.resize(frame, (width, frame.shape[0] * width // frame.shape[1]), interpolation=cv2.INTER_AREA)
+            image = letterbox(image=frame)[..., ::-1].transpose(2, 0, 1)
+            inputs.append(np.ascontiguousarray(image[None], dtype=np.float32) / 255.0)
+    finally:
+        cap.release()
+    if not inputs:
+        raise ValueError(f"No calibration frames could be read from {video_path}")
+    return inputs
+
+
+def _quantize_onnx(source: str, target: str, inputs):
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    class FrameReader(CalibrationDataReader):
+        def __init__(self):
+            self._inputs = iter({"images": x} for x in inputs)
+
+        def get_next(self):
+            return next(self._inputs, None)
+
+    # Shape inference + graph optimisation first, so activations are calibrated on the graph that runs
+    # (symbolic shape inference is skipped: it rejects the dynamic height / width)
+    prepared = target + ".prep.onnx"
+    quant_pre_process(source, prepared, skip_symbolic_shape=True)
+    # QDQ keeps the graph runnable by every ORT provider; per-channel weights hold accuracy
+    quantize_static(prepared, target, FrameReader(), quant_format=QuantFormat.QDQ, per_channel=True,
+                    weight_type=QuantType.QInt8, activation_type=QuantType.QUInt8)
+
+
+def _quantize_openvino(model_dir: str, inputs):
+    import nncf
+    import openvino as ov
+
+    xml = next(os.path.join(model_dir, f) for f in os.listdir(model_dir) if f.endswith(".xml"))
+    model = ov.Core().read_model(xml)
+    # Box decoding and class scores stay in floating point (as ultralytics' own INT8 export does)
+    ignored = nncf.IgnoredScope(types=["Sigmoid", "Softmax"])
+    quantized = nncf.quantize(model, nncf.Dataset(inputs), preset=nncf.QuantizationPreset.MIXED,
+                              subset_size=len(inputs), ignored_scope=ignored)
+    os.remove(xml)
+    os.remove(xml[:-4] + ".bin")
+    ov.save_model(quantized, xml)
+
+
+def _export(weights_path: str, backend: str, int8: bool, calibration: str, target: str):
+    from ultralytics import YOLO
+
+    export_dir = os.path.dirname(target)
+    os.makedirs(export_dir, exist_ok=True)
+    # Export inside a scratch directory and move the result into place in one step, so
+    # a concurrent server process never loads a half-written model
+    with tempfile.TemporaryDirectory(dir=export_dir) as scratch:
+        staged = shutil.copy(weights_path, os.path.join(scratch, os.path.basename(weights_path)))
+        exported = YOLO(staged).export(format=backend, imgsz=MODEL_EXPORT_IMGSZ, dynamic=True, device="cpu",
+                                       simplify=find_spec("onnxslim") is not None, verbose=False)
+        if int8:
+            inputs = calibration_inputs(calibration)
+            if backend == "onnx":
+                quantized = os.path.join(scratch, "int8.onnx")
+                _quantize_onnx(exported, quantized, inputs)
+                exported = quantized
+            else:
+                _quantize_openvino(exported, inputs)
+        try:
+            os.replace(exported, target)
+        except OSError:
+            if not os.path.exists(target):  # Lost the race to another process: its export is used
+                raise
+
+
+def resolve_weights(weights: str, backend: str = MODEL_BACKEND, int8: bool = MODEL_INT8,
+                    calibration: str = MODEL_INT8_CALIBRATION, export_dir: str = MODEL_EXPORT_DIR):
+    """
+    Model file to load for the configured backend, exporting and caching it on first use.
+
+    PyTorch weights are exported to ONNX (run with ONNX Runtime) or OpenVINO IR, optionally with
+    static INT8 quantization calibrated on frames of `calibration`. Exports live in `export_dir`
+    under a name derived from the weights' content, so later starts load them directly. Whatever
+    the backend, ultralytics wraps the model the same way, so predict() / track() results (and the
+    tracking code consuming them) are unchanged.
+
+    Returns:
+        (weights_to_load, backend_in_use) - ("torch" whenever the export is unavailable)
+
+    Raises:
+        ValueError: For a backend other than torch / onnx / openvino
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown model backend '{backend}' (expected one of {', '.join(BACKENDS)})")
+    if backend == "torch":
+        return weights, "torch"
+
+    missing = _missing(BACKEND_PACKAGES[backend])
+    if missing:
+        logger.warning(f"Model backend '{backend}' needs {', '.join(missing)}; using PyTorch")
+        return weights, "torch"
+    if int8 and not calibration:
+        logger.warning("MODEL_INT8 needs MODEL_INT8_CALIBRATION (a representative video); exporting FP32")
+        int8 = False
+    if int8 and _missing(INT8_PACKAGES[backend]):
+        logger.warning(f"INT8 {backend} needs {', '.join(_missing(INT8_PACKAGES[backend]))}; exporting FP32")
+        int8 = False
+
+    weights_path = weights
+    if not os.path.isfile(weights_path):
+        from ultralytics import YOLO
+        # Official weights are downloaded on first load
+        weights_path = YOLO(weights).ckpt_path
+    if not weights_path or not weights_path.endswith(".pt"):
+        logger.warning(f"Only .pt weights can be exported ({weights}); using PyTorch")
+        return weights, "torch"
+
+    target = os.path.join(export_dir, export_name(weights_path, backend, int8, calibration))
+    if not os.path.exists(target):
+        start = time.perf_counter()
+        try:
+            _export(weights_path, backend, int8, calibration, target)
+        except Exception as e:
+            logger.warning(f"Export of {weights} to {backend} failed ({e}); using PyTorch")
+            return weights, "torch"
+        logger.info(f"Exported {weights} to {target} in {time.perf_counter() - start:.1f}s")
+    return target, f"{backend}-int8" if int8 else backend
@@ -0,0 +1,162 @@
+import logging
+import os
+
+import numpy as np
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Flow estimation settings (override via environment)
+DIRECTION_HISTORY_LEN = 100  # Most recently moving tracks that vote on the flow
+DIRECTION_SECTORS = 8  # 45 degree sectors
+LANE_FLOWS = int(os.getenv("LANE_FLOWS", "2"))  # 1 = single majority direction for the whole frame
+LANE_FLOW_MIN_SHARE = float(os.getenv("LANE_FLOW_MIN_SHARE", "0.2"))  # Votes a second flow needs
+OPPOSITE_FLOW_MIN_ANGLE = 135  # A second flow must run against the first (divided road)
+MIN_FLOW_VOTES = 3
+MIN_LANE_FLOW_VOTES = 2  # A sparse far carriageway can hold only a couple of vehicles
+# A second flow must be a separate carriageway: its centroid lies beyond this many standard deviations
+# of the first flow's votes across the direction of travel (the outer lane of evenly used lanes is
+# always within sqrt(3), so wrong-way drivers among them never qualify)...
+LANE_FLOW_SEPARATION_SIGMA = 1.75
+LANE_FLOW_MIN_SEPARATION_PX = 60  # ...and at least this far from its centroid (at DISPLAY_WIDTH 640)
+
+
+class DirectionFlow:
+    """
+    Incremental traffic-flow estimate over the last `window` distinct moving tracks.
+
+    Each track slot (shared with TrackStore) holds its latest sector vote, an update
+    stamp and the position it was cast at. Per-sector vote counts, position sums and
+    squared-position sums are adjusted only for the votes that change in a frame, so the
+    majority direction is an argmax over 8 counters and lane flows (with their centroids
+    and lateral spread) come from the same counters.
+    """
+    def __init__(self, capacity: int, window: int = DIRECTION_HISTORY_LEN):
+        self.window = window
+        self.counts = np.zeros(DIRECTION_SECTORS, dtype=np.int64)
+        self.position_sums = np.zeros((DIRECTION_SECTORS, 2), dtype=np.float64)
+        self.moment_sums = np.zeros((DIRECTION_SECTORS, 3), dtype=np.float64)  # Sums of xx, xy, yy (lane spread)
+        self.size = 0  # Votes in the window
+        self.seq = 0  # Next vote stamp
+        self.sector = np.empty(0, dtype=np.int64)  # -1: slot not in the window
+        self.stamp = np.empty(0, dtype=np.int64)
+        self.position = np.empty((0, 2), dtype=np.float64)
+        self.grow(capacity)
+
+    def grow(self, capacity: int):
+        extra = capacity - len(self.sector)
+        self.sector = np.concatenate([self.sector, np.full(extra, -1, dtype=np.int64)])
+        self.stamp = np.concatenate([self.stamp, np.full(extra, -1, dtype=np.int64)])
+        self.position = np.concatenate([self.position, np.zeros((extra, 2), dtype=np.float64)])
+
+    @property
+    def in_window(self):
+        return self.sector >= 0
+
+    def _tally(self, sectors, positions, sign):
+        """Adds (sign 1) or withdraws (sign -1) votes cast at `positions` from the per-sector sums."""
+        self.counts += sign * np.bincount(sectors, minlength=DIRECTION_SECTORS)
+        x, y = positions[:, 0], positions[:, 1]
+        for axis, values in enumerate((x, y)):
+            self.position_sums[:, axis] += sign * np.bincount(sectors, weights=values, minlength=DIRECTION_SECTORS)
+        for column, values in enumerate((x * x, x * y, y * y)):
+            self.moment_sums[:, column] += sign * np.bincount(sectors, weights=values, minlength=DIRECTION_SECTORS)
+
+    def _remove(self, slots):
+        self._tally(self.sector[slots], self.position[slots], -1)
+        self.sector[slots] = -1
+        self.size -= len(slots)
+
+    def update(self, slots, directions, centers):
+        """Record the latest direction (degrees) and position of moving tracks, in detection order."""
+        if len(slots) == 0:
+            return
+        # Re-voting tracks withdraw their previous vote first (LRU move-to-end)
+        revoting = slots[self.sector[slots] >= 0]
+        if len(revoting):
+            self._remove(revoting)
+
+        sectors = ((directions + 22.5) // 45).astype(np.int64) % DIRECTION_SECTORS
+        self.sector[slots] = sectors
+        self.position[slots] = centers
+        self.stamp[slots] = self.seq + np.arange(len(slots))
+        self.seq += len(slots)
+        self.size += len(slots)
+        self._tally(sectors, np.asarray(centers, dtype=np.float64), 1)
+
+        # Evict the least recently updated votes beyond the window
+        overflow = self.size - self.window
+        if overflow > 0:
+            voters = np.flatnonzero(self.in_window)
+            oldest = voters[np.argpartition(self.stamp[voters], overflow - 1)[:overflow]]
+            self._remove(oldest)
+
+    def majority_direction(self):
+        """Center angle of the most voted sector, or None with fewer than MIN_FLOW_VOTES votes."""
+        if self.size < MIN_FLOW_VOTES:
+            return None
+        return float(self.counts.argmax() * 45)
+
+    def flows(self, max_flows: int = LANE_FLOWS, min_share: float = LANE_FLOW_MIN_SHARE):
+        """
+        Dominant flows, strongest first: [{"direction", "votes", "center"}].
+        A second flow is reported only when it opposes the first, holds at least `min_share`
+        of the votes and runs on its own carriageway (see _separated), e.g. the far side of
+        a divided road. Wrong-way drivers among the first flow's lanes never form one.
+        """
+        primary = self.majority_direction()
+        if primary is None:
+            return []
+        primary_sector = int(self.counts.argmax())
+        flows = [self._flow(primary_sector)]
+        if max_flows > 1:
+            for sector in np.argsort(self.counts)[::-1].tolist():
+                if sector == primary_sector:
+                    continue
+                votes = self.counts[sector]
+                if votes < max(MIN_LANE_FLOW_VOTES, min_share * self.size):
+                    break
+                diff = abs(sector * 45 - primary) % 360
+                if min(diff, 360 - diff) >= OPPOSITE_FLOW_MIN_ANGLE:
+                    if self._separated(primary_sector, sector):
+                        flows.append(self._flow(sector))
+                    break
+        return flows
+
+    def _lateral(self, sector, normal):
+        """Mean and standard deviation of a sector's vote positions along `normal`."""
+        votes = self.counts[sector]
+        mean = self.position_sums[sector] @ normal / votes
+        xx, xy, yy = self.moment_sums[sector] / votes
+        var = normal[0] ** 2 * xx + 2 * normal[0] * normal[1] * xy + normal[1] ** 2 * yy - mean ** 2
+        return mean, np.sqrt(max(var, 0.0))
+
+    def _separated(self, primary_sector, sector):
+        """Whether a flow's centroid lies outside the primary flow's lanes, across its direction of travel."""
+        angle = np.radians(primary_sector * 45)
+        normal = np.array([-np.sin(angle), np.cos(angle)])
+        mean, spread = self._lateral(primary_sector, normal)
+        gap = abs(self.position_sums[sector] @ normal / self.counts[sector] - mean)
+        return gap >= max(LANE_FLOW_MIN_SEPARATION_PX, LANE_FLOW_SEPARATION_SIGMA * spread)
+
+    def _flow(self, sector):
+        votes = int(self.counts[sector])
+        center = self.position_sums[sector] / votes
+        return {"direction": float(sector * 45), "votes": votes,
+                "center": [round(float(center[0]), 1), round(float(center[1]), 1)]}
+
+    @staticmethod
+    def reference_directions(centers, flows):
+        """
+        Expected direction for each position: the flow whose lane (the line through its vote
+        centroid, along its direction) passes closest. With a single flow that is its direction.
+        """
+        if len(flows) == 1:
+            return np.full(len(centers), flows[0]["direction"])
+        angles = np.radians([f["direction"] for f in flows])
+        axes = np.column_stack([np.cos(angles), np.sin(angles)])
+        offsets = centers[:, None, :] - np.asarray([f["center"] for f in flows])[None, :, :]
+        # Distance across each flow's direction of travel
+        lateral = np.abs(offsets[..., 0] * axes[None, :, 1] - offsets[..., 1] * axes[None, :, 0])
+        return np.degrees(angles)[lateral.argmin(axis=1)]
@@ -0,0 +1,213 @@
+import logging
+import os
+import threading
+import time
+
+import cv2
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Sampling configuration (override via environment)
+FRAME_SAMPLER_MODE = os.getenv("FRAME_SAMPLER_MODE", "auto")  # auto | read | grab | seek
+# Seeking restarts decoding at the previous keyframe, so it only pays off when the skip
+# spans more than a typical GOP (~2s of 30fps footage); below that, grab() is cheaper.
+SEEK_MIN_SKIP = int(os.getenv("SEEK_MIN_SKIP", "60"))
+
+SAMPLER_MODES = ("read", "grab", "seek")
+STREAM_DEFAULT_FPS = 30.0  # Used when a stream does not report a usable frame rate
+
+
+class FrameSampler:
+    """
+    Iterates every `skip`-th frame of a cv2.VideoCapture, yielding (frame_idx, time_s, frame).
+
+    frame_idx and time_s match what the original read() loop reported: frame_idx is the
+    1-based number of the frame (CAP_PROP_POS_FRAMES after reading it) and a frame is
+    analysed when frame_idx % skip == 0.
+
+    `skip` may be changed while iterating (adaptive sampling); the next analysed frame is
+    then `skip` frames after the last one.
+
+    Modes:
+        read: decode every frame, drop the skipped ones (legacy behaviour)
+        grab: demux skipped frames with grab() and only retrieve() (decode + BGR convert) analysed ones
+        seek: jump straight to the next analysed frame with CAP_PROP_POS_FRAMES
+        auto: seek when skip >= SEEK_MIN_SKIP, otherwise grab
+    """
+    def __init__(self, cap, skip: int, mode: str = FRAME_SAMPLER_MODE, start_frame: int = 0, end_frame: int = None):
+        self.cap = cap
+        self.skip = max(1, int(skip))
+        # Optional window: frames already consumed before the first one, and last frame_idx to return
+        self.start_frame = max(0, int(start_frame))
+        self.end_frame = end_frame
+        if mode == "auto":
+            mode = "seek" if self.skip >= SEEK_MIN_SKIP else "grab"
+        if mode not in SAMPLER_MODES:
+            raise ValueError(f"Unknown frame sampler mode: {mode}")
+        self.mode = mode
+        self.frames_decoded = 0  # Frames fully decoded to BGR
+        self.frames_advanced = 0  # Source frames consumed (decoded, grabbed or seeked over)
+
+    def __iter__(self):
+        if self.start_frame:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, self.start_frame)
+        if self.mode == "read":
+            return self._iter_read()
+        if self.mode == "grab":
+            return self._iter_grab()
+        return self._iter_seek()
+
+    def _timestamp(self):
+        return self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+
+    def _past_end(self, frame_idx):
+        return self.end_frame is not None and frame_idx > self.end_frame
+
+    def _first_analysed(self):
+        return (self.start_frame // self.skip + 1) * self.skip
+
+    def _iter_read(self):
+        next_idx = self._first_analysed()
+        while self.cap.isOpened():
+            success, frame = self.cap.read()
+            if not success: break
+            self.frames_decoded += 1
+            self.frames_advanced += 1
+
+            frame_idx = int(self.cap.get(cv2.CAP_PROP_POS_FRAMES))
+            if self._past_end(frame_idx): break
+            if frame_idx < next_idx:
+                continue
+            yield frame_idx, self._timestamp(), frame
+            next_idx = frame_idx + self.skip
+
+    def _iter_grab(self):
+        frame_idx = self.start_frame
+        next_idx = self._first_analysed()
+        while self.cap.isOpened():
+            if self._past_end(frame_idx + 1): break
+            if not self.cap.grab(): break
+            frame_idx += 1
+            self.frames_advanced += 1
+            if frame_idx < next_idx:
+                continue
+
+            success, frame = self.cap.retrieve()
+            if not success: break
+            self.frames_decoded += 1
+            yield frame_idx, self._timestamp(), frame
+            next_idx = frame_idx + self.skip
+
+    def _iter_seek(self):
+        frame_idx = self._first_analysed()
+        while self.cap.isOpened() and not self._past_end(frame_idx):
+            # POS_FRAMES is 0-based: position on the frame whose 1-based number is frame_idx
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx - 1)
+            success, frame = self.cap.read()
+            if not success: break
+            self.frames_decoded += 1
+            self.frames_advanced = frame_idx - self.start_frame
+            yield frame_idx, self._timestamp(), frame
+            frame_idx += self.skip
+
+
+class LatestFrameReader:
+    """
+    Reads a live source (RTSP/HTTP URL, or a file played back in real time) on its own
+    thread and keeps only the newest frame. Iterating yields (seq, captured_at, frame)
+    for frames newer than the last one handed out; frames replaced before anyone took
+    them are counted in `dropped`, so a slow consumer sees fresh frames, not a backlog.
+
+    seq is the 1-based number of the frame in the stream and captured_at its wall-clock
+    capture time (time.time()).
+
+    Raises:
+        ValueError: If the source cannot be opened
+    """
+    def __init__(self, source: str, realtime: bool = False):
+        self.source = source
+        self.cap = cv2.VideoCapture(source)
+        if not self.cap.isOpened():
+            raise ValueError(f"Cannot open stream: {source}")
+        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.fps = fps if 0 < fps <= 240 else STREAM_DEFAULT_FPS
+        # Files decode faster than real time; pace them like a camera would deliver frames
+        self.realtime = realtime
+        self.started_at = time.time()
+        self.frames_read = 0
+        self.dropped = 0
+        self.running = True
+        self.ended = False
+        self._latest = None  # (seq, captured_at, frame)
+        self._taken_seq = 0
+        self._cond = threading.Condition()
+        self.thread = threading.Thread(target=self._worker, daemon=True, name="StreamReaderThread")
+        self.thread.start()
+
+    def _worker(self):
+        interval = 1.0 / self.fps
+        next_due = time.perf_counter()
+        try:
+            while self.running:
+                success, frame = self.cap.read()
+                if not success: break
+                if self.realtime:
+                    next_due += interval
+                    delay = next_due - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                captured_at = time.time()
+                with self._cond:
+                    self.frames_read += 1
+                    if self._latest is not None and self._latest[0] > self._taken_seq:
+                        self.dropped += 1
+                    self._latest = (self.frames_read, captured_at, frame)
+                    self._cond.notify_all()
+        except Exception as e:
+            logger.error(f"Stream reader error ({self.source}): {e}")
+        finally:
+            self.cap.release()
+            with self._cond:
+                self.ended = True
+                self._cond.notify_all()
+            logger.info(f"Stream reader finished: {self.frames_read} frames read, {self.dropped} dropped")
+
+    def _has_new(self):
+        return self._latest is not None and self._latest[0] > self._taken_seq
+
+    def __iter__(self):
+        while True:
+            with self._cond:
+                while self.running and not self.ended and not self._has_new():
+                    self._cond.wait(timeout=0.5)
+                if not self._has_new():
+                    return
+                seq, captured_at, frame = self._latest
+                self._taken_seq = seq
+            yield seq, captured_at, frame
+
+    def stop(self):
+        self.running = False
+        with self._cond:
+            self._cond.notify_all()
+        if self.thread.is_alive():
+            self.thread.join(timeout=2.0)
+
+
+def resize_to_width(frame, width: int):
+    """Aspect-preserving resize used for every analysed frame."""
+    h, w = frame.shape[:2]
+    scale = width / w
+    new_h = int(h * scale)
+    return cv2.resize(frame, (width, new_h))
+
+
+def frame_count(video_path: str) -> int:
+    """Frame count from the container metadata; 0 when it is missing or unreadable (blocking open)."""
+    cap = cv2.VideoCapture(video_path)
+    try:
+        return max(0, int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+    finally:
+        cap.release()
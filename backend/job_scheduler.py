@@ -0,0 +1,274 @@
+import asyncio
+import itertools
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import aclosing
+
+from broadcast import BroadcastHub
+from model_pool import MODEL_POOL_SIZE
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Scheduler configuration (override via environment)
+# Each running job holds a model worker, so more slots than models would only queue inside the pool
+JOB_WORKER_SLOTS = int(os.getenv("JOB_WORKER_SLOTS", str(min(MODEL_POOL_SIZE, os.cpu_count() or 1))))
+JOB_QUEUE_MAX = int(os.getenv("JOB_QUEUE_MAX", "32"))
+JOB_RETENTION_S = float(os.getenv("JOB_RETENTION_S", "3600"))  # Finished jobs stay queryable this long
+
+QUEUED, RUNNING, COMPLETED, FAILED, CANCELLED = "queued", "running", "completed", "failed", "cancelled"
+FINISHED_STATES = (COMPLETED, FAILED, CANCELLED)
+
+
+class QueueFullError(Exception):
+    """Raised by submit() when the bounded job queue is full."""
+
+
+class Job:
+    """
+    One queued analysis of an uploaded file or a live stream.
+    `run` is an async generator factory producing the processor's messages; they are
+    broadcast to every subscriber. `key` identifies the analysis (file, direction, mode)
+    so identical requests share one job.
+    """
+    def __init__(self, run, filename: str, priority: int = 0, key=None, cancel_when_unwatched: bool = False,
+                 **options):
+        self.job_id = uuid.uuid4().hex
+        self.run = run
+        self.filename = filename
+        self.priority = priority
+        self.key = key
+        self.options = options
+        # Jobs started by a viewer's WebSocket are not worth finishing once nobody watches
+        self.cancel_when_unwatched = cancel_when_unwatched
+        self.status = QUEUED
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.progress = {"current_frame": 0, "total_frames": None}
+        self.report = None
+        self.error = None
+        self.task = None
+        self.hub = BroadcastHub()
+
+    def publish(self, message):
+        if message.get("current_frame") is not None:
+            self.progress = {"current_frame": message["current_frame"], "total_frames": message.get("total_frames")}
+        self.hub.publish(message)
+
+    def outcome(self):
+        """Terminal message of a finished job."""
+        if self.status == COMPLETED:
+            return self.report
+        if self.status == FAILED:
+            return {"type": "error", "error": self.error}
+        return {"type": "cancelled", "job_id": self.job_id}
+
+    def info(self, position=None):
+        info = {
+            "job_id": self.job_id,
+            "filename": self.filename,
+            "status": self.status,
+            "priority": self.priority,
+            "position": position,
+            "progress": self.progress,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+            "subscribers": len(self.hub.subscribers),
+        }
+        if self.report:
+            info["summary"] = self.report.get("summary")
+        return info
+
+
+class JobScheduler:
+    """
+    Bounded priority queue of analysis jobs served by a fixed number of worker slots.
+    Lower priority values run first; equal priorities run in submission order.
+    Under overload new jobs are rejected (QueueFullError) rather than slowing every running job.
+    """
+    def __init__(self, slots: int = JOB_WORKER_SLOTS, max_queued: int = JOB_QUEUE_MAX):
+        self.slots = max(1, slots)
+        self.max_queued = max_queued
+        self.jobs = {}
+        self._queue = None
+        self._workers = []
+        self._seq = itertools.count()
+        self._metrics = {"submitted": 0, "joined": 0, "rejected": 0, "completed": 0, "failed": 0, "cancelled": 0}
+
+    def start(self):
+        """Starts the worker slots on the running event loop (idempotent)."""
+        if self._workers:
+            return
+        self._queue = asyncio.PriorityQueue()
+        self._workers = [asyncio.create_task(self._worker(i), name=f"job-slot-{i}") for i in range(self.slots)]
+        logger.info(f"JobScheduler started: {self.slots} slot(s), queue limit {self.max_queued}")
+
+    async def stop(self):
+        for job in list(self.jobs.values()):
+            if job.status in (QUEUED, RUNNING):
+                self.cancel(job.job_id)
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def _queued_jobs(self):
+        queued = [j for j in self.jobs.values() if j.status == QUEUED]
+        return sorted(queued, key=lambda j: (j.priority, j.seq))
+
+    def position(self, job):
+        """1-based place in the queue, or None when the job is not waiting."""
+        if job.status != QUEUED:
+            return None
+        return self._queued_jobs().index(job) + 1
+
+    def find_active(self, key):
+        """Queued or running job for the same analysis, if any."""
+        for job in self.jobs.values():
+            if job.key == key and job.status in (QUEUED, RUNNING):
+                return job
+        return None
+
+    def submit(self, run, filename: str, priority: int = 0, key=None, cancel_when_unwatched: bool = False,
+               **options) -> Job:
+        """
+        Queues a job, or returns the active job with the same `key` so the work is done once.
+
+        Raises:
+            QueueFullError: If max_queued jobs are already waiting
+        """
+        self.start()
+        self._prune()
+        if key is not None:
+            job = self.find_active(key)
+            if job is not None:
+                # Someone now wants the result regardless of who is watching
+                job.cancel_when_unwatched = job.cancel_when_unwatched and cancel_when_unwatched
+                self._metrics["joined"] += 1
+                logger.info(f"Job {job.job_id} joined for {filename}")
+                return job
+        if len(self._queued_jobs()) >= self.max_queued:
+            self._metrics["rejected"] += 1
+            raise QueueFullError(f"Job queue is full ({self.max_queued} waiting)")
+        job = Job(run, filename, priority, key=key, cancel_when_unwatched=cancel_when_unwatched, **options)
+        job.seq = next(self._seq)
+        self.jobs[job.job_id] = job
+        self._queue.put_nowait((priority, job.seq, job))
+        self._metrics["submitted"] += 1
+        logger.info(f"Job {job.job_id} queued: {filename} (priority {priority}, position {self.position(job)})")
+        self._announce_positions()
+        return job
+
+    def get(self, job_id: str):
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        job = self.jobs.get(job_id)
+        if job is None or job.status in FINISHED_STATES:
+            return False
+        if job.status == QUEUED:
+            # Left in the heap; the worker that pops it skips it
+            self._finish(job, CANCELLED)
+            self._announce_positions()
+        elif job.task is not None:
+            job.task.cancel()
+        return True
+
+    async def subscribe(self, job: Job):
+        """
+        Async generator of a job's messages: its current state first (queue position,
+        latest frame or final report), then live updates, ending with its report (or
+        error / cancellation).
+        """
+        subscription = job.hub.subscribe()
+        try:
+            if job.status == QUEUED:
+                yield self._queued_message(job)
+            async for message in job.hub.listen(subscription):
+                yield message
+        finally:
+            job.hub.unsubscribe(subscription)
+            if job.cancel_when_unwatched and not job.hub.subscribers and job.status in (QUEUED, RUNNING):
+                logger.info(f"Job {job.job_id} has no viewers left, cancelling")
+                self.cancel(job.job_id)
+
+    def _queued_message(self, job):
+        position = self.position(job)
+        return {"type": "status", "message": f"Waiting for a free analysis slot (position {position} in queue)...",
+                "job_id": job.job_id, "position": position}
+
+    def _announce_positions(self):
+        for job in self._queued_jobs():
+            job.publish(self._queued_message(job))
+
+    def _finish(self, job, status, error=None):
+        job.status = status
+        job.error = error
+        job.finished_at = time.time()
+        self._metrics[status] += 1
+        job.publish(job.outcome())
+
+    async def _worker(self, slot):
+        while True:
+            _, _, job = await self._queue.get()
+            if job.status != QUEUED:
+                continue  # Cancelled while waiting
+            job.status = RUNNING
+            job.started_at = time.time()
+            self._announce_positions()
+            logger.info(f"Job {job.job_id} running on slot {slot}")
+            job.task = asyncio.create_task(self._run(job))
+            try:
+                await job.task
+            except asyncio.CancelledError:
+                if not job.task.cancelled():
+                    raise  # The slot itself is shutting down
+                self._finish(job, CANCELLED)
+            except Exception as e:
+                logger.error(f"Job {job.job_id} failed: {e}", exc_info=True)
+                self._finish(job, FAILED, str(e))
+            finally:
+                job.task = None
+
+    async def _run(self, job):
+        async with aclosing(job.run()) as messages:
+            async for message in messages:
+                if message.get("type") == "report":
+                    job.report = message
+                    continue
+                job.publish(message)
+        if job.report is None:
+            raise RuntimeError("Analysis ended without a report")
+        self._finish(job, COMPLETED)
+
+    def _prune(self):
+        cutoff = time.time() - JOB_RETENTION_S
+        for job_id in [j.job_id for j in self.jobs.values()
+                       if j.status in FINISHED_STATES and j.finished_at < cutoff]:
+            del self.jobs[job_id]
+
+    def metrics(self):
+        running = sum(1 for j in self.jobs.values() if j.status == RUNNING)
+        return dict(self._metrics, slots=self.slots, running=running, queued=len(self._queued_jobs()),
+                    queue_limit=self.max_queued)
+
+
+# Process-wide singleton, built on first use
+_job_scheduler = None
+_job_scheduler_lock = threading.Lock()
+
+
+def get_job_scheduler() -> JobScheduler:
+    global _job_scheduler
+    if _job_scheduler is None:
+        with _job_scheduler_lock:
+            if _job_scheduler is None:
+                _job_scheduler = JobScheduler()
+    return _job_scheduler
@@ -1,10 +1,22 @@
-from fastapi import FastAPI, UploadFile, File, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, UploadFile, File, WebSocket, WebSocketDisconnect, Request
 from fastapi.middleware.cors import CORSMiddleware
-import shutil
+from fastapi.responses import JSONResponse
+from fastapi import HTTPException
 import os
 import asyncio
 import logging
+import time
+from contextlib import asynccontextmanager, aclosing
 from processor import VideoProcessor
+from model_pool import get_model_pool, model_pool_ready, MODEL_LOAD
+from detection_cache import get_detection_cache
+from upload_manager import get_upload_manager, UploadError, UPLOAD_DIR, UPLOAD_FLUSH_BYTES
+from job_scheduler import get_job_scheduler, QueueFullError
+from sharding import shutdown_shard_executor
+from storage import get_storage, STORAGE_BACKEND, STORAGE_LOCAL_DIR, STORAGE_LOCAL_URL
+from analytics_store import get_analytics_store, stream_name, ANALYTICS_QUERY_LIMIT
+from wire_protocol import make_encoder
+from preview import PreviewController
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -14,7 +26,35 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Car Tracking API")
+def log_warmup_failure(task: asyncio.Task):
+    # The pool is retried by the first job that needs it
+    if not task.cancelled() and task.exception():
+        logger.error(f"Background model load failed: {task.exception()}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load and warm up the shared model pool once: before accepting requests (eager), or
+    # while already serving (background; a job arriving first waits for it). lazy leaves it to the first job.
+    if MODEL_LOAD == "eager":
+        await asyncio.to_thread(get_model_pool)
+    elif MODEL_LOAD == "background":
+        app.state.model_warmup = asyncio.create_task(asyncio.to_thread(get_model_pool))
+        app.state.model_warmup.add_done_callback(log_warmup_failure)
+    # Resumes uploads that failed before a restart
+    storage = await asyncio.to_thread(get_storage)
+    storage.start()
+    scheduler = get_job_scheduler()
+    scheduler.start()
+    yield
+    await scheduler.stop()
+    shutdown_shard_executor()
+    storage.stop()
+    # Commits results still queued for the database
+    analytics = get_analytics_store()
+    if analytics is not None:
+        await asyncio.to_thread(analytics.stop)
+
+app = FastAPI(title="Car Tracking API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -26,11 +66,22 @@ app.add_middleware(
 
 @app.get("/health")
 async def health_check():
-    return {"status": "ok"}
+    return {"status": "ok", "model_ready": model_pool_ready()}
+
+@app.get("/metrics")
+async def metrics():
+    cache = get_detection_cache()
+    analytics = get_analytics_store()
+    return {
+        "model_pool": get_model_pool().metrics() if model_pool_ready() else None,
+        "detection_cache": cache.metrics() if cache else None,
+        "jobs": get_job_scheduler().metrics(),
+        "storage": get_storage().metrics(),
+        "analytics": analytics.metrics() if analytics else None,
+    }
 
 from fastapi.staticfiles import StaticFiles
 
-UPLOAD_DIR = "uploads"
 VIOLATIONS_DIR = "generated_violations"
 PROCESSED_DIR = "processed_videos"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
@@ -39,57 +90,271 @@ os.makedirs(PROCESSED_DIR, exist_ok=True)
 
 app.mount("/violations", StaticFiles(directory=VIOLATIONS_DIR), name="violations")
 app.mount("/processed", StaticFiles(directory=PROCESSED_DIR), name="processed")
+if STORAGE_BACKEND == "local":
+    os.makedirs(STORAGE_LOCAL_DIR, exist_ok=True)
+    app.mount(STORAGE_LOCAL_URL, StaticFiles(directory=STORAGE_LOCAL_DIR), name="storage")
+
+@app.exception_handler(UploadError)
+async def upload_error_handler(request: Request, exc: UploadError):
+    return JSONResponse(status_code=exc.status, content={"error": str(exc), **exc.details})
 
 @app.post("/upload")
 async def upload_video(file: UploadFile = File(...)):
+    """Single-request upload; streamed through the chunked upload manager so the event loop never blocks."""
+    logger.info(f"Receiving file upload: {file.filename}")
+    uploads = get_upload_manager()
+    session = await asyncio.to_thread(uploads.create, file.filename)
+
+    async def chunks():
+        while data := await file.read(UPLOAD_FLUSH_BYTES):
+            yield data
+
     try:
-        file_path = os.path.join(UPLOAD_DIR, file.filename)
-        logger.info(f"Receiving file upload: {file.filename}")
-        
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-            
-        logger.info(f"File saved to {file_path}")
-        return {"filename": file.filename, "path": file_path}
+        await uploads.append(session["upload_id"], 0, chunks())
+        result = await uploads.complete(session["upload_id"])
     except Exception as e:
+        # No client can resume a single-request upload: drop its partial file
         logger.error(f"Upload failed: {e}")
-        return {"error": str(e)}
+        await uploads.abort(session["upload_id"])
+        if isinstance(e, UploadError):
+            raise
+        raise HTTPException(status_code=500, detail=f"Upload failed: {e}")
+    logger.info(f"File saved to {result['path']}")
+    return result
 
-@app.websocket("/ws/{filename}")
-async def websocket_endpoint(websocket: WebSocket, filename: str, direction: str = None):
-    await websocket.accept()
-    logger.info(f"WebSocket connected for {filename} with direction={direction}")
-    
-    file_path = os.path.join(UPLOAD_DIR, filename)
-    
-    if not os.path.exists(file_path):
-        logger.warning(f"File not found: {file_path}")
-        await websocket.send_json({"error": "File not found"})
-        await websocket.close()
-        return
+# Resumable uploads: create a session, PUT raw chunks at the current offset
+# (GET the session to find it after an interruption), then complete
+@app.post("/uploads")
+async def create_upload(filename: str, size: int = None):
+    return await asyncio.to_thread(get_upload_manager().create, filename, size)
 
-    processor = VideoProcessor()
-    
-    # Parse direction if provided
-    manual_direction = None
+@app.get("/uploads/{upload_id}")
+async def upload_status(upload_id: str):
+    return await asyncio.to_thread(get_upload_manager().status, upload_id)
+
+@app.put("/uploads/{upload_id}")
+async def upload_chunk(upload_id: str, request: Request, offset: int = 0):
+    # Raw request body, streamed: no multipart parsing or spooling
+    return await get_upload_manager().append(upload_id, offset, request.stream())
+
+@app.post("/uploads/{upload_id}/complete")
+async def complete_upload(upload_id: str):
+    return await get_upload_manager().complete(upload_id)
+
+@app.delete("/uploads/{upload_id}")
+async def abort_upload(upload_id: str):
+    await get_upload_manager().abort(upload_id)
+    return {"upload_id": upload_id, "aborted": True}
+
+def analytics_store():
+    store = get_analytics_store()
+    if store is None:
+        raise HTTPException(status_code=404, detail="Analytics store disabled (ANALYTICS_ENABLED=0)")
+    return store
+
+# Results of every finished analysis, filtered across videos. since / until: Unix time the
+# analysis ran; start / end: seconds into the video; vehicle_type: Car, Bus, ...
+@app.get("/analytics/videos")
+async def analytics_videos(name: str = None, since: float = None, until: float = None,
+                           limit: int = ANALYTICS_QUERY_LIMIT):
+    return await asyncio.to_thread(analytics_store().videos, name, since, until, limit)
+
+@app.get("/analytics/violations")
+async def analytics_violations(video: str = None, vehicle_type: str = None, start: float = None, end: float = None,
+                               since: float = None, until: float = None, limit: int = ANALYTICS_QUERY_LIMIT):
+    return await asyncio.to_thread(analytics_store().violations, video, vehicle_type, start, end, since, until, limit)
+
+@app.get("/analytics/tracks")
+async def analytics_tracks(video: str = None, vehicle_type: str = None, violated: bool = None,
+                           min_speed: float = None, start: float = None, end: float = None,
+                           since: float = None, until: float = None, limit: int = ANALYTICS_QUERY_LIMIT):
+    return await asyncio.to_thread(analytics_store().tracks, video, vehicle_type, violated, min_speed,
+                                   start, end, since, until, limit)
+
+@app.get("/analytics/flow")
+async def analytics_flow(video: str = None, vehicle_type: str = None, start_minute: int = None,
+                         end_minute: int = None, since: float = None, until: float = None):
+    """Vehicles counted and violations started per minute and vehicle type."""
+    return await asyncio.to_thread(analytics_store().flow, video, vehicle_type, start_minute, end_minute,
+                                   since, until)
+
+STREAM_URL_SCHEMES = ("rtsp://", "rtsps://", "rtmp://", "http://", "https://")
+
+def parse_direction(direction: str = None):
+    """Manual flow direction in degrees, or None for auto-detection."""
     if direction and direction != "auto":
         try:
-            manual_direction = float(direction)
+            return float(direction)
         except ValueError:
             pass
+    return None
 
+async def accept_with_encoder(websocket: WebSocket, protocol: str = None):
+    """
+    Accepts the connection and returns the message encoder for the requested protocol
+    (?protocol=json, the default, or binary; see wire_protocol), or None after reporting
+    an unknown protocol.
+    """
+    await websocket.accept()
     try:
-        # Process video frame by frame and send results
-        async for result in processor.process_video(file_path, manual_direction=manual_direction):
-            await websocket.send_json(result)
-            # Minimal delay to yield control but maximize speed
-            await asyncio.sleep(0.001) 
+        return make_encoder(protocol)
+    except ValueError as e:
+        await websocket.send_json({"error": str(e)})
+        await websocket.close()
+        return None
+
+async def send_message(websocket: WebSocket, encoder, message, preview: PreviewController = None):
+    """Sends one message; the send time of previews is fed back to the job's preview controller."""
+    start = time.perf_counter()
+    sent = 0
+    for payload in encoder.encode(message):
+        if isinstance(payload, bytes):
+            await websocket.send_bytes(payload)
+        else:
+            await websocket.send_text(payload)
+        sent += len(payload)
+    if preview is not None and "image" in message:
+        preview.record_send(time.perf_counter() - start, sent)
+
+@app.websocket("/ws/stream")
+async def stream_websocket(websocket: WebSocket, url: str, direction: str = None, protocol: str = None):
+    """
+    Live analysis of a camera stream. `url` is an RTSP/RTMP/HTTP(S) stream URL, or the
+    name of an uploaded file to play back in real time as a local test stream.
+    """
+    encoder = await accept_with_encoder(websocket, protocol)
+    if encoder is None:
+        return
+    logger.info(f"Stream WebSocket connected for {url} with direction={direction}")
+    
+    if url.startswith(STREAM_URL_SCHEMES):
+        source, realtime, name = url, False, stream_name(url)
+    else:
+        source, realtime, name = os.path.join(UPLOAD_DIR, os.path.basename(url)), True, os.path.basename(url)
+        if not os.path.exists(source):
+            await websocket.send_json({"error": "File not found"})
+            await websocket.close()
+            return
+    manual_direction = parse_direction(direction)
+    preview = PreviewController()
+
+    def run():
+        return VideoProcessor().process_stream(source, manual_direction=manual_direction, realtime=realtime,
+                                               preview=preview)
+
+    # A stream holds a model worker for as long as it runs, so it takes a scheduler slot like
+    # any analysis (and waits for one when all are busy); viewers of the same stream share it
+    try:
+        job = get_job_scheduler().submit(run, name, key=("stream", source, manual_direction),
+                                         cancel_when_unwatched=True, preview=preview)
+    except QueueFullError as e:
+        logger.warning(f"Stream {name} not started: {e}")
+        await websocket.send_json({"error": str(e)})
+        await websocket.close()
+        return
+    await send_job(websocket, job, encoder)
+
+def submit_job(filename: str, direction: str = None, mode: str = None, priority: int = 0, **options):
+    """
+    Queues an analysis of an uploaded file.
+    mode=sharded: parallel time-segment analysis for long videos (report only, no preview frames)
+
+    Raises:
+        HTTPException: 404 if the file does not exist, 503 if the job queue is full
+    """
+    file_path = os.path.join(UPLOAD_DIR, os.path.basename(filename))
+    if not os.path.exists(file_path):
+        raise HTTPException(status_code=404, detail="File not found")
+    manual_direction = parse_direction(direction)
+    # Shared by the job and every connection watching it
+    preview = PreviewController()
+
+    def run():
+        processor = VideoProcessor()
+        if mode == "sharded":
+            return processor.process_video_sharded(file_path, manual_direction=manual_direction)
+        return processor.process_video(file_path, manual_direction=manual_direction, preview=preview)
+
+    # Identical requests (e.g. two dashboard tabs) share one job
+    key = (os.path.basename(filename), manual_direction, mode)
+    try:
+        return get_job_scheduler().submit(run, os.path.basename(filename), priority=priority, key=key,
+                                          preview=preview, **options)
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+
+def find_job(job_id: str):
+    job = get_job_scheduler().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job
+
+# Analysis jobs: queued and run on a fixed number of slots; watch one over /ws/jobs/{job_id}
+@app.post("/jobs")
+async def create_job(filename: str, direction: str = None, mode: str = None, priority: int = 0):
+    """Lower priority values run first."""
+    job = submit_job(filename, direction, mode, priority)
+    return job.info(get_job_scheduler().position(job))
+
+@app.get("/jobs")
+async def list_jobs():
+    scheduler = get_job_scheduler()
+    return [job.info(scheduler.position(job)) for job in scheduler.jobs.values()]
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    job = find_job(job_id)
+    return job.info(get_job_scheduler().position(job))
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    job = find_job(job_id)
+    return {"job_id": job_id, "cancelled": get_job_scheduler().cancel(job.job_id)}
+
+async def send_job(websocket: WebSocket, job, encoder):
+    """Relays a job's messages to a WebSocket until its report (or the client leaves)."""
+    preview = job.options.get("preview")
+    try:
+        async with aclosing(get_job_scheduler().subscribe(job)) as messages:
+            async for message in messages:
+                await send_message(websocket, encoder, message, preview)
     except WebSocketDisconnect:
-        logger.info("Client disconnected from WebSocket")
+        logger.info(f"Client stopped watching job {job.job_id}")
     except Exception as e:
         logger.error(f"WebSocket error: {e}")
         await websocket.close()
 
+@app.websocket("/ws/jobs/{job_id}")
+async def job_websocket(websocket: WebSocket, job_id: str, protocol: str = None):
+    encoder = await accept_with_encoder(websocket, protocol)
+    if encoder is None:
+        return
+    job = get_job_scheduler().get(job_id)
+    if job is None:
+        await websocket.send_json({"error": "Unknown job"})
+        await websocket.close()
+        return
+    await send_job(websocket, job, encoder)
+
+@app.websocket("/ws/{filename}")
+async def websocket_endpoint(websocket: WebSocket, filename: str, direction: str = None, mode: str = None,
+                             protocol: str = None):
+    encoder = await accept_with_encoder(websocket, protocol)
+    if encoder is None:
+        return
+    logger.info(f"WebSocket connected for {filename} with direction={direction}")
+    
+    # The connection only watches the job; the scheduler decides when it runs and
+    # cancels it if the viewer leaves before it finishes
+    try:
+        job = submit_job(filename, direction, mode, cancel_when_unwatched=True)
+    except HTTPException as e:
+        logger.warning(f"Job for {filename} not started: {e.detail}")
+        await websocket.send_json({"error": e.detail})
+        await websocket.close()
+        return
+    await send_job(websocket, job, encoder)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=True)
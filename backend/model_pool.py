@@ -0,0 +1,218 @@
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from detector_backend import resolve_weights, MODEL_BACKEND
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Inference settings shared by every worker
+MODEL_WEIGHTS = os.getenv("MODEL_WEIGHTS", "yolov8n.pt")
+TRACKER_CONFIG = "bytetrack.yaml"
+VEHICLE_CLASS_IDS = [2, 3, 5, 7]
+TRACK_CONFIDENCE = 0.1  # model.track() default: ByteTrack needs the low-confidence detections too
+
+# Pool configuration (override via environment)
+MODEL_POOL_SIZE = int(os.getenv("MODEL_POOL_SIZE", "2"))
+MODEL_POOL_WARMUP = os.getenv("MODEL_POOL_WARMUP", "1") != "0"
+MODEL_POOL_TIMEOUT = float(os.getenv("MODEL_POOL_TIMEOUT", "600"))  # Max seconds a job waits for a worker
+# When the server builds the pool: eager (before serving), background (right after startup) or lazy (first job)
+MODEL_LOAD = os.getenv("MODEL_LOAD", "eager")
+WARMUP_FRAME_SHAPE = (360, 640, 3)  # Matches DISPLAY_WIDTH frames of 16:9 footage
+
+
+class ModelWorker:
+    """
+    One set of pre-loaded YOLO weights (PyTorch, or an ONNX / OpenVINO export of them).
+    Jobs borrow a worker from the pool; the weights are shared across jobs,
+    while the ByteTrack state is reset on every checkout.
+    """
+    def __init__(self, worker_id: int, weights: str = MODEL_WEIGHTS):
+        # Imported here: ultralytics pulls in torch, which dominates server import time
+        from ultralytics import YOLO
+
+        self.worker_id = worker_id
+        start = time.perf_counter()
+        self.model = YOLO(weights, task="detect")
+        self.load_time = time.perf_counter() - start
+        self.jobs_served = 0
+        logger.info(f"ModelWorker {worker_id} loaded {weights} in {self.load_time:.2f}s")
+
+    def warm_up(self, frame_shape=WARMUP_FRAME_SHAPE):
+        # First call pays for predictor setup, fusing and tracker construction
+        dummy = np.zeros(frame_shape, dtype=np.uint8)
+        start = time.perf_counter()
+        self.model.track(dummy, persist=True, tracker=TRACKER_CONFIG,
+                         classes=VEHICLE_CLASS_IDS, verbose=False)
+        self.reset_tracker()
+        logger.info(f"ModelWorker {self.worker_id} warmed up in {time.perf_counter() - start:.2f}s")
+
+    def reset_tracker(self):
+        # persist=True keeps trackers on the predictor; clear them so IDs never leak between jobs
+        predictor = getattr(self.model, "predictor", None)
+        for tracker in getattr(predictor, "trackers", None) or []:
+            tracker.reset()
+
+
+class ModelPool:
+    """
+    Fixed-size pool of ModelWorkers checked out per job.
+    Thread-safe: workers can be acquired from the event loop (via a thread) or executor threads.
+    """
+    def __init__(self, size: int = MODEL_POOL_SIZE, weights: str = MODEL_WEIGHTS, warmup: bool = MODEL_POOL_WARMUP,
+                 backend: str = MODEL_BACKEND):
+        self.size = max(1, size)
+        self._available = queue.Queue()
+        self._lock = threading.Lock()
+        self._metrics = {
+            "checkouts": 0,
+            "in_use": 0,
+            "waiting": 0,
+            "timeouts": 0,
+            "total_wait_s": 0.0,
+            "max_wait_s": 0.0,
+        }
+
+        start = time.perf_counter()
+        # Exported on the first start with a new backend / weights, loaded from the export cache after that
+        self.weights, self.backend = resolve_weights(weights, backend)
+        self.export_time = time.perf_counter() - start
+        self.workers = [ModelWorker(i, self.weights) for i in range(self.size)]
+        if warmup:
+            for worker in self.workers:
+                worker.warm_up()
+        self.startup_time = time.perf_counter() - start
+        self.warmed_up = warmup
+
+        for worker in self.workers:
+            self._available.put(worker)
+        logger.info(f"ModelPool ready: {self.size} {self.backend} worker(s) in {self.startup_time:.2f}s "
+                    f"(warmup={warmup})")
+
+    def acquire(self, timeout: float = MODEL_POOL_TIMEOUT) -> ModelWorker:
+        """
+        Block until a worker is free.
+
+        Raises:
+            TimeoutError: If no worker becomes available within `timeout` seconds
+        """
+        with self._lock:
+            self._metrics["waiting"] += 1
+        start = time.perf_counter()
+        try:
+            worker = self._available.get(timeout=timeout)
+        except queue.Empty:
+            with self._lock:
+                self._metrics["waiting"] -= 1
+                self._metrics["timeouts"] += 1
+            raise TimeoutError(f"No model worker available after {timeout:.0f}s")
+
+        waited = time.perf_counter() - start
+        with self._lock:
+            self._metrics["waiting"] -= 1
+            self._metrics["in_use"] += 1
+            self._metrics["checkouts"] += 1
+            self._metrics["total_wait_s"] += waited
+            self._metrics["max_wait_s"] = max(self._metrics["max_wait_s"], waited)
+
+        worker.reset_tracker()
+        worker.jobs_served += 1
+        return worker
+
+    def release(self, worker: ModelWorker):
+        worker.reset_tracker()
+        with self._lock:
+            self._metrics["in_use"] -= 1
+        self._available.put(worker)
+
+    @contextmanager
+    def checkout(self, timeout: float = MODEL_POOL_TIMEOUT):
+        worker = self.acquire(timeout)
+        try:
+            yield worker
+        finally:
+            self.release(worker)
+
+    def metrics(self):
+        with self._lock:
+            snapshot = dict(self._metrics)
+        checkouts = snapshot["checkouts"]
+        snapshot["avg_wait_s"] = round(snapshot["total_wait_s"] / checkouts, 4) if checkouts else 0.0
+        snapshot["total_wait_s"] = round(snapshot["total_wait_s"], 4)
+        snapshot["max_wait_s"] = round(snapshot["max_wait_s"], 4)
+        snapshot.update({
+            "size": self.size,
+            "available": self._available.qsize(),
+            "weights": self.weights,
+            "backend": self.backend,
+            "export_time_s": round(self.export_time, 3),
+            "warmed_up": self.warmed_up,
+            "startup_time_s": round(self.startup_time, 3),
+        })
+        return snapshot
+
+
+def create_tracker():
+    """
+    Standalone ByteTrack instance, for jobs that run detection with model.predict()
+    and feed the tracker themselves (batched inference).
+    """
+    from ultralytics.trackers.byte_tracker import BYTETracker
+    from ultralytics.utils import IterableSimpleNamespace
+    from ultralytics.utils.checks import check_yaml
+    try:
+        from ultralytics.utils import YAML
+        cfg = YAML.load(check_yaml(TRACKER_CONFIG))
+    except ImportError:  # Older ultralytics releases
+        from ultralytics.utils import yaml_load
+        cfg = yaml_load(check_yaml(TRACKER_CONFIG))
+    return BYTETracker(args=IterableSimpleNamespace(**cfg))
+
+
+def unpack_tracks(result):
+    """(boxes_xywh, track_ids, class_ids) arrays from a model.track() result; None when nothing is tracked."""
+    if result.boxes.id is None:
+        return None, None, None
+    # CPU Unload
+    boxes_xywh = result.boxes.xywh.cpu().numpy()
+    track_ids = result.boxes.id.int().cpu().numpy()
+    clss = result.boxes.cls.int().cpu().numpy()
+    return boxes_xywh, track_ids, clss
+
+
+def unpack_tracker_output(tracks):
+    """Same as unpack_tracks, for raw BYTETracker.update() rows [x1, y1, x2, y2, id, score, cls, idx]."""
+    if len(tracks) == 0:
+        return None, None, None
+    boxes_xywh = np.empty((len(tracks), 4), dtype=np.float32)
+    boxes_xywh[:, 0] = (tracks[:, 0] + tracks[:, 2]) / 2
+    boxes_xywh[:, 1] = (tracks[:, 1] + tracks[:, 3]) / 2
+    boxes_xywh[:, 2] = tracks[:, 2] - tracks[:, 0]
+    boxes_xywh[:, 3] = tracks[:, 3] - tracks[:, 1]
+    return boxes_xywh, tracks[:, 4].astype(np.int32), tracks[:, 6].astype(np.int32)
+
+
+# Process-wide singleton, built on first use
+_model_pool = None
+_model_pool_lock = threading.Lock()
+
+
+def model_pool_ready() -> bool:
+    """Whether the pool has been built (without building it)."""
+    return _model_pool is not None
+
+
+def get_model_pool() -> ModelPool:
+    global _model_pool
+    if _model_pool is None:
+        with _model_pool_lock:
+            if _model_pool is None:
+                _model_pool = ModelPool()
+    return _model_pool
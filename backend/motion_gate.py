@@ -0,0 +1,64 @@
+import logging
+import os
+
+import cv2
+import numpy as np
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Motion gate settings (override via environment)
+# Opt-in: skipping detection on static frames is approximate and can change report counts
+MOTION_GATE_ENABLED = os.getenv("MOTION_GATE", "0") == "1"
+MOTION_GATE_THRESHOLD = float(os.getenv("MOTION_GATE_THRESHOLD", "0.002"))  # Share of changed pixels that is motion
+MOTION_GATE_PIXEL_DELTA = 20  # Per-channel change counted as a changed pixel (above sensor / codec noise)
+MOTION_GATE_WIDTH = 160  # Differencing resolution
+MOTION_GATE_MAX_SKIP = int(os.getenv("MOTION_GATE_MAX_SKIP", "15"))  # Re-detect at least every N analysed frames
+
+
+class MotionGate:
+    """
+    Cheap pre-filter deciding whether a frame needs detection.
+
+    Frames are compared, as small blurred images, against the last frame that
+    was sent to the detector (not the previous frame, so slow drift still adds up). When
+    fewer than `threshold` of the pixels changed, the scene is static: detection can be
+    skipped and the previous tracks carried forward. Detection is forced every `max_skip`
+    frames so a static scene is still re-checked.
+    """
+    def __init__(self, threshold: float = MOTION_GATE_THRESHOLD, pixel_delta: int = MOTION_GATE_PIXEL_DELTA,
+                 width: int = MOTION_GATE_WIDTH, max_skip: int = MOTION_GATE_MAX_SKIP):
+        self.threshold = threshold
+        self.pixel_delta = pixel_delta
+        self.width = width
+        self.max_skip = max_skip
+        self._reference = None
+        self._skipped_run = 0
+        self.checked = 0
+        self.skipped = 0
+
+    def _thumbnail(self, frame):
+        h, w = frame.shape[:2]
+        small = cv2.resize(frame, (self.width, max(1, h * self.width // w)), interpolation=cv2.INTER_AREA)
+        # Colour kept: a vehicle can match the road in brightness but not in hue
+        return cv2.GaussianBlur(small, (5, 5), 0)
+
+    def check(self, frame) -> bool:
+        """True if the frame must go through detection."""
+        self.checked += 1
+        thumb = self._thumbnail(frame)
+        if self._reference is not None and self._skipped_run < self.max_skip:
+            diff = cv2.absdiff(thumb, self._reference).max(axis=2)
+            changed = np.count_nonzero(diff > self.pixel_delta)
+            if changed < self.threshold * diff.size:
+                self._skipped_run += 1
+                self.skipped += 1
+                return False
+        self._reference = thumb
+        self._skipped_run = 0
+        return True
+
+    def metrics(self):
+        return {"checked": self.checked, "skipped": self.skipped,
+                "skip_ratio": round(self.skipped / self.checked, 3) if self.checked else 0.0}
@@ -0,0 +1,122 @@
+import logging
+import os
+
+import numpy as np
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Motion model settings (override via environment)
+# Speed / heading used for counting, flow votes and wrong-way decisions: Kalman velocity (1) or history displacement (0)
+KALMAN_KINEMATICS = os.getenv("KALMAN_KINEMATICS", "0") == "1"  # Opt-in until validated on real footage
+# Decode every frame and draw / send Kalman-predicted boxes on the ones between analysed frames
+INTERPOLATE_FRAMES = os.getenv("INTERPOLATE_FRAMES", "0") == "1"
+KALMAN_PROCESS_NOISE = float(os.getenv("KALMAN_PROCESS_NOISE", "0.002"))  # Acceleration noise, (px/frame^2)^2 per frame
+KALMAN_MEASUREMENT_NOISE = float(os.getenv("KALMAN_MEASUREMENT_NOISE", "4.0"))  # Box-center variance, px^2
+KALMAN_INITIAL_VELOCITY_VAR = 25.0  # (px/frame)^2: a new track may move in any direction
+# Velocities within this many standard deviations of zero are jitter, not motion
+KALMAN_MOTION_SIGMA = float(os.getenv("KALMAN_MOTION_SIGMA", "2.5"))
+# Innovations beyond this many standard deviations are an identity switch, not motion: the slot restarts
+KALMAN_GATE_SIGMA = float(os.getenv("KALMAN_GATE_SIGMA", "5.0"))
+
+
+class KalmanTracks:
+    """
+    Constant-velocity Kalman filter of box centers for every TrackStore slot.
+
+    State per slot is position and velocity (px per source frame). x and y follow the
+    same model with the same noise, so they share one 2x2 covariance, kept as three
+    arrays; predict and update are then closed-form and run for all of a frame's
+    tracks at once. Steps are in source frames, so any sampling step (fixed, adaptive
+    or none) is handled by the same filter.
+    """
+    def __init__(self, capacity: int, process_noise: float = KALMAN_PROCESS_NOISE,
+                 measurement_noise: float = KALMAN_MEASUREMENT_NOISE, gate_sigma: float = KALMAN_GATE_SIGMA):
+        self.q = process_noise
+        self.r = measurement_noise
+        self.gate = gate_sigma
+        self.restarts = 0
+        self.position = np.empty((0, 2), dtype=np.float64)
+        self.velocity = np.empty((0, 2), dtype=np.float64)
+        self.p00 = np.empty(0, dtype=np.float64)  # Position variance
+        self.p01 = np.empty(0, dtype=np.float64)  # Position / velocity covariance
+        self.p11 = np.empty(0, dtype=np.float64)  # Velocity variance
+        self.frame = np.empty(0, dtype=np.int64)  # Source frame of the last update
+        self.initialised = np.empty(0, dtype=np.bool_)
+        self.grow(capacity)
+
+    def grow(self, capacity: int):
+        extra = capacity - len(self.frame)
+        self.position = np.concatenate([self.position, np.zeros((extra, 2))])
+        self.velocity = np.concatenate([self.velocity, np.zeros((extra, 2))])
+        for name in ("p00", "p01", "p11"):
+            setattr(self, name, np.concatenate([getattr(self, name), np.zeros(extra)]))
+        self.frame = np.concatenate([self.frame, np.zeros(extra, dtype=np.int64)])
+        self.initialised = np.concatenate([self.initialised, np.zeros(extra, dtype=np.bool_)])
+
+    def forget(self, slot: int):
+        """The slot starts a new track: its next measurement initialises the filter."""
+        self.initialised[slot] = False
+
+    def update(self, slots, centers, frame_idx: int):
+        """
+        Predict every slot to frame_idx and correct it with its measured center.
+
+        Returns:
+            (positions, velocities) - filtered (N, 2) arrays, velocities in px per source frame
+        """
+        new = ~self.initialised[slots]
+        if self.gate > 0 and not new.all():
+            # Measurements far outside the predicted uncertainty (the tracker handed the ID
+            # to another vehicle) would drag the velocity for many frames: start over instead
+            old = slots[~new]
+            dt = (frame_idx - self.frame[old]).astype(np.float64)
+            spread = self.p00[old] + 2 * dt * self.p01[old] + dt * dt * self.p11[old] + self.q * dt ** 3 / 3 + self.r
+            innovation = centers[~new] - (self.position[old] + self.velocity[old] * dt[:, None])
+            jumped = (innovation ** 2).sum(axis=1) > self.gate ** 2 * 2 * spread
+            if jumped.any():
+                new[np.flatnonzero(~new)[jumped]] = True
+                self.restarts += int(jumped.sum())
+        if new.any():
+            fresh = slots[new]
+            self.position[fresh] = centers[new]
+            self.velocity[fresh] = 0.0
+            self.p00[fresh] = self.r
+            self.p01[fresh] = 0.0
+            self.p11[fresh] = KALMAN_INITIAL_VELOCITY_VAR
+            self.frame[fresh] = frame_idx
+            self.initialised[fresh] = True
+
+        old = slots[~new]
+        if len(old):
+            dt = (frame_idx - self.frame[old]).astype(np.float64)
+            # Predict: x' = x + v dt, P' = F P F^T + Q (white-noise acceleration)
+            p00 = self.p00[old] + 2 * dt * self.p01[old] + dt * dt * self.p11[old] + self.q * dt ** 3 / 3
+            p01 = self.p01[old] + dt * self.p11[old] + self.q * dt * dt / 2
+            p11 = self.p11[old] + self.q * dt
+            predicted = self.position[old] + self.velocity[old] * dt[:, None]
+            # Correct with the measured center
+            gain_p = p00 / (p00 + self.r)
+            gain_v = p01 / (p00 + self.r)
+            innovation = centers[~new] - predicted
+            self.position[old] = predicted + gain_p[:, None] * innovation
+            self.velocity[old] += gain_v[:, None] * innovation
+            self.p00[old] = (1 - gain_p) * p00
+            self.p01[old] = (1 - gain_p) * p01
+            self.p11[old] = p11 - gain_v * p01
+            self.frame[old] = frame_idx
+        return self.position[slots], self.velocity[slots]
+
+    def still(self, slots, sigma: float = KALMAN_MOTION_SIGMA):
+        """
+        Mask of slots whose filtered velocity is not distinguishable from zero. A parked
+        vehicle's jitter leaves a small velocity in a random direction, which must not
+        count as a speed or a heading.
+        """
+        return (self.velocity[slots] ** 2).sum(axis=1) <= sigma ** 2 * self.p11[slots]
+
+    def predict(self, slots, frame_idx: int):
+        """(N, 2) predicted centers at frame_idx; the filter state is not changed."""
+        dt = (frame_idx - self.frame[slots]).astype(np.float64)
+        return self.position[slots] + self.velocity[slots] * dt[:, None]
@@ -0,0 +1,288 @@
+import asyncio
+import concurrent.futures
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from model_pool import MODEL_POOL_SIZE
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+RESULT_QUEUE_SIZE = 32  # Frames buffered between the executor and the event loop
+STAGE_QUEUE_SIZE = 8  # Frames buffered between pipeline stages (prefetch depth)
+LIVE_STAGE_QUEUE_SIZE = 1  # Live sources: never queue more than the frame being waited for
+
+# Dedicated threads for per-frame work; one per model worker since each job holds a worker
+INFERENCE_EXECUTOR = ThreadPoolExecutor(max_workers=MODEL_POOL_SIZE, thread_name_prefix="inference")
+
+
+class PipelineStopped(Exception):
+    """Raised inside the executor when the consumer went away and the job must stop."""
+
+
+class AsyncResultQueue:
+    """
+    Bounded bridge from a worker thread to the asyncio event loop.
+    The producer blocks (backpressure) while the queue is full, but wakes up
+    periodically so a stopped consumer never leaves the thread hanging.
+    """
+    _END = object()
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, maxsize: int = RESULT_QUEUE_SIZE):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.stop_event = threading.Event()
+
+    # -- Producer side (worker thread) --
+    def put(self, item):
+        future = asyncio.run_coroutine_threadsafe(self.queue.put(item), self.loop)
+        while True:
+            try:
+                return future.result(timeout=0.1)
+            except concurrent.futures.TimeoutError:
+                if self.stop_event.is_set():
+                    future.cancel()
+                    raise PipelineStopped()
+
+    def close(self):
+        try:
+            self.put(self._END)
+        except PipelineStopped:
+            pass
+
+    @property
+    def stopped(self):
+        return self.stop_event.is_set()
+
+    # -- Consumer side (event loop) --
+    async def get(self):
+        """Returns the next item, or None once the producer has closed the queue."""
+        item = await self.queue.get()
+        return None if item is self._END else item
+
+    def stop(self):
+        self.stop_event.set()
+
+    def qsize(self):
+        return self.queue.qsize()
+
+
+class Stage:
+    """
+    One step of a StagedPipeline: `fn(item) -> item` applied to everything in its inbox.
+    Returning None drops the item. Tracks busy time and inbox depth for bottleneck analysis.
+
+    With batch_size > 1 the stage collects up to batch_size items (waiting at most
+    max_latency_s after the first one) and calls `fn(items) -> items` once per batch.
+    """
+    def __init__(self, name: str, fn, maxsize: int = STAGE_QUEUE_SIZE, batch_size: int = 1, max_latency_s: float = 0.0):
+        self.name = name
+        self.fn = fn
+        self.batch_size = max(1, batch_size)
+        self.max_latency_s = max_latency_s
+        self.inbox = queue.Queue(maxsize=maxsize if self.batch_size == 1 else max(maxsize, 2 * self.batch_size))
+        self.count = 0
+        self.batches = 0
+        self.busy_s = 0.0
+        self.max_depth = 0
+
+    def process(self, item):
+        self.max_depth = max(self.max_depth, self.inbox.qsize())
+        start = time.perf_counter()
+        result = self.fn(item)
+        self.busy_s += time.perf_counter() - start
+        self.count += len(item) if self.batch_size > 1 else 1
+        self.batches += 1
+        return result
+
+    def stats(self, wall_s: float):
+        return {
+            "frames": self.count,
+            "avg_ms": round(self.busy_s / self.count * 1000, 2) if self.count else 0.0,
+            "busy_pct": round(self.busy_s / wall_s * 100, 1) if wall_s > 0 else 0.0,
+            "queue": self.inbox.qsize(),
+            "queue_max": self.max_depth,
+            "avg_batch": round(self.count / self.batches, 2) if self.batches else 0.0,
+        }
+
+
+class StagedPipeline:
+    """
+    Runs a source iterator and a chain of Stages concurrently, connected by bounded queues
+    (same throttling model as AsyncVideoWriter). The source and every stage except the last
+    get their own thread; the last stage runs on the calling thread, so the executor thread
+    that drives the pipeline is the one feeding the event loop.
+
+    The first exception raised by any stage stops the whole pipeline and is re-raised by run().
+
+    With drop_stale=True (live sources) the source never waits for the first stage: a new
+    item replaces one still queued, and the replaced items are counted in `dropped`.
+    """
+    _END = object()
+
+    def __init__(self, name: str, source, stages, stop_event: threading.Event = None, source_name: str = "source",
+                 drop_stale: bool = False):
+        self.name = name
+        self.source = source
+        self.source_name = source_name
+        self.stages = stages
+        self.drop_stale = drop_stale
+        self.dropped = 0
+        self.stop_event = stop_event or threading.Event()
+        self._halt = threading.Event()
+        self._error = None
+        self._source_count = 0
+        self._source_busy_s = 0.0
+        self._start_time = None
+
+    def stopped(self):
+        return self._halt.is_set() or self.stop_event.is_set()
+
+    def _put(self, q, item):
+        while not self.stopped():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _put_latest(self, q, item):
+        """Non-blocking put that evicts the queued (stale) item when the queue is full."""
+        while not self.stopped():
+            try:
+                q.put_nowait(item)
+                return True
+            except queue.Full:
+                try:
+                    q.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+        return False
+
+    def _get(self, q):
+        while not self.stopped():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return self._END
+
+    def _collect_batch(self, stage, first):
+        """Gather up to stage.batch_size items; returns (batch, reached_end)."""
+        batch = [first]
+        deadline = time.perf_counter() + stage.max_latency_s
+        while len(batch) < stage.batch_size and not self.stopped():
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = stage.inbox.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is self._END:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _fail(self, stage_name, error):
+        if self._error is None:
+            logger.error(f"{self.name}: stage '{stage_name}' failed: {error}", exc_info=True)
+            self._error = error
+        self._halt.set()
+
+    def _run_source(self, outbox):
+        try:
+            iterator = iter(self.source)
+            while not self.stopped():
+                start = time.perf_counter()
+                item = next(iterator, self._END)
+                self._source_busy_s += time.perf_counter() - start
+                if item is self._END:
+                    break
+                self._source_count += 1
+                put = self._put_latest if self.drop_stale else self._put
+                if not put(outbox, item):
+                    break
+        except PipelineStopped:
+            self._halt.set()
+        except Exception as e:
+            self._fail(self.source_name, e)
+        finally:
+            self._put(outbox, self._END)
+
+    def _run_stage(self, stage, outbox):
+        try:
+            while True:
+                item = self._get(stage.inbox)
+                if item is self._END:
+                    break
+                if stage.batch_size == 1:
+                    result = stage.process(item)
+                    if result is not None and outbox is not None:
+                        if not self._put(outbox, result):
+                            break
+                    continue
+
+                batch, reached_end = self._collect_batch(stage, item)
+                results = stage.process(batch) or []
+                if outbox is not None:
+                    if not all(self._put(outbox, r) for r in results if r is not None):
+                        break
+                if reached_end:
+                    break
+        except PipelineStopped:
+            self._halt.set()
+        except Exception as e:
+            self._fail(stage.name, e)
+        finally:
+            if outbox is not None:
+                self._put(outbox, self._END)
+
+    def run(self):
+        """Blocks until the source is exhausted or the pipeline is stopped."""
+        self._start_time = time.perf_counter()
+        threads = [threading.Thread(target=self._run_source, args=(self.stages[0].inbox,),
+                                    daemon=True, name=f"{self.name}-{self.source_name}")]
+        for stage, nxt in zip(self.stages[:-1], self.stages[1:]):
+            threads.append(threading.Thread(target=self._run_stage, args=(stage, nxt.inbox),
+                                            daemon=True, name=f"{self.name}-{stage.name}"))
+        for t in threads:
+            t.start()
+
+        self._run_stage(self.stages[-1], None)
+        # Unblock upstream threads if the last stage exited early
+        self._halt.set()
+        for t in threads:
+            t.join(timeout=5.0)
+
+        if self._error is not None:
+            raise self._error
+
+    def stats(self):
+        wall_s = time.perf_counter() - self._start_time if self._start_time else 0.0
+        source_count = self._source_count
+        result = {
+            self.source_name: {
+                "frames": source_count,
+                "avg_ms": round(self._source_busy_s / source_count * 1000, 2) if source_count else 0.0,
+                "busy_pct": round(self._source_busy_s / wall_s * 100, 1) if wall_s > 0 else 0.0,
+            }
+        }
+        if self.drop_stale:
+            result[self.source_name]["dropped"] = self.dropped
+        for stage in self.stages:
+            result[stage.name] = stage.stats(wall_s)
+        result["bottleneck"] = max(result, key=lambda k: result[k]["busy_pct"])
+        return result
+
+
+def run_in_executor(fn, *args):
+    """Schedule blocking per-frame work on the dedicated inference executor."""
+    loop = asyncio.get_running_loop()
+    return loop.run_in_executor(INFERENCE_EXECUTOR, fn, *args)
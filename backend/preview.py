@@ -0,0 +1,131 @@
+import logging
+import math
+import os
+import threading
+import time
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Preview budget (override via environment)
+PREVIEW_TARGET_KBPS = float(os.getenv("PREVIEW_TARGET_KBPS", "4000"))  # Preview bandwidth per job
+PREVIEW_CPU_SHARE = float(os.getenv("PREVIEW_CPU_SHARE", "0.1"))  # Share of processing time spent on JPEG encoding
+PREVIEW_MAX_FPS = float(os.getenv("PREVIEW_MAX_FPS", "10"))  # More previews per second do not help a dashboard
+PREVIEW_DEFAULT_INTERVAL = 10  # Analysed frames between previews until rates are measured
+PREVIEW_MAX_INTERVAL = 60
+PREVIEW_SLOW_SEND_MS = 40.0  # Preview sends slower than this mean the client link is the limit
+# (resolution scale, JPEG quality) from best to cheapest; starts at the historical 640px / q50
+PREVIEW_LEVELS = ((1.0, 70), (1.0, 50), (0.75, 50), (0.75, 35), (0.5, 35))
+PREVIEW_START_LEVEL = 1
+PREVIEW_LEVEL_HOLD = 5  # Previews between quality level changes
+EWMA_ALPHA = 0.3
+
+
+def _ewma(current, sample):
+    return sample if current is None else current + EWMA_ALPHA * (sample - current)
+
+
+class PreviewController:
+    """
+    Decides which analysed frames get a JPEG preview, and at what size and quality.
+
+    Inputs are the processing rate and JPEG encode cost (from the annotate stage) and
+    how long preview messages take to send (from the WebSockets relaying the job).
+    The interval is the smallest that keeps preview bandwidth under the target (or
+    the client's measured throughput, when sends are slow) and encoding under its
+    CPU share; when that pushes the interval far past the PREVIEW_MAX_FPS minimum the
+    level drops to a smaller / lower quality JPEG, and climbs back once there is room.
+    """
+    def __init__(self, target_kbps: float = PREVIEW_TARGET_KBPS, cpu_share: float = PREVIEW_CPU_SHARE,
+                 max_fps: float = PREVIEW_MAX_FPS):
+        self.target_bytes_per_s = target_kbps * 1000 / 8
+        self.cpu_share = cpu_share
+        self.max_fps = max_fps
+        self.interval = PREVIEW_DEFAULT_INTERVAL
+        self.level = PREVIEW_START_LEVEL
+        self._lock = threading.Lock()
+        self._since_preview = None  # None: the next frame gets a preview
+        self._since_level_change = 0
+        self._last_frame_at = None
+        self._frame_period = None  # EWMA seconds per analysed frame
+        self._encode_s = None  # EWMA JPEG encode seconds
+        self._jpeg_bytes = None  # EWMA preview size
+        self._send_s = None  # EWMA preview send seconds
+        self._send_bytes_per_s = None  # EWMA client throughput while sending previews
+
+    @property
+    def scale(self):
+        return PREVIEW_LEVELS[self.level][0]
+
+    @property
+    def quality(self):
+        return PREVIEW_LEVELS[self.level][1]
+
+    def should_preview(self) -> bool:
+        """Called once per analysed frame (annotate stage)."""
+        now = time.perf_counter()
+        with self._lock:
+            if self._last_frame_at is not None:
+                self._frame_period = _ewma(self._frame_period, now - self._last_frame_at)
+            self._last_frame_at = now
+            if self._since_preview is not None and self._since_preview + 1 < self.interval:
+                self._since_preview += 1
+                return False
+            self._since_preview = 0
+            return True
+
+    def record_encode(self, seconds: float, nbytes: int):
+        with self._lock:
+            self._encode_s = _ewma(self._encode_s, seconds)
+            self._jpeg_bytes = _ewma(self._jpeg_bytes, nbytes)
+            self._adjust()
+
+    def record_send(self, seconds: float, nbytes: int):
+        """Send time of a preview message on one of the job's WebSockets."""
+        with self._lock:
+            self._send_s = _ewma(self._send_s, seconds)
+            self._send_bytes_per_s = _ewma(self._send_bytes_per_s, nbytes / max(seconds, 1e-6))
+
+    def _bandwidth_budget(self):
+        budget = self.target_bytes_per_s
+        if self._send_s is not None and self._send_s * 1000 > PREVIEW_SLOW_SEND_MS:
+            budget = min(budget, 0.8 * self._send_bytes_per_s)
+        return budget
+
+    def _adjust(self):
+        if self._frame_period is None:
+            return
+        fps = 1.0 / max(self._frame_period, 1e-6)
+        min_interval = max(1, math.ceil(fps / self.max_fps))
+        # Load if every frame carried a preview, as a multiple of the budget
+        load = max(self._jpeg_bytes * fps / self._bandwidth_budget(),
+                   self._encode_s * fps / self.cpu_share)
+        self.interval = min(max(min_interval, math.ceil(load)), PREVIEW_MAX_INTERVAL)
+
+        self._since_level_change += 1
+        if self._since_level_change < PREVIEW_LEVEL_HOLD:
+            return
+        if load > 3 * min_interval and self.level < len(PREVIEW_LEVELS) - 1:
+            self._set_level(self.level + 1, load, min_interval)
+        elif 2 * load < min_interval and self.level > 0:
+            # Roughly doubling the JPEG size would still fit at the fastest rate
+            self._set_level(self.level - 1, load, min_interval)
+
+    def _set_level(self, level, load, min_interval):
+        self.level = level
+        self._since_level_change = 0
+        # Size and encode time are per level; start measuring afresh
+        self._jpeg_bytes = self._encode_s = None
+        logger.info(f"Preview level -> {PREVIEW_LEVELS[level]} (load {load:.1f}, min interval {min_interval})")
+
+    def state(self):
+        """Current decisions, for the frame payload."""
+        with self._lock:
+            return {
+                "interval": self.interval,
+                "scale": self.scale,
+                "quality": self.quality,
+                "fps": round(1.0 / self._frame_period, 1) if self._frame_period else None,
+                "send_ms": round(self._send_s * 1000, 1) if self._send_s is not None else None,
+            }
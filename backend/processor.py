@@ -1,16 +1,34 @@
 import cv2
 import numpy as np
-from ultralytics import YOLO
 import math
-from collections import defaultdict, deque, OrderedDict
-import base64
+from collections import defaultdict
 import logging
 import os
 import threading
 import queue
 import time
 import asyncio
-from cloud_storage import cloud_storage
+import functools
+from concurrent.futures.process import BrokenProcessPool
+from model_pool import (get_model_pool, create_tracker, unpack_tracks, unpack_tracker_output,
+                        TRACKER_CONFIG, VEHICLE_CLASS_IDS, TRACK_CONFIDENCE)
+from frame_source import FrameSampler, LatestFrameReader, resize_to_width, frame_count
+from detection_cache import get_detection_cache, file_content_hash
+from upload_manager import get_upload_manager
+from sharding import (SHARD_WORKERS, get_shard_executor, shutdown_shard_executor, plan_segments, track_segment,
+                      stitch_segments)
+from track_store import TrackStore, SPEED_SCALE
+from direction_flow import DirectionFlow
+from preview import PreviewController
+from motion_gate import MotionGate, MOTION_GATE_ENABLED, MOTION_GATE_THRESHOLD
+from adaptive_skip import AdaptiveSkip, ADAPTIVE_SKIP_ENABLED, CANDIDATE_ANGLE_DIFF
+from motion_model import INTERPOLATE_FRAMES
+from violation_clips import ViolationClips, VIOLATION_CLIPS_ENABLED
+from video_encoder import open_video_writer, segment_playlist
+from storage import get_storage
+from analytics_store import get_analytics_store, stream_name
+from pipeline import (AsyncResultQueue, Stage, StagedPipeline, run_in_executor,
+                      STAGE_QUEUE_SIZE, LIVE_STAGE_QUEUE_SIZE)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -25,6 +43,10 @@ WRONG_WAY_ANGLE_DIFF = 120
 FLOW_SMOOTHING_ALPHA = 0.05
 DISPLAY_WIDTH = 640
 VIOLATION_COOLDOWN = 30 # Hysteresis frames
+STATIONARY_THRESHOLD = 5.0 # Max speed below which a counted vehicle is reported as stationary
+INFERENCE_BATCH_SIZE = int(os.getenv("INFERENCE_BATCH_SIZE", "1")) # Frames per model call
+BATCH_MAX_LATENCY_MS = float(os.getenv("BATCH_MAX_LATENCY_MS", "100")) # Max wait to fill a batch
+WRITER_STOP_TIMEOUT_S = 120 # Max wait for the video writer to finish its outputs at the end of a job
 
 class AsyncVideoWriter:
     """
@@ -75,25 +97,40 @@ class AsyncVideoWriter:
     def stop(self):
         self.running = False
         if self.thread.is_alive():
-            self.thread.join(timeout=2.0)
+            # Queued frames are drained and outputs finished (ffmpeg faststart) before the file is used
+            self.thread.join(timeout=WRITER_STOP_TIMEOUT_S)
 
 class VideoProcessor:
-    def __init__(self):
-        logger.info("Initializing VideoProcessor with High-Performance configuration...")
-        # Using Nano model (n) for extreme speed as requested
-        self.model = YOLO('yolov8n.pt') 
+    """
+    Per-job analysis state (tracks, directions, stats).
+    Model weights are borrowed from the shared ModelPool for the duration of a job,
+    so constructing a VideoProcessor is cheap.
+    """
+    def __init__(self, model_pool=None, batch_size: int = INFERENCE_BATCH_SIZE,
+                 batch_max_latency_ms: float = BATCH_MAX_LATENCY_MS, detection_cache=None,
+                 motion_gate: bool = MOTION_GATE_ENABLED, adaptive_skip: bool = ADAPTIVE_SKIP_ENABLED,
+                 violation_clips: bool = VIOLATION_CLIPS_ENABLED, interpolate: bool = INTERPOLATE_FRAMES):
+        # Shared, pre-warmed weights; looked up when the first job starts (see _load_model_pool),
+        # so constructing a processor never waits for a model that is still loading
+        self._model_pool = model_pool
         
-        # Async I/O Handler
-        self.async_writer = AsyncVideoWriter()
+        # Tracking output of earlier runs, replayed when only the direction settings change
+        self.detection_cache = detection_cache if detection_cache is not None else get_detection_cache()
         
-        self.CLASS_NAMES = {2: "Car", 3: "Motorcycle", 5: "Bus", 7: "Truck"}
+        # Frames per model call; 1 keeps the per-frame model.track() path
+        self.batch_size = max(1, batch_size)
+        self.batch_max_latency_ms = batch_max_latency_ms
         
-        # Optimized State Stores
-        self.track_history = defaultdict(lambda: deque(maxlen=TRACK_HISTORY_LEN))
+        # Skip detection on frames where nothing moved, carrying the previous tracks forward
+        self.motion_gating = motion_gate
+        # Sample slow / empty scenes sparsely and fast or suspicious ones densely (file and live jobs)
+        self.adaptive_skip = adaptive_skip
+        # Short video of every violation, cut from a ring of recent annotated frames
+        self.violation_clips = violation_clips
+        # File jobs: every frame is output, with Kalman-predicted boxes between analysed frames
+        self.interpolate = interpolate
         
-        # O(1) Lookup for recent directions using OrderedDict as LRU cache
-        self.recent_track_directions = OrderedDict() 
-        self.MAX_DIRECTION_HISTORY = 100
+        self.CLASS_NAMES = {2: "Car", 3: "Motorcycle", 5: "Bus", 7: "Truck"}
         
         # Stats & State
         self.reset_stats()
@@ -101,9 +138,26 @@ class VideoProcessor:
         # Pre-allocate reuse headers for optimization
         self.font = cv2.FONT_HERSHEY_SIMPLEX
         
-        logger.info("VideoProcessor optimized and ready.")
+    @property
+    def model_pool(self):
+        if self._model_pool is None:
+            self._model_pool = get_model_pool()
+        return self._model_pool
+
+    async def _load_model_pool(self):
+        """
+        Resolves the shared pool off the event loop. After a lazy or background start
+        (MODEL_LOAD), the first job waits here for the model to finish loading.
+        """
+        if self._model_pool is None:
+            self._model_pool = await asyncio.to_thread(get_model_pool)
 
     def reset_stats(self):
+        # Array-backed history, kinematics and hysteresis state of every track
+        self.tracks = TrackStore(TRACK_HISTORY_LEN, frame_step=SKIP_FRAMES)
+        self.motion_gate = MotionGate() if self.motion_gating else None
+        self.frame_skip = AdaptiveSkip(SKIP_FRAMES) if self.adaptive_skip else None
+        
         self.stats = {
             "total_vehicles": set(),
             "forward_vehicles": set(),
@@ -112,313 +166,870 @@ class VideoProcessor:
             "violated_vehicles": set(),
             "violation_details": []
         }
-        self.vehicle_max_speeds = {}
         self.vehicle_classes = {}
-        self.violation_timers = {} # id -> frames
-        self.frame_buffer = deque(maxlen=60)
+        # Results persisted to the analytics store (see _start_recording) and each track's [first, last] time
+        self.recorder = None
+        self.track_spans = {}
+        # Report contributions of expired tracks, whose per-track state has been dropped
+        self.report_totals = {
+            "total": 0, "forward": 0, "backward": 0, "stationary": 0, "violations": 0,
+            "speed_sum": 0.0, "speed_count": 0, "class_breakdown": defaultdict(int),
+        }
 
-    def _calculate_majority_direction(self):
-        if len(self.recent_track_directions) < 3:
-            return None
-        
-        # Vectorized histogram calculation using numpy
-        angles = np.array(list(self.recent_track_directions.values()))
-        # Sector calculation: (angle + 22.5) // 45 % 8
-        sectors = ((angles + 22.5) // 45).astype(int) % 8
-        counts = np.bincount(sectors, minlength=8)
-        max_sector = counts.argmax()
-        return float(max_sector * 45)
+    def _start_recording(self, name: str, kind: str = "file"):
+        """Persists this job's per-track summaries, violations and flow counts (unless analytics are off)."""
+        store = get_analytics_store()
+        self.recorder = store.record(name, kind) if store is not None else None
 
     def _add_timestamp(self, img, ts):
-        # Mutate copy strictly needed for I/O
-        img_copy = img.copy() 
+        # In place: the annotate stage is done with the clean frame by now (preview already encoded)
         # Time
-        cv2.putText(img_copy, f"Time: {ts:.1f}s", (10, 30), 
+        cv2.putText(img, f"Time: {ts:.1f}s", (10, 30), 
                    self.font, 0.7, (255, 255, 255), 2)
         # Turbo Indicator
-        cv2.putText(img_copy, "TURBO CORE", (img_copy.shape[1] - 150, 30), 
+        cv2.putText(img, "TURBO CORE", (img.shape[1] - 150, 30), 
                    self.font, 0.6, (0, 255, 255), 2) # Yellow/Cyan
-        return img_copy
+        return img
 
-    async def process_video(self, video_path: str, manual_direction: float = None):
+    async def process_video(self, video_path: str, manual_direction: float = None, preview: PreviewController = None):
+        """
+        `preview` paces the JPEG previews; pass one to feed it the send times of the
+        connections relaying this job (see PreviewController.record_send).
+        """
         logger.info(f"Processing: {video_path}")
-        cap = cv2.VideoCapture(video_path)
-        
-        # Metadata
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        base_video_name = os.path.splitext(os.path.basename(video_path))[0]
-        
-        # Directories
-        VIOLATIONS_DIR = "generated_violations"
-        PROCESSED_DIR = "processed_videos"
-        os.makedirs(VIOLATIONS_DIR, exist_ok=True)
-        os.makedirs(PROCESSED_DIR, exist_ok=True)
-
-        # Full Video Writer
-        input_fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
-        effective_fps = input_fps / SKIP_FRAMES
-        target_frame_time = 1.0 / input_fps # For pacing
-        
-        full_video_path = os.path.join(PROCESSED_DIR, f"processed_{base_video_name}.mp4")
+        await self._load_model_pool()
         
-        # Deferred Initialization
-        full_video_writer = None 
+        # Re-analysis of a known video: skip decode + YOLO and replay the cached tracks
+        cache_key, cached = await self._lookup_cache(video_path, "frames")
+        if cached is not None:
+            async for message in self._process_cached(cached, cache_key, video_path, manual_direction):
+                yield message
+            return
         
-        # Active local violations: {id: {writer, start_ts...}}
-        active_violations = {}
+        # Check out pre-loaded weights; tracker state is reset for this job
+        worker = await asyncio.to_thread(self.model_pool.acquire)
+        async_writer = results_queue = frames_task = None
+        try:
+            base_video_name = os.path.splitext(os.path.basename(video_path))[0]
 
-        self.reset_stats()
-        
+            # Directories
+            VIOLATIONS_DIR = "generated_violations"
+            PROCESSED_DIR = "processed_videos"
+            os.makedirs(VIOLATIONS_DIR, exist_ok=True)
+            os.makedirs(PROCESSED_DIR, exist_ok=True)
+
+            full_video_path = os.path.join(PROCESSED_DIR, f"processed_{base_video_name}.mp4")
+            # HLS segments of the same encode, playable under /processed while the job runs (VIDEO_SEGMENTS)
+            playlist = segment_playlist(full_video_path)
+
+            self.reset_stats()
+            self._start_recording(os.path.basename(video_path))
+
+            # Async I/O Handler (lives for this job only)
+            async_writer = AsyncVideoWriter()
+
+            # Decode, inference and encoding run on the inference executor;
+            # the event loop only relays finished frames from the bounded queue
+            results_queue = AsyncResultQueue(asyncio.get_running_loop())
+            job = {
+                "video_path": video_path,
+                "base_video_name": base_video_name,
+                "full_video_path": full_video_path,
+                "playlist": playlist,
+                "video_playlist": os.path.relpath(playlist, PROCESSED_DIR) if playlist else None,
+                "violations_dir": VIOLATIONS_DIR,
+                "manual_direction": manual_direction,
+                # Per-frame tracking output, stored in the detection cache on success
+                "records": [] if cache_key else None,
+                "preview": preview or PreviewController(),
+            }
+            frames_task = run_in_executor(self._process_frames, worker.model, async_writer, job, results_queue)
+            # Finished HLS segments are uploaded while the job is still running
+            storage = await asyncio.to_thread(get_storage)
+            storage_key = f"processed/processed_{base_video_name}"
+            segment_uploader = storage.segments(playlist, storage_key) if playlist and storage.enabled else None
+        except BaseException:
+            # Setup failed before the job's own cleanup below is in place
+            await self._release_job(worker, async_writer, results_queue, frames_task)
+            if self.recorder is not None:
+                self.recorder.abort()
+            raise
+
+        aborted = False
+        completed = False
+        final_frame_at = None
         try:
-            while cap.isOpened():
-                loop_start_time = time.perf_counter()
-                
-                success, frame = cap.read()
-                if not success: break
+            while True:
+                frame_data = await results_queue.get()
+                if frame_data is None: break
+                yield frame_data
+            final_frame_at = time.perf_counter()
+            await frames_task
+            completed = not results_queue.stopped
+            
+        except (GeneratorExit, asyncio.CancelledError):
+            # Consumer went away: no report to deliver
+            aborted = True
+            raise
+        except Exception as e:
+            logger.error(f"Processing Critical Error: {e}", exc_info=True)
+            raise e
+        finally:
+            await self._release_job(worker, async_writer, results_queue, frames_task)
+            
+            if completed and cache_key and job.get("frame_height"):
+                await asyncio.to_thread(self.detection_cache.put, cache_key, job["records"], 
+                                        job["frame_height"], job["total_frames"])
+            
+            if aborted and segment_uploader:
+                segment_uploader.cancel()
+            if aborted and self.recorder is not None:
+                self.recorder.abort()
+            
+            if not aborted:
+                # Upload processed video (and the rest of its segments) to cloud storage
+                cloud_url = None
+                playlist_url = None
+                upload_latency = None
+                if os.path.exists(full_video_path) and storage.enabled:
+                    # Notify frontend about upload status
+                    yield {"type": "status", "message": "Uploading video to cloud (this may take a moment)..."}
+                    logger.info(f"Uploading processed video to {storage.name} storage...")
+                    # Uploads run on the storage pool; the event loop only awaits them
+                    # This prevents WebSocket timeouts (1006) during large uploads
+                    video_upload = storage.submit(full_video_path, f"{storage_key}.mp4")
+                    if segment_uploader:
+                        playlist_url = await asyncio.to_thread(segment_uploader.finish)
+                    cloud_url = await asyncio.wrap_future(video_upload)
+                    upload_latency = time.perf_counter() - (final_frame_at or time.perf_counter())
+                    storage.record_latency(upload_latency)
+                    if cloud_url:
+                        logger.info(f"Video uploaded successfully: {cloud_url} "
+                                    f"({upload_latency:.1f}s after the final frame)")
+                    else:
+                        logger.error("Failed to upload video; it stays queued for retry")
+                elif segment_uploader:
+                    segment_uploader.cancel()
 
-                # Frame skipping
-                current_frame_idx = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
-                if current_frame_idx % SKIP_FRAMES != 0:
-                    continue
-                
-                # Timestamp
-                current_time = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
-
-                # 1. Resize (CPU bound)
-                h, w = frame.shape[:2]
-                scale = DISPLAY_WIDTH / w
-                new_h = int(h * scale)
-                frame_resized = cv2.resize(frame, (DISPLAY_WIDTH, new_h))
-
-                # Lazy Init Full Writer
-                if full_video_writer is None:
-                    # Use H.264 codec for browser compatibility
-                    # Try avc1 first, fallback to mp4v if not available
-                    try:
-                        fourcc = cv2.VideoWriter_fourcc(*'avc1')
-                        full_video_writer = cv2.VideoWriter(
-                            full_video_path, fourcc, effective_fps, (DISPLAY_WIDTH, new_h)
-                        )
-                        if not full_video_writer.isOpened():
-                            raise Exception("avc1 codec not available")
-                        logger.info("Using H.264 (avc1) codec for video encoding")
-                    except:
-                        logger.warning("H.264 codec not available, falling back to mp4v")
-                        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-                        full_video_writer = cv2.VideoWriter(
-                            full_video_path, fourcc, effective_fps, (DISPLAY_WIDTH, new_h)
-                        )
-
-                # 2. Inference
-                results = self.model.track(frame_resized, persist=True, tracker="bytetrack.yaml", 
-                                         classes=[2, 3, 5, 7], verbose=False)
-
-                # Data Collection
-                frame_data = {
-                    "frame_width": DISPLAY_WIDTH, "frame_height": new_h,
-                    "objects": [], "majority_direction": None,
-                    "current_frame": current_frame_idx, "total_frames": total_frames
-                }
-
-                current_track_ids = set()
-
-                if results[0].boxes.id is not None:
-                    # CPU Unload
-                    boxes_xywh = results[0].boxes.xywh.cpu().numpy()
-                    track_ids = results[0].boxes.id.int().cpu().numpy()
-                    clss = results[0].boxes.cls.int().cpu().numpy()
+                if completed and cache_key and os.path.exists(full_video_path):
+                    # A cache hit on this video later reuses the render instead of reporting no video
+                    render = {"path": full_video_path, "manual_direction": manual_direction,
+                              "cloud_video_url": cloud_url, "cloud_playlist_url": playlist_url,
+                              "video_playlist": job["video_playlist"], "stamp": self._file_stamp(full_video_path)}
+                    await asyncio.to_thread(self.detection_cache.put_render, cache_key, render)
                     
-                    current_track_ids.update(track_ids)
-
-                    # Iterate detections
-                    for i, track_id in enumerate(track_ids):
-                        x, y, w_box, h_box = boxes_xywh[i]
-                        cls_id = int(clss[i])
-                        center = (float(x), float(y))
-                        
-                        # -- State Update --
-                        track = self.track_history[track_id]
-                        track.append(center)
-                        
-                        # Stats
-                        if len(track) >= MIN_TRACK_FRAMES:
-                            self.stats["total_vehicles"].add(track_id)
-                            if track_id not in self.vehicle_classes:
-                                self.vehicle_classes[track_id] = cls_id
-                        
-                        # -- Kinematics --
-                        speed = 0
-                        direction = 0
-                        if len(track) > 2:
-                            dx = center[0] - track[0][0]
-                            dy = center[1] - track[0][1]
-                            dist = math.sqrt(dx*dx + dy*dy)
-                            # Speed Calculation (Normalized)
-                            # dist is total distance covered in len(track) frames
-                            # speed = (pixels / frame) * scalar
-                            px_per_frame = dist / len(track)
-                            speed = px_per_frame * 15 # Arbitrary scalar to map pixel/frame to roughly 0-100 "km/h"
-                            
-                            if speed > MIN_SPEED_THRESHOLD:
-                                direction = math.degrees(math.atan2(dy, dx))
-                                if direction < 0: direction += 360
-                                
-                                # Update Global Direction History (LRU)
-                                if track_id in self.recent_track_directions:
-                                    del self.recent_track_directions[track_id]
-                                self.recent_track_directions[track_id] = direction
-                                if len(self.recent_track_directions) > self.MAX_DIRECTION_HISTORY:
-                                    self.recent_track_directions.popitem(last=False)
-                            
-                            self.vehicle_max_speeds[track_id] = max(self.vehicle_max_speeds.get(track_id, 0), speed)
-
-                        # -- Logic Phase --
-                        frame_data["majority_direction"] = self._calculate_majority_direction()
-                        
-                        # Wrong Way Detection
-                        is_wrong_way = False
-                        target_angle = manual_direction if manual_direction is not None else frame_data["majority_direction"]
-                        
-                        if target_angle is not None and speed > MIN_SPEED_THRESHOLD:
-                             diff = abs(direction - target_angle)
-                             if diff > 180: diff = 360 - diff
-                             
-                             if diff > WRONG_WAY_ANGLE_DIFF:
-                                 is_wrong_way = True
-                                 self.violation_timers[track_id] = VIOLATION_COOLDOWN
-                        
-                        # Hysteresis Check
-                        if not is_wrong_way and self.violation_timers.get(track_id, 0) > 0:
-                            is_wrong_way = True
-                            self.violation_timers[track_id] -= 1
-                            
-                        # Violation State Management
-                        is_new_alert = False
-                        if is_wrong_way:
-                           self._handle_wrong_way(active_violations, track_id, current_time, 
-                                                 current_frame_idx, base_video_name, VIOLATIONS_DIR, new_h)
-                           
-                           if track_id not in self.stats["violated_vehicles"]:
-                               self.stats["violated_vehicles"].add(track_id)
-                               is_new_alert = True 
-
-                           self.stats["backward_vehicles"].add(track_id)
-                           self.stats["forward_vehicles"].discard(track_id)
-                        else:
-                           self.stats["forward_vehicles"].add(track_id)
-                           self.stats["backward_vehicles"].discard(track_id)
-
-                        # -- Visuals (Drawing) --
-                        # Neon Colors (BGR)
-                        NEON_GREEN = (50, 255, 50)
-                        NEON_RED = (20, 20, 255)
-                        
-                        color = NEON_RED if is_wrong_way else NEON_GREEN
-                        
-                        p1 = (int(x - w_box/2), int(y - h_box/2))
-                        p2 = (int(x + w_box/2), int(y + h_box/2))
-                        
-                        cv2.rectangle(frame_resized, p1, p2, color, 2)
-                        
-                        # Label Background
-                        if is_wrong_way: 
-                             label = "WRONG WAY"
-                             (w_text, h_text), _ = cv2.getTextSize(label, self.font, 0.5, 1)
-                             cv2.rectangle(frame_resized, (p1[0], p1[1] - 20), (p1[0] + w_text + 10, p1[1]), color, -1)
-                             
-                             cv2.putText(frame_resized, label, (p1[0] + 5, p1[1] - 5), 
-                                        self.font, 0.5, (255, 255, 255), 1)
-                        
-                        if speed > 2:
-                            end_pos = (int(x + 20 * math.cos(math.radians(direction))), 
-                                      int(y + 20 * math.sin(math.radians(direction))))
-                            cv2.arrowedLine(frame_resized, (int(x), int(y)), end_pos, (255, 255, 0), 2)
-                            
-                        # API Payload
-                        frame_data["objects"].append({
-                            "id": int(track_id),
-                            "box": [float(x), float(y), float(w_box), float(h_box)],
-                            "direction": float(direction),
-                            "is_wrong_way": is_wrong_way,
-                            "is_new_violation": is_new_alert,
-                            "speed": float(speed)
-                        })
-
-                # -- Cleanup Active Violations --
-                self._cleanup_inactive_violations(active_violations, current_track_ids)
-
-                # -- I/O Phase (Async) --
-                # 1. Full Video
-                if full_video_writer:
-                    frame_with_ts = self._add_timestamp(frame_resized, current_time)
-                    self.async_writer.write(full_video_writer, frame_with_ts)
-                
-                # 2. Violation Data Update
-                for tid, v_data in active_violations.items():
-                    v_data["end_time"] = current_time
-                    v_data["end_frame"] = current_frame_idx
-                
-                # 3. Buffer Update
-                self.frame_buffer.append(frame_resized.copy()) 
-
-                # -- Yield to Frontend --
-                # BATCH MODE: Only send preview every 10 frames to maximize processing speed
-                # This fulfills "Process video first" by removing network/encoding latency
-                if current_frame_idx % 10 == 0:
-                    _, buffer = cv2.imencode('.jpg', frame_resized, [int(cv2.IMWRITE_JPEG_QUALITY), 50])
-                    frame_data["image"] = base64.b64encode(buffer).decode('utf-8')
-                
-                # -- Pacing Logic --
-                # Removed artificial delay to allow maximum processing speed analysis
-                # elapsed = time.perf_counter() - loop_start_time
-                # if elapsed < target_frame_time:
-                #     await asyncio.sleep(target_frame_time - elapsed)
-                
-                # Small yield to prevent event loop blocking
-                await asyncio.sleep(0)
+                report = self._generate_final_report(full_video_path, cloud_url)
+                report["summary"]["video_playlist"] = job["video_playlist"]
+                report["summary"]["cloud_playlist_url"] = playlist_url
+                report["summary"]["upload_latency_s"] = round(upload_latency, 2) if upload_latency is not None else None
+                yield report
 
+    async def process_stream(self, source: str, manual_direction: float = None, realtime: bool = False,
+                             preview: PreviewController = None):
+        """
+        Live mode: analyse a camera stream (RTSP/HTTP URL) or a file played back in real time.
+        A reader thread keeps only the newest frame, so when inference falls behind stale frames
+        are dropped instead of queueing up. Every frame message carries capture_time, latency_ms
+        (capture to send) and dropped_frames. No annotated video is recorded.
+
+        Raises:
+            ValueError: If the stream cannot be opened
+        """
+        logger.info(f"Processing stream: {source}")
+        await self._load_model_pool()
+        reader = await asyncio.to_thread(LatestFrameReader, source, realtime)
+        try:
+            worker = await asyncio.to_thread(self.model_pool.acquire)
+        except BaseException:
+            await asyncio.to_thread(reader.stop)
+            raise
+        async_writer = results_queue = None
+        try:
+            self.reset_stats()
+            self._start_recording(os.path.basename(source) if realtime else stream_name(source), "stream")
+            # No full recording for live jobs; the writer only encodes violation clips
+            async_writer = AsyncVideoWriter()
+            results_queue = AsyncResultQueue(asyncio.get_running_loop())
+            job = {
+                "base_video_name": f"stream_{int(reader.started_at)}",
+                "full_video_path": None,
+                "violations_dir": "generated_violations",
+                "manual_direction": manual_direction,
+                "records": None,
+                "reader": reader,
+                "preview": preview or PreviewController(),
+            }
+            frames_task = run_in_executor(self._process_frames, worker.model, async_writer, job, results_queue)
+        except BaseException:
+            # Setup failed before the job's own cleanup below is in place
+            await asyncio.to_thread(reader.stop)
+            await self._release_job(worker, async_writer, results_queue, None)
+            if self.recorder is not None:
+                self.recorder.abort()
+            raise
+        
+        aborted = False
+        try:
+            while True:
+                frame_data = await results_queue.get()
+                if frame_data is None: break
+                frame_data["latency_ms"] = round((time.time() - frame_data["capture_time"]) * 1000, 1)
                 yield frame_data
+            await frames_task
             
+        except (GeneratorExit, asyncio.CancelledError):
+            aborted = True
+            raise
         except Exception as e:
-            logger.error(f"Processing Critical Error: {e}", exc_info=True)
+            logger.error(f"Stream Critical Error: {e}", exc_info=True)
             raise e
         finally:
-            cap.release()
-            if full_video_writer:
-                self.async_writer.release(full_video_writer)
-            for tid, v in active_violations.items():
+            await asyncio.to_thread(reader.stop)
+            await self._release_job(worker, async_writer, results_queue, frames_task)
+            
+            if aborted and self.recorder is not None:
+                self.recorder.abort()
+            if not aborted:
+                report = self._generate_final_report(None)
+                report["dropped_frames"] = self._dropped_frames(job)
+                yield report
+
+    async def _release_job(self, worker, async_writer, results_queue, frames_task):
+        """Stops a job's frame pipeline and returns its pooled worker; parts not yet created are None."""
+        if results_queue is not None:
+            results_queue.stop()
+        if frames_task is not None:
+            try:
+                await asyncio.shield(frames_task)
+            except Exception:
+                pass
+        self.model_pool.release(worker)
+        if async_writer is not None:
+            # Drain pending frames and stop the writer thread so it does not outlive the job
+            await asyncio.to_thread(async_writer.stop)
+
+    def _dropped_frames(self, job):
+        """Live frames never analysed: replaced in the reader, or evicted from the infer queue."""
+        pipeline = job.get("pipeline")
+        return job["reader"].dropped + (pipeline.dropped if pipeline else 0)
+
+    async def process_video_sharded(self, video_path: str, manual_direction: float = None, 
+                                    workers: int = SHARD_WORKERS):
+        """
+        Long-video mode: track time segments in parallel worker processes, stitch track IDs
+        across segment boundaries, then replay the violation logic over the merged tracks.
+        No annotated video is rendered; see sharding.py for the accuracy tolerance.
+        A video that cannot be split (no frame count, or no frames decoded) is processed unsharded.
+        """
+        logger.info(f"Processing (sharded x{workers}): {video_path}")
+        total_frames = await asyncio.to_thread(frame_count, video_path)
+        if total_frames == 0:
+            logger.warning(f"No frame count for {video_path}; processing it unsharded")
+            async for message in self.process_video(video_path, manual_direction):
+                yield message
+            return
+        await self._load_model_pool()
+
+        self.reset_stats()
+        cache_key, cached = await self._lookup_cache(video_path, "sharded")
+        if cached is not None:
+            async for message in self._process_cached(cached, cache_key, video_path, manual_direction):
+                yield message
+            return
+        
+        try:
+            self._start_recording(os.path.basename(video_path))
+            segments = plan_segments(total_frames, workers)
+            yield {"type": "status", "message": f"Analysing {len(segments)} segment(s) in parallel...",
+                   "current_frame": 0, "total_frames": total_frames}
+
+            loop = asyncio.get_running_loop()
+            # Shared with other sharded jobs: segments queue for its processes
+            executor = get_shard_executor(self.model_pool.weights)
+            futures = []
+            try:
+                track = functools.partial(track_segment, motion_gate=self.motion_gating)
+                futures = [loop.run_in_executor(executor, track, video_path, start, end, 
+                                                SKIP_FRAMES, DISPLAY_WIDTH) for start, end in segments]
+                done = 0
+                for finished in asyncio.as_completed(futures):
+                    await finished
+                    done += 1
+                    yield {"type": "status", "message": f"Tracked segment {done}/{len(segments)}",
+                           "current_frame": int(total_frames * done / len(segments)), "total_frames": total_frames}
+                results = [f.result() for f in futures]
+            except BrokenProcessPool:
+                # A tracking process died; the next job gets a fresh pool
+                shutdown_shard_executor(executor)
+                raise
+            finally:
+                # Segments of this job not yet started; running ones finish in the background
+                for f in futures:
+                    f.cancel()
+
+            frame_height = next((r["frame_height"] for r in results if r["frame_height"] is not None), None)
+            if frame_height is None:
+                # The frame count promised frames the decoder never delivered
+                logger.warning(f"No frames decoded from {video_path} in sharded mode; processing it unsharded")
+                if self.recorder is not None:
+                    self.recorder.abort()
+                async for message in self.process_video(video_path, manual_direction):
+                    yield message
+                return
+
+            records = stitch_segments(results)
+            if cache_key:
+                await asyncio.to_thread(self.detection_cache.put, cache_key, records, 
+                                        frame_height, total_frames)
+            job = {
+                "base_video_name": os.path.splitext(os.path.basename(video_path))[0],
+                "violations_dir": "generated_violations",
+                "manual_direction": manual_direction,
+                "total_frames": total_frames,
+                "frame_height": frame_height,
+                "active_violations": {},
+            }
+            await asyncio.to_thread(self._replay_records, records, job)
+            yield self._generate_final_report(None)
+        except (GeneratorExit, asyncio.CancelledError):
+            # Consumer went away: no report to deliver
+            if self.recorder is not None:
+                self.recorder.abort()
+            raise
+        except Exception as e:
+            logger.error(f"Sharded Processing Critical Error: {e}", exc_info=True)
+            if self.recorder is not None:
+                self.recorder.abort()
+            raise
+
+    async def _lookup_cache(self, video_path, mode):
+        """Returns (cache_key, cached entry or None); the key is None when caching is disabled."""
+        if self.detection_cache is None:
+            return None, None
+        # Uploads were hashed while they were received; anything else is hashed now
+        content_hash = await asyncio.to_thread(
+            lambda: get_upload_manager().content_hash(video_path) or file_content_hash(video_path))
+        cache_key = self.detection_cache.key(
+            content_hash, mode=mode, weights=self.model_pool.weights, tracker=TRACKER_CONFIG,
+            classes=VEHICLE_CLASS_IDS, skip="adaptive" if self.adaptive_skip and mode == "frames" else SKIP_FRAMES,
+            width=DISPLAY_WIDTH,
+            motion_gate=MOTION_GATE_THRESHOLD if self.motion_gating else None,
+        )
+        cached = await asyncio.to_thread(self.detection_cache.get, cache_key)
+        return cache_key, cached
+
+    @staticmethod
+    def _file_stamp(path):
+        """(size, mtime) of a file: tells whether a rendered video was overwritten since."""
+        stat = os.stat(path)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    async def _cached_render(self, cache_key):
+        """Render record of the run that filled this cache entry, if its video is still the one on disk."""
+        render = await asyncio.to_thread(self.detection_cache.get_render, cache_key)
+        if render is None:
+            return None
+        try:
+            stamp = await asyncio.to_thread(self._file_stamp, render["path"])
+        except OSError:
+            return None
+        return render if stamp == render["stamp"] else None
+
+    async def _process_cached(self, cached, cache_key, video_path, manual_direction):
+        """
+        Replays kinematics, wrong-way and report stages from cached tracks.
+        The annotated video is not re-rendered: the report points to the one rendered with
+        the cache entry, noting when its overlays were drawn with another direction setting.
+        """
+        total_frames = cached["total_frames"]
+        yield {"type": "status", "message": "Replaying cached detections...",
+               "current_frame": 0, "total_frames": total_frames}
+        self.reset_stats()
+        try:
+            self._start_recording(os.path.basename(video_path))
+            job = {
+                "base_video_name": os.path.splitext(os.path.basename(video_path))[0],
+                "violations_dir": "generated_violations",
+                "manual_direction": manual_direction,
+                "total_frames": total_frames,
+                "frame_height": cached["frame_height"],
+                "active_violations": {},
+            }
+            await asyncio.to_thread(self._replay_records, cached["records"], job)
+            render = await self._cached_render(cache_key)
+            if render is None:
+                yield self._generate_final_report(None)
+                return
+            report = self._generate_final_report(render["path"], render["cloud_video_url"])
+            report["summary"]["video_playlist"] = render["video_playlist"]
+            report["summary"]["cloud_playlist_url"] = render["cloud_playlist_url"]
+            if render["manual_direction"] != manual_direction:
+                report["summary"]["video_note"] = ("Video rendered by an earlier run with a different direction "
+                                                   "setting; its wrong-way overlays may not match this report.")
+            yield report
+        except (GeneratorExit, asyncio.CancelledError):
+            # Consumer went away: no report to deliver
+            if self.recorder is not None:
+                self.recorder.abort()
+            raise
+        except Exception as e:
+            logger.error(f"Cached Replay Critical Error: {e}", exc_info=True)
+            if self.recorder is not None:
+                self.recorder.abort()
+            raise
+
+    def _replay_records(self, records, job):
+        """Runs the per-frame violation logic over pre-computed track records, in frame order."""
+        for frame_idx, current_time, boxes_xywh, track_ids, clss, tracked in records:
+            packet = {"frame_idx": frame_idx, "time": current_time, "frame_height": job["frame_height"]}
+            self._analyze_frame(packet, boxes_xywh, track_ids, clss, job, tracked=tracked)
+        for tid, v in job["active_violations"].items():
+            self._finalize_violation_stats(tid, v)
+        job["active_violations"].clear()
+
+    def _process_frames(self, model, async_writer, job, results_queue):
+        """
+        Blocking per-frame pipeline, run on the inference executor:
+        decode/resize (prefetch thread) -> infer (tracking + violation logic)
+        -> annotate/encode (this thread, feeds results_queue).
+        Live jobs (job["reader"]) capture instead of decoding and drop stale frames between stages.
+        """
+        reader = job.get("reader")
+        live = reader is not None
+        # Live jobs keep only the newest frame, so there is nothing in between to fill in
+        interpolate = self.interpolate and not live
+        if live:
+            cap = None
+            source = self._stream_frames(reader)
+            input_fps, total_frames = reader.fps, None
+        else:
+            cap = cv2.VideoCapture(job["video_path"])
+            source = self._decode_all_frames(cap) if interpolate else self._decode_frames(cap)
+            # Metadata
+            input_fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+            total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        
+        job.update({
+            "model": model,
+            "async_writer": async_writer,
+            "results_queue": results_queue,
+            "total_frames": total_frames,
+            # Source frames per output frame: the video holds analysed frames, or every frame when interpolating
+            "output_step": 1 if interpolate else SKIP_FRAMES,
+            "effective_fps": input_fps / (1 if interpolate else SKIP_FRAMES),
+            # Deferred Initialization
+            "full_video_writer": None,
+            "frames_written": 0,
+            # Active local violations: {id: {start_ts...}}
+            "active_violations": {},
+        })
+        if self.violation_clips and async_writer is not None:
+            # The lead-in ring must span the pre-roll at the densest sampling the job can reach
+            densest_step = job["output_step"]
+            if self.frame_skip is not None:
+                densest_step = min(densest_step, self.frame_skip.min_skip)
+            job["clips"] = ViolationClips(async_writer, open_video_writer, job["violations_dir"],
+                                          job["base_video_name"], job["effective_fps"], job["output_step"],
+                                          frame_rate=input_fps / densest_step)
+        
+        queue_size = LIVE_STAGE_QUEUE_SIZE if live else STAGE_QUEUE_SIZE
+        # With an adaptive skip the decode thread samples at the step the infer stage last chose:
+        # it may only run one frame ahead, so a forced dense step applies to the very next frame
+        infer_queue_size = LIVE_STAGE_QUEUE_SIZE if self.frame_skip is not None else queue_size
+        if self.batch_size > 1 and not live:
+            # Batched detection; this job's tracker replaces the one attached to the model
+            job["tracker"] = create_tracker()
+            infer_stage = Stage("infer", lambda packets: self._infer_batch(packets, job), maxsize=infer_queue_size,
+                                batch_size=self.batch_size, max_latency_s=self.batch_max_latency_ms / 1000.0)
+        else:
+            # Live jobs never batch: waiting to fill a batch is added latency
+            infer_stage = Stage("infer", lambda packet: self._infer_frame(packet, job), maxsize=infer_queue_size)
+        
+        pipeline = StagedPipeline(
+            f"job-{job['base_video_name']}",
+            source,
+            [infer_stage,
+             Stage("annotate", lambda packet: self._annotate_frame(packet, job), maxsize=queue_size)],
+            stop_event=results_queue.stop_event,
+            source_name="capture" if live else "decode",
+            drop_stale=live,
+        )
+        job["pipeline"] = pipeline
+        
+        try:
+            pipeline.run()
+        finally:
+            logger.info(f"Pipeline stats: {pipeline.stats()}")
+            if self.motion_gate is not None:
+                logger.info(f"Motion gate: {self.motion_gate.metrics()}")
+            if self.frame_skip is not None:
+                logger.info(f"Adaptive skip: {self.frame_skip.metrics()}")
+            if cap is not None:
+                cap.release()
+            if job.get("clips") is not None:
+                job["clips"].close_all()
+                logger.info(f"Violation clips: {job['clips'].written}")
+            if job["full_video_writer"]:
+                async_writer.release(job["full_video_writer"])
+            for tid, v in job["active_violations"].items():
                 self._finalize_violation_stats(tid, v)
+            results_queue.close()
+
+    def _decode_frames(self, cap):
+        """Stage 1 (prefetch thread): decode, skip and resize frames ahead of inference."""
+        # Skipped frames are only grabbed (or seeked over), never decoded to BGR
+        sampler = FrameSampler(cap, SKIP_FRAMES)
+        for current_frame_idx, current_time, frame in sampler:
+            # Resize (CPU bound)
+            frame_resized = resize_to_width(frame, DISPLAY_WIDTH)
+            
+            yield {"frame": frame_resized, "frame_idx": current_frame_idx, "time": current_time,
+                   "frame_height": frame_resized.shape[0], "motion": self._has_motion(frame_resized)}
+            # Adaptive skip: the latest analysed frame decides the step to the next one
+            sampler.skip = self._current_skip()
+
+    def _decode_all_frames(self, cap):
+        """
+        Stage 1 when interpolating: every frame is decoded, but only the ones the sampler would
+        return (same frame numbers, fixed or adaptive skip) are marked for analysis.
+        """
+        next_idx = SKIP_FRAMES
+        for current_frame_idx, current_time, frame in FrameSampler(cap, 1):
+            frame_resized = resize_to_width(frame, DISPLAY_WIDTH)
+            analyse = current_frame_idx >= next_idx
+            yield {"frame": frame_resized, "frame_idx": current_frame_idx, "time": current_time,
+                   "frame_height": frame_resized.shape[0], "analyse": analyse,
+                   "motion": analyse and self._has_motion(frame_resized)}
+            if analyse:
+                next_idx = current_frame_idx + self._current_skip()
+
+    def _stream_frames(self, reader):
+        """
+        Stage 1 for live jobs: newest captured frame, resized; time is seconds since the stream opened.
+        Frames are analysed at most every SKIP_FRAMES frames (or the adaptive skip), as in file mode.
+        """
+        last_seq = -SKIP_FRAMES
+        for seq, captured_at, frame in reader:
+            if seq - last_seq < self._current_skip():
+                continue
+            last_seq = seq
+            frame_resized = resize_to_width(frame, DISPLAY_WIDTH)
+            yield {"frame": frame_resized, "frame_idx": seq, "time": captured_at - reader.started_at,
+                   "frame_height": frame_resized.shape[0], "capture_time": captured_at,
+                   "motion": self._has_motion(frame_resized)}
+
+    def _current_skip(self):
+        return SKIP_FRAMES if self.frame_skip is None else self.frame_skip.skip
+
+    def _has_motion(self, frame_resized):
+        """Stage 1: whether the frame needs detection (always, without a motion gate)."""
+        return self.motion_gate is None or self.motion_gate.check(frame_resized)
+
+    def _infer_frame(self, packet, job):
+        """Stage 2: tracking plus kinematics / wrong-way state updates. Drawing is deferred to stage 3."""
+        if not packet.get("analyse", True):
+            return self._predict_frame(packet, job)
+        if not packet["motion"] and "last_tracks" in job:
+            # Static scene: the previous frame's tracks still hold
+            return self._analyze_frame(packet, *job["last_tracks"], job, tracked=False)
+        
+        # Inference
+        results = job["model"].track(packet["frame"], persist=True, tracker=TRACKER_CONFIG, 
+                                     classes=VEHICLE_CLASS_IDS, verbose=False)
+
+        job["last_tracks"] = unpack_tracks(results[0])
+        return self._analyze_frame(packet, *job["last_tracks"], job)
+
+    def _infer_batch(self, packets, job):
+        """
+        Stage 2 (batched): one model.predict over several frames, then the job's own
+        ByteTrack is fed frame by frame in order, exactly as model.track() would.
+        Static frames (motion gate) are left out of the batch and reuse the previous tracks;
+        frames between analysed ones (interpolation) get predicted boxes, in order.
+        """
+        analysed = [p for p in packets if p.get("analyse", True)]
+        # Until the first detection there are no tracks to carry forward
+        detect = {id(p): p["motion"] or (i == 0 and "last_tracks" not in job) for i, p in enumerate(analysed)}
+        if any(detect.values()):
+            frames = [p["frame"] for p in analysed if detect[id(p)]]
+            results = iter(job["model"].predict(frames, conf=TRACK_CONFIDENCE, 
+                                                classes=VEHICLE_CLASS_IDS, verbose=False))
+
+        for packet in packets:
+            if not packet.get("analyse", True):
+                self._predict_frame(packet, job)
+                continue
+            if detect[id(packet)]:
+                result = next(results)
+                # tracks: [x1, y1, x2, y2, id, score, cls, idx]
+                tracks = job["tracker"].update(result.boxes.cpu().numpy(), result.orig_img)
+                job["last_tracks"] = unpack_tracker_output(tracks)
+            self._analyze_frame(packet, *job["last_tracks"], job, tracked=detect[id(packet)])
+        return packets
+
+    def _analyze_frame(self, packet, boxes_xywh, track_ids, clss, job, tracked: bool = True):
+        """
+        Kinematics, direction flow and wrong-way state for one frame's tracked detections.
+        `tracked` is False when the tracker did not run for this frame (its tracks are reused).
+        """
+        if tracked:
+            self.tracks.advance()
+        current_frame_idx = packet["frame_idx"]
+        current_time = packet["time"]
+        new_h = packet["frame_height"]
+        job["frame_height"] = new_h
+        manual_direction = job["manual_direction"]
+        active_violations = job["active_violations"]
+
+        # Data Collection
+        frame_data = {
+            "frame_width": DISPLAY_WIDTH, "frame_height": new_h,
+            "objects": [], "majority_direction": None, "flows": [],
+            "current_frame": current_frame_idx, "total_frames": job["total_frames"]
+        }
+        if "capture_time" in packet:
+            frame_data["capture_time"] = packet["capture_time"]
+
+        current_track_ids = set()
+        packet["violations_started"] = []  # (track id, clip name, writer), for the annotate stage
+        
+        if job.get("records") is not None:
+            if track_ids is None:
+                job["records"].append((current_frame_idx, current_time, np.empty((0, 4), np.float32),
+                                       np.empty(0, np.int32), np.empty(0, np.int32), tracked))
+            else:
+                job["records"].append((current_frame_idx, current_time, boxes_xywh, track_ids, clss, tracked))
+
+        if track_ids is not None and len(track_ids):
+            ids = track_ids.tolist()
+            current_track_ids.update(ids)
+            boxes = np.asarray(boxes_xywh, dtype=np.float64)
+
+            # -- State Update & Kinematics (all detections at once) --
+            slots, lengths, speeds, directions = self.tracks.update(ids, boxes[:, :2], MIN_SPEED_THRESHOLD,
+                                                                   current_frame_idx)
+            self._expire_tracks()
+            if self.recorder is not None:
+                for tid in ids:
+                    span = self.track_spans.get(tid)
+                    if span is None:
+                        self.track_spans[tid] = [current_time, current_time]
+                    else:
+                        span[1] = current_time
+
+            # Stats: count a vehicle (and fix its class) once it has enough history
+            newly_counted = self.tracks.mark_counted(slots, lengths, MIN_TRACK_FRAMES)
+            for i in np.flatnonzero(newly_counted).tolist():
+                self.stats["total_vehicles"].add(ids[i])
+                self.vehicle_classes.setdefault(ids[i], int(clss[i]))
+                if self.recorder is not None:
+                    self.recorder.vehicle(current_time, self.CLASS_NAMES.get(self.vehicle_classes[ids[i]], "Other"))
+
+            # -- Logic Phase --
+            # Flow estimate is maintained incrementally; one lookup per frame
+            flows = self.tracks.flow.flows()
+            frame_data["majority_direction"] = flows[0]["direction"] if flows else None
+            frame_data["flows"] = flows
+            
+            # Wrong Way Detection: against the manual direction, or the flow of the nearest lane
+            if manual_direction is not None:
+                target_angle = manual_direction
+            elif flows:
+                target_angle = DirectionFlow.reference_directions(boxes[:, :2], flows)
+            else:
+                target_angle = None
+            if target_angle is not None:
+                diff = np.abs(directions - target_angle)
+                diff = np.where(diff > 180, 360 - diff, diff)
+                wrong_way = (speeds > MIN_SPEED_THRESHOLD) & (diff > WRONG_WAY_ANGLE_DIFF)
+            else:
+                wrong_way = np.zeros(len(ids), dtype=bool)
             
-            # Upload processed video to Cloudinary
-            cloud_url = None
-            if os.path.exists(full_video_path):
-                # Notify frontend about upload status
-                yield {"type": "status", "message": "Uploading video to cloud (this may take a moment)..."}
-                logger.info("Uploading processed video to Cloudinary...")
-                # Run synchronous upload in a separate thread to avoid blocking the event loop
-                # This prevents WebSocket timeouts (1006) during large uploads
-                upload_result = await asyncio.to_thread(
-                    cloud_storage.upload_video,
-                    full_video_path,
-                    public_id=f"processed_{base_video_name}",
-                    folder="traffisense/processed"
-                )
-                if upload_result:
-                    cloud_url = upload_result.get('secure_url')
-                    logger.info(f"Video uploaded successfully: {cloud_url}")
-                else:
-                    logger.error("Failed to upload video to Cloudinary")
+            # Hysteresis Check
+            wrong_way = self.tracks.apply_hysteresis(slots, wrong_way, VIOLATION_COOLDOWN)
+            
+            if self.frame_skip is not None:
+                # Dense sampling while anything not yet reported moves against its flow, so short
+                # violations are not missed; a confirmed violator no longer needs it
+                suspect = wrong_way.copy()
+                if target_angle is not None:
+                    suspect |= (speeds > MIN_SPEED_THRESHOLD) & (diff > CANDIDATE_ANGLE_DIFF)
+                suspect &= ~np.isin(track_ids, list(self.stats["violated_vehicles"]))
+                candidate = bool(suspect.any())
+                self.frame_skip.update(speeds / (SPEED_SCALE * SKIP_FRAMES), candidate)
+            
+            # Violation State Management
+            is_new_alert = np.zeros(len(ids), dtype=bool)
+            for i in np.flatnonzero(wrong_way).tolist():
+                track_id = ids[i]
+                clip = self._handle_wrong_way(active_violations, track_id, current_time, current_frame_idx,
+                                              job.get("clips"), (DISPLAY_WIDTH, new_h))
+                if clip:
+                    packet["violations_started"].append((track_id,) + clip)
+                if track_id not in self.stats["violated_vehicles"]:
+                    self.stats["violated_vehicles"].add(track_id)
+                    is_new_alert[i] = True
+            
+            wrong_ids = set(track_ids[wrong_way].tolist())
+            right_ids = current_track_ids - wrong_ids
+            self.stats["backward_vehicles"] |= wrong_ids
+            self.stats["forward_vehicles"] -= wrong_ids
+            self.stats["forward_vehicles"] |= right_ids
+            self.stats["backward_vehicles"] -= right_ids
                 
-            yield self._generate_final_report(full_video_path, cloud_url)
+            # API Payload
+            frame_data["objects"] = [
+                {"id": tid, "box": box, "direction": direction, "is_wrong_way": wrong,
+                 "is_new_violation": new_alert, "speed": speed}
+                for tid, box, direction, wrong, new_alert, speed in zip(
+                    ids, boxes.tolist(), directions.tolist(), wrong_way.tolist(),
+                    is_new_alert.tolist(), speeds.tolist())
+            ]
+        elif self.frame_skip is not None:
+            self.frame_skip.update([])
+        if self.frame_skip is not None:
+            frame_data["frame_skip"] = self.frame_skip.skip
+
+        # -- Cleanup Active Violations --
+        packet["violations_ended"] = self._cleanup_inactive_violations(active_violations, current_track_ids)
+        
+        # Violation Data Update
+        for tid, v_data in active_violations.items():
+            v_data["end_time"] = current_time
+            v_data["end_frame"] = current_frame_idx
+
+        packet["frame_data"] = frame_data
+        job["last_frame_data"] = frame_data
+        return packet
+
+    def _predict_frame(self, packet, job):
+        """
+        Stage 2 for a frame between analysed ones: the objects of the last analysed frame,
+        moved to their Kalman-predicted centers. No detection, and no counting or violation
+        state changes; tracks not seen on the last analysed frame are not shown.
+        """
+        last = job.get("last_frame_data")
+        objects = []
+        if last is not None and last["objects"]:
+            centers = self.tracks.predict([obj["id"] for obj in last["objects"]], packet["frame_idx"])
+            objects = [dict(obj, box=[x, y] + obj["box"][2:], is_new_violation=False)
+                       for obj, (x, y) in zip(last["objects"], centers.tolist())]
+        frame_data = {
+            "frame_width": DISPLAY_WIDTH, "frame_height": packet["frame_height"],
+            "objects": objects, "predicted": True,
+            "majority_direction": last["majority_direction"] if last else None,
+            "flows": last["flows"] if last else [],
+            "current_frame": packet["frame_idx"], "total_frames": job["total_frames"]
+        }
+        if self.frame_skip is not None:
+            frame_data["frame_skip"] = self.frame_skip.skip
+        packet["violations_started"] = []
+        packet["violations_ended"] = []
+        packet["frame_data"] = frame_data
+        return packet
+
+    def _annotate_frame(self, packet, job):
+        """Stage 3: draw overlays, queue the frame for encoding and build the preview."""
+        frame_resized = packet["frame"]
+        frame_data = packet["frame_data"]
+        new_h = frame_resized.shape[0]
+
+        # Lazy Init Full Writer (live jobs record nothing)
+        if job["full_video_writer"] is None and job["full_video_path"]:
+            job["full_video_writer"] = open_video_writer(job["full_video_path"], job["effective_fps"], 
+                                                         (DISPLAY_WIDTH, new_h), playlist=job.get("playlist"))
+
+        # -- Visuals (Drawing) --
+        # Neon Colors (BGR)
+        NEON_GREEN = (50, 255, 50)
+        NEON_RED = (20, 20, 255)
+        
+        for obj in frame_data["objects"]:
+            x, y, w_box, h_box = obj["box"]
+            is_wrong_way = obj["is_wrong_way"]
+            direction = obj["direction"]
+            color = NEON_RED if is_wrong_way else NEON_GREEN
             
-    def _handle_wrong_way(self, active_violations, track_id, current_time, frame_idx, video_name, out_dir, h):
-        if track_id not in active_violations:
-            active_violations[track_id] = {
-                "start_time": current_time,
-                "start_frame": frame_idx,
-                "end_time": current_time,
-                "end_frame": frame_idx,
-            }
+            p1 = (int(x - w_box/2), int(y - h_box/2))
+            p2 = (int(x + w_box/2), int(y + h_box/2))
+            
+            cv2.rectangle(frame_resized, p1, p2, color, 2)
+            
+            # Label Background
+            if is_wrong_way: 
+                 label = "WRONG WAY"
+                 (w_text, h_text), _ = cv2.getTextSize(label, self.font, 0.5, 1)
+                 cv2.rectangle(frame_resized, (p1[0], p1[1] - 20), (p1[0] + w_text + 10, p1[1]), color, -1)
+                 
+                 cv2.putText(frame_resized, label, (p1[0] + 5, p1[1] - 5), 
+                            self.font, 0.5, (255, 255, 255), 1)
+            
+            if obj["speed"] > 2:
+                end_pos = (int(x + 20 * math.cos(math.radians(direction))), 
+                          int(y + 20 * math.sin(math.radians(direction))))
+                cv2.arrowedLine(frame_resized, (int(x), int(y)), end_pos, (255, 255, 0), 2)
+
+        # -- Preview (before the timestamp overlay) --
+        # Preview rate, size and quality follow the processing rate, encode cost and client links
+        preview = job["preview"]
+        if preview.should_preview():
+            encode_start = time.perf_counter()
+            image = frame_resized
+            if preview.scale != 1.0:
+                image = cv2.resize(frame_resized, None, fx=preview.scale, fy=preview.scale,
+                                   interpolation=cv2.INTER_AREA)
+            _, buffer = cv2.imencode('.jpg', image, [int(cv2.IMWRITE_JPEG_QUALITY), preview.quality])
+            # Raw JPEG bytes: base64 (JSON protocol) is applied per connection by wire_protocol
+            frame_data["image"] = buffer.tobytes()
+            preview.record_encode(time.perf_counter() - encode_start, len(buffer))
+            # Per-stage timings and queue depths, to spot the bottleneck stage
+            frame_data["pipeline"] = job["pipeline"].stats()
+        frame_data["preview"] = preview.state()
+        
+        # -- I/O Phase (Async) --
+        clips = job.get("clips")
+        if job["full_video_writer"] or clips is not None:
+            # Drawn in place: from here on the frame is only read (writer queue, clip ring)
+            frame_with_ts = self._add_timestamp(frame_resized, packet["time"])
+        
+        # 1. Full Video
+        if job["full_video_writer"]:
+            # The video runs at effective_fps: with an adaptive skip, a frame is repeated
+            # (or dropped) so the output stays in step with the source time
+            copies = packet["frame_idx"] // job["output_step"] - job["frames_written"]
+            for _ in range(copies):
+                job["async_writer"].write(job["full_video_writer"], frame_with_ts)
+            job["frames_written"] += max(copies, 0)
+        
+        # 2. Violation clips (recent frames held in a preallocated ring for the lead-in)
+        if clips is not None:
+            clips.add_frame(frame_with_ts, packet["frame_idx"], packet["time"],
+                            packet["violations_started"], packet["violations_ended"])
+
+        if job.get("video_playlist"):
+            frame_data["video_playlist"] = job["video_playlist"]
+        if job.get("reader") is not None:
+            frame_data["dropped_frames"] = self._dropped_frames(job)
+        
+        job["results_queue"].put(frame_data)
+        return None
+
+    def _handle_wrong_way(self, active_violations, track_id, current_time, frame_idx, clips=None, frame_size=None):
+        """
+        Opens a violation for the track unless one is active; returns its (clip name, writer), or
+        None. The clip is only referenced by the violation once its writer is open.
+        """
+        if track_id in active_violations:
+            return None
+        clip = clips.open(track_id, frame_idx, frame_size) if clips is not None else None
+        active_violations[track_id] = {
+            "start_time": current_time,
+            "start_frame": frame_idx,
+            "end_time": current_time,
+            "end_frame": frame_idx,
+            "clip": clip[0] if clip else None,
+        }
+        return clip
 
     def _cleanup_inactive_violations(self, active_violations, current_track_ids):
         ended = []
@@ -428,59 +1039,95 @@ class VideoProcessor:
                 ended.append(tid)
         for tid in ended:
             del active_violations[tid]
+        return ended
 
     def _finalize_violation_stats(self, tid, v_data):
         cls_id = self.vehicle_classes.get(tid, -1)
         cls_name = self.CLASS_NAMES.get(cls_id, "Unknown")
         
-        self.stats["violation_details"].append({
+        detail = {
             "id": int(tid),
             "type": cls_name,
             "start_time": float(v_data["start_time"]),
             "end_time": float(v_data["end_time"]),
             "start_frame": int(v_data["start_frame"]),
-            "end_frame": int(v_data["end_frame"])
-        })
+            "end_frame": int(v_data["end_frame"]),
+            # File under /violations (None when no frames were rendered: cached / sharded analyses)
+            "clip": v_data.get("clip"),
+        }
+        self.stats["violation_details"].append(detail)
+        if self.recorder is not None:
+            self.recorder.violation(detail)
+
+    def _expire_tracks(self):
+        """Folds tracks the TrackStore has expired into the running totals and drops their state."""
+        for tid, max_speed in self.tracks.pop_expired():
+            self._tally_track(self.report_totals, tid, max_speed)
+            self._record_track(tid, max_speed)
+            for key in ("total_vehicles", "forward_vehicles", "backward_vehicles", 
+                        "stationary_vehicles", "violated_vehicles"):
+                self.stats[key].discard(tid)
+            self.vehicle_classes.pop(tid, None)
+            self.track_spans.pop(tid, None)
+
+    def _track_direction(self, tid, max_speed):
+        if tid in self.stats["violated_vehicles"]:
+            return "backward"
+        return "stationary" if (max_speed or 0) < STATIONARY_THRESHOLD else "forward"
+
+    def _record_track(self, tid, max_speed):
+        """Hands a finished (or, at the report, still live) counted track's summary to the recorder."""
+        if self.recorder is None or not (tid in self.stats["total_vehicles"] or tid in self.stats["violated_vehicles"]):
+            return
+        first_time, last_time = self.track_spans.get(tid, (None, None))
+        self.recorder.track(tid, self.CLASS_NAMES.get(self.vehicle_classes.get(tid), "Other"),
+                            self._track_direction(tid, max_speed), tid in self.stats["violated_vehicles"],
+                            max_speed, first_time, last_time)
+
+    def _tally_track(self, totals, tid, max_speed):
+        """Adds one track's final contribution to a report totals dict."""
+        is_vio = tid in self.stats["violated_vehicles"]
+        if tid in self.stats["total_vehicles"]:
+            totals["total"] += 1
+            cname = self.CLASS_NAMES.get(self.vehicle_classes.get(tid), "Other")
+            totals["class_breakdown"][cname] += 1
+            totals[self._track_direction(tid, max_speed)] += 1
+        if is_vio:
+            totals["violations"] += 1
+        if max_speed is not None:
+            totals["speed_sum"] += max_speed
+            totals["speed_count"] += 1
 
     def _generate_final_report(self, full_video_path, cloud_url=None):
-        final_forward = 0
-        final_backward = 0
-        final_stationary = 0
-        STATIONARY_THRESHOLD = 5.0
-        
-        for track_id in self.stats["total_vehicles"]:
-             is_vio = track_id in self.stats["violated_vehicles"]
-             max_s = self.vehicle_max_speeds.get(track_id, 0)
-             if is_vio: final_backward += 1
-             elif max_s < STATIONARY_THRESHOLD: final_stationary += 1
-             else: final_forward += 1
+        # Expired tracks are already folded in; add the ones still live
+        totals = dict(self.report_totals, class_breakdown=defaultdict(int, self.report_totals["class_breakdown"]))
+        vehicle_max_speeds = self.tracks.max_speeds()
+        live_ids = self.stats["total_vehicles"] | self.stats["violated_vehicles"] | vehicle_max_speeds.keys()
+        for track_id in live_ids:
+            self._tally_track(totals, track_id, vehicle_max_speeds.get(track_id))
+            self._record_track(track_id, vehicle_max_speeds.get(track_id))
              
-        logger.info(f"Generating Final Report. Total Vehicles: {len(self.stats['total_vehicles'])}")
-        logger.info(f"Violated Vehicles from set: {len(self.stats['violated_vehicles'])}")
+        logger.info(f"Generating Final Report. Total Vehicles: {totals['total']} ({len(live_ids)} still tracked)")
+        logger.info(f"Violated Vehicles: {totals['violations']}")
         logger.info(f"Violation Details List size: {len(self.stats['violation_details'])}")
         if len(self.stats['violation_details']) > 0:
             logger.info(f"Sample Violation: {self.stats['violation_details'][0]}")
 
-        return {
+        report = {
             "type": "report",
             "summary": {
-                "total": len(self.stats["total_vehicles"]),
-                "forward": final_forward,
-                "backward": final_backward,
-                "stationary": final_stationary,
-                "violations": len(self.stats["violated_vehicles"]),
+                "total": totals["total"],
+                "forward": totals["forward"],
+                "backward": totals["backward"],
+                "stationary": totals["stationary"],
+                "violations": totals["violations"],
                 "violation_list": self.stats["violation_details"],
-                "average_speed": round(sum(self.vehicle_max_speeds.values()) / (len(self.vehicle_max_speeds) or 1), 1),
-                "class_breakdown": self._get_class_breakdown(),
-                "full_video": os.path.basename(full_video_path),
+                "average_speed": round(totals["speed_sum"] / (totals["speed_count"] or 1), 1),
+                "class_breakdown": dict(totals["class_breakdown"]),
+                "full_video": os.path.basename(full_video_path) if full_video_path else None,
                 "cloud_video_url": cloud_url
             }
         }
-
-    def _get_class_breakdown(self):
-        counts = defaultdict(int)
-        for tid in self.stats["total_vehicles"]:
-            cid = self.vehicle_classes.get(tid)
-            cname = self.CLASS_NAMES.get(cid, "Other")
-            counts[cname] += 1
-        return dict(counts)
+        if self.recorder is not None:
+            self.recorder.finish(report["summary"])
+        return report
@@ -0,0 +1,226 @@
+"""
+Time-segment sharding of a single long video across worker processes.
+
+Each segment is decoded and tracked in its own process with its own model; the
+per-frame track records are then stitched into one global ID space and replayed
+through VideoProcessor's kinematics / wrong-way logic, so the report is produced
+by exactly the same code as the single-process path.
+
+Tolerance: only tracking differs from a single-process run. A vehicle that is
+occluded or enters/leaves exactly inside an overlap window can fail to stitch
+and be counted twice, so vehicle totals may differ by about one per segment
+boundary; violations and class breakdowns follow the same bound.
+"""
+import logging
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from frame_source import FrameSampler, resize_to_width
+from motion_gate import MotionGate
+from model_pool import ModelWorker, MODEL_WEIGHTS, TRACKER_CONFIG, VEHICLE_CLASS_IDS, unpack_tracks
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Tracking processes shared by all sharded jobs, each holding its own model
+SHARD_WORKERS = max(1, int(os.getenv("SHARD_WORKERS", str(os.cpu_count() or 1))))
+SHARD_MIN_SEGMENT_FRAMES = int(os.getenv("SHARD_MIN_SEGMENT_FRAMES", "900"))  # ~30s at 30fps
+SHARD_OVERLAP_FRAMES = int(os.getenv("SHARD_OVERLAP_FRAMES", "30"))  # Source frames tracked by both neighbours
+STITCH_MIN_IOU = 0.3
+STITCH_MAX_VELOCITY_DIFF = 4.0  # px per source frame
+
+# Per-process state, set up by init_worker
+_worker = None
+
+
+def init_worker(weights: str, threads: int):
+    """ProcessPoolExecutor initializer: one model per process, sized to its share of the cores."""
+    global _worker
+    cv2.setNumThreads(threads)
+    import torch
+    torch.set_num_threads(threads)
+    _worker = ModelWorker(os.getpid(), weights)
+
+
+# Process-wide pool of segment trackers, started on first use
+_shard_executor = None
+_shard_executor_lock = threading.Lock()
+
+
+def get_shard_executor(weights: str = MODEL_WEIGHTS) -> ProcessPoolExecutor:
+    """
+    The SHARD_WORKERS tracking processes shared by every sharded job. Concurrent jobs queue
+    their segments on it, so the process (and model) count stays bounded however many
+    sharded jobs run at once; processes stay up, with their model loaded, between jobs.
+    """
+    global _shard_executor
+    if _shard_executor is None:
+        with _shard_executor_lock:
+            if _shard_executor is None:
+                threads = max(1, (os.cpu_count() or 1) // SHARD_WORKERS)
+                _shard_executor = ProcessPoolExecutor(max_workers=SHARD_WORKERS,
+                                                      mp_context=multiprocessing.get_context("spawn"),
+                                                      initializer=init_worker, initargs=(weights, threads))
+    return _shard_executor
+
+
+def shutdown_shard_executor(executor: ProcessPoolExecutor = None):
+    """
+    Stops the shared pool so the next sharded job starts a new one. Pass `executor` to drop
+    a broken pool only if it is still the current one.
+    """
+    global _shard_executor
+    with _shard_executor_lock:
+        if _shard_executor is None or (executor is not None and executor is not _shard_executor):
+            return
+        stopping, _shard_executor = _shard_executor, None
+    stopping.shutdown(wait=False, cancel_futures=True)
+
+
+def plan_segments(total_frames: int, workers: int, min_segment_frames: int = SHARD_MIN_SEGMENT_FRAMES):
+    """Split [0, total_frames) into contiguous (start, end) frame windows, one per worker at most."""
+    count = max(1, min(workers, total_frames // max(1, min_segment_frames)))
+    length = math.ceil(total_frames / count)
+    return [(k * length, min(total_frames, (k + 1) * length)) for k in range(count)]
+
+
+def track_segment(video_path: str, start_frame: int, end_frame: int, skip: int, display_width: int,
+                  overlap_frames: int = SHARD_OVERLAP_FRAMES, motion_gate: bool = False):
+    """
+    Track frames (start_frame, end_frame] of a video (1-based frame numbers, as FrameSampler).
+    Tracking starts overlap_frames early so IDs are established before the segment proper.
+    With motion_gate, static frames skip detection and repeat the previous frame's tracks.
+
+    Returns:
+        Dict with frame_height and records:
+        [(frame_idx, time_s, boxes_xywh, track_ids, class_ids, tracked)], tracked False for gated frames
+    """
+    _worker.reset_tracker()
+    cap = cv2.VideoCapture(video_path)
+    warmup_start = max(0, start_frame - overlap_frames)
+    records = []
+    frame_height = None
+    gate = MotionGate() if motion_gate else None
+    try:
+        for frame_idx, current_time, frame in FrameSampler(cap, skip, start_frame=warmup_start, end_frame=end_frame):
+            frame_resized = resize_to_width(frame, display_width)
+            frame_height = frame_resized.shape[0]
+            if records and gate is not None and not gate.check(frame_resized):
+                records.append((frame_idx, current_time) + records[-1][2:5] + (False,))
+                continue
+            results = _worker.model.track(frame_resized, persist=True, tracker=TRACKER_CONFIG,
+                                          classes=VEHICLE_CLASS_IDS, verbose=False)
+            boxes_xywh, track_ids, clss = unpack_tracks(results[0])
+            if track_ids is None:
+                boxes_xywh = np.empty((0, 4), dtype=np.float32)
+                track_ids = np.empty(0, dtype=np.int32)
+                clss = np.empty(0, dtype=np.int32)
+            records.append((frame_idx, current_time, boxes_xywh, track_ids, clss, True))
+    finally:
+        cap.release()
+    return {"start_frame": start_frame, "end_frame": end_frame, "frame_height": frame_height, "records": records}
+
+
+def _iou_matrix(a_xywh, b_xywh):
+    a = np.column_stack([a_xywh[:, :2] - a_xywh[:, 2:] / 2, a_xywh[:, :2] + a_xywh[:, 2:] / 2])
+    b = np.column_stack([b_xywh[:, :2] - b_xywh[:, 2:] / 2, b_xywh[:, :2] + b_xywh[:, 2:] / 2])
+    tl = np.maximum(a[:, None, :2], b[None, :, :2])
+    br = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(br - tl, 0, None), axis=2)
+    area_a = np.prod(a_xywh[:, 2:], axis=1)
+    area_b = np.prod(b_xywh[:, 2:], axis=1)
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def _velocities(records):
+    """Mean center velocity (px per source frame) of every track across the given records."""
+    first, last = {}, {}
+    for frame_idx, _, boxes, ids, *_ in records:
+        for box, tid in zip(boxes, ids):
+            first.setdefault(tid, (frame_idx, box[:2]))
+            last[tid] = (frame_idx, box[:2])
+    velocities = {}
+    for tid, (f0, c0) in first.items():
+        f1, c1 = last[tid]
+        velocities[tid] = (c1 - c0) / (f1 - f0) if f1 > f0 else None
+    return velocities
+
+
+def match_overlap(prev_records, next_records):
+    """
+    Match track IDs of two segments over the frames both tracked.
+    Pairs are scored by summed box IoU, rejected when their velocities disagree,
+    and assigned greedily one-to-one. Returns {next_id: prev_id}.
+    """
+    prev_by_frame = {r[0]: r for r in prev_records}
+    scores = {}
+    for frame_idx, _, boxes, ids, *_ in next_records:
+        prev = prev_by_frame.get(frame_idx)
+        if prev is None or len(ids) == 0 or len(prev[3]) == 0:
+            continue
+        iou = _iou_matrix(prev[2], boxes)
+        for i, j in zip(*np.nonzero(iou >= STITCH_MIN_IOU)):
+            key = (int(prev[3][i]), int(ids[j]))
+            scores[key] = scores.get(key, 0.0) + float(iou[i, j])
+
+    prev_vel = _velocities(prev_records)
+    next_vel = _velocities(next_records)
+    mapping, used_prev = {}, set()
+    for (prev_id, next_id), _ in sorted(scores.items(), key=lambda kv: kv[1], reverse=True):
+        if next_id in mapping or prev_id in used_prev:
+            continue
+        v_prev, v_next = prev_vel.get(prev_id), next_vel.get(next_id)
+        if v_prev is not None and v_next is not None and np.linalg.norm(v_prev - v_next) > STITCH_MAX_VELOCITY_DIFF:
+            continue
+        mapping[next_id] = prev_id
+        used_prev.add(prev_id)
+    return mapping
+
+
+def stitch_segments(segments):
+    """
+    Merge segment results (ordered by start_frame) into one record list with global track IDs.
+    Frames inside an overlap window are taken from the earlier segment.
+    """
+    merged = []
+    next_global = 1
+    prev_map = {}
+    prev_records = []
+    stitched = 0
+    for k, segment in enumerate(segments):
+        records = segment["records"]
+        boundary = segment["start_frame"]
+        id_map = {}
+        if k > 0:
+            overlap_prev = [r for r in prev_records if r[0] > boundary - SHARD_OVERLAP_FRAMES]
+            overlap_next = [r for r in records if r[0] <= boundary]
+            for next_id, prev_id in match_overlap(overlap_prev, overlap_next).items():
+                if prev_id in prev_map:
+                    id_map[next_id] = prev_map[prev_id]
+            stitched += len(id_map)
+
+        kept = []
+        for frame_idx, current_time, boxes, ids, clss, tracked in records:
+            if k > 0 and frame_idx <= boundary:
+                continue
+            global_ids = np.empty(len(ids), dtype=np.int32)
+            for i, tid in enumerate(ids):
+                tid = int(tid)
+                if tid not in id_map:
+                    id_map[tid] = next_global
+                    next_global += 1
+                global_ids[i] = id_map[tid]
+            kept.append((frame_idx, current_time, boxes, global_ids, clss, tracked))
+
+        merged.extend(kept)
+        prev_map = id_map
+        prev_records = records
+    logger.info(f"Stitched {len(segments)} segment(s): {stitched} track(s) joined across boundaries")
+    return merged
@@ -0,0 +1,366 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from dotenv import load_dotenv
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Storage settings (override via environment)
+# auto: cloudinary when credentials are set, otherwise none (local-only: outputs stay under /processed)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "auto")  # auto | cloudinary | local | none
+STORAGE_LOCAL_DIR = os.getenv("STORAGE_LOCAL_DIR", "storage")
+STORAGE_LOCAL_URL = os.getenv("STORAGE_LOCAL_URL", "/storage")  # URL prefix STORAGE_LOCAL_DIR is served under
+STORAGE_UPLOAD_CONCURRENCY = int(os.getenv("STORAGE_UPLOAD_CONCURRENCY", "4"))  # Uploads in flight, all jobs
+STORAGE_CHUNK_MB = int(os.getenv("STORAGE_CHUNK_MB", "20"))  # Chunk size of large video uploads
+STORAGE_RETRY_DIR = os.getenv("STORAGE_RETRY_DIR", "upload_retry_queue")
+STORAGE_RETRY_MAX_ATTEMPTS = 8
+STORAGE_RETRY_BASE_S = 5  # Backoff doubles per failed attempt, capped at STORAGE_RETRY_MAX_BACKOFF_S
+STORAGE_RETRY_MAX_BACKOFF_S = 600
+STORAGE_RETRY_POLL_S = 5
+STORAGE_SEGMENT_POLL_S = 0.5  # How often a running job's HLS playlist is checked for finished segments
+
+BACKENDS = ("cloudinary", "local", "none")
+
+
+class LocalStorage:
+    """
+    Stores uploads under a local directory (served by the API under STORAGE_LOCAL_URL).
+    For development and tests; `bandwidth_mbps` simulates a slow link.
+    """
+    name = "local"
+
+    def __init__(self, root: str = STORAGE_LOCAL_DIR, base_url: str = STORAGE_LOCAL_URL,
+                 bandwidth_mbps: float = None):
+        self.root = root
+        self.base_url = base_url.rstrip("/")
+        self.bandwidth_mbps = bandwidth_mbps
+        os.makedirs(root, exist_ok=True)
+
+    def put(self, path: str, key: str, kind: str = "video") -> Optional[str]:
+        target = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if self.bandwidth_mbps:
+            time.sleep(os.path.getsize(path) * 8 / (self.bandwidth_mbps * 1e6))
+        # Copy then rename, so a reader never sees a partial file
+        shutil.copyfile(path, target + ".tmp")
+        os.replace(target + ".tmp", target)
+        return f"{self.base_url}/{key}"
+
+
+class CloudinaryStorage:
+    """
+    Cloudinary through CloudStorage. Videos keep their public_id (folder/key without
+    extension); HLS segments and playlists are raw files with the extension in the ID,
+    so the playlist's relative segment references resolve.
+    """
+    name = "cloudinary"
+
+    def __init__(self, folder: str = "traffisense", chunk_mb: int = STORAGE_CHUNK_MB):
+        from cloud_storage import get_cloud_storage
+        self.cloud = get_cloud_storage()
+        self.folder = folder
+        self.chunk_size = chunk_mb * 1024 * 1024
+
+    def put(self, path: str, key: str, kind: str = "video") -> Optional[str]:
+        directory, name = os.path.split(key)
+        folder = "/".join(filter(None, (self.folder, directory)))
+        # Single attempt: failures go to the retry queue instead of sleeping in a worker
+        if kind == "video":
+            result = self.cloud.upload_video(path, public_id=os.path.splitext(name)[0], folder=folder,
+                                             max_retries=1, chunk_size=self.chunk_size)
+        else:
+            result = self.cloud.upload_raw(path, public_id=name, folder=folder)
+        return result.get("secure_url") if result else None
+
+
+def create_backend(backend: str = STORAGE_BACKEND):
+    """
+    Storage backend for the setting; None for local-only operation (no uploads), which is
+    also what a Cloudinary setup without credentials falls back to.
+
+    Raises:
+        ValueError: For a backend other than auto / cloudinary / local / none
+    """
+    if backend == "auto":
+        backend = "cloudinary" if os.getenv("CLOUDINARY_CLOUD_NAME") else "none"
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown storage backend '{backend}' (expected auto or one of {', '.join(BACKENDS)})")
+    if backend == "local":
+        return LocalStorage()
+    if backend == "cloudinary":
+        try:
+            return CloudinaryStorage()
+        except ValueError as e:
+            logger.error(f"Cloudinary unavailable ({e}); running local-only")
+    return None
+
+
+class RetryQueue:
+    """
+    Failed uploads, one JSON file each in `queue_dir`, so they survive a restart.
+    Entries are keyed by destination: queueing the same key again replaces the old entry.
+    After STORAGE_RETRY_MAX_ATTEMPTS failures an entry is renamed to *.failed and left for inspection.
+    """
+    def __init__(self, queue_dir: str = STORAGE_RETRY_DIR):
+        self.queue_dir = queue_dir
+        os.makedirs(queue_dir, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _path(self, key, kind):
+        return os.path.join(self.queue_dir, hashlib.sha256(f"{kind}:{key}".encode()).hexdigest()[:24] + ".json")
+
+    def _save(self, entry):
+        path = self._path(entry["key"], entry["kind"])
+        with open(path + ".tmp", "w") as f:
+            json.dump(entry, f)
+        os.replace(path + ".tmp", path)
+
+    def add(self, path: str, key: str, kind: str):
+        with self._lock:
+            self._save({"path": os.path.abspath(path), "key": key, "kind": kind, "attempts": 1,
+                        "created_at": time.time(), "next_attempt": time.time() + STORAGE_RETRY_BASE_S})
+
+    def __len__(self):
+        return sum(1 for name in os.listdir(self.queue_dir) if name.endswith(".json"))
+
+    def due(self):
+        """Entries whose next attempt is due, oldest first."""
+        entries = []
+        for name in os.listdir(self.queue_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.queue_dir, name)) as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if entry["next_attempt"] <= time.time():
+                entries.append(entry)
+        return sorted(entries, key=lambda e: e["created_at"])
+
+    def done(self, entry):
+        with self._lock:
+            try:
+                os.remove(self._path(entry["key"], entry["kind"]))
+            except FileNotFoundError:
+                pass
+
+    def failed(self, entry) -> bool:
+        """Records another failed attempt; False once the entry has been given up."""
+        with self._lock:
+            entry["attempts"] += 1
+            path = self._path(entry["key"], entry["kind"])
+            if entry["attempts"] > STORAGE_RETRY_MAX_ATTEMPTS:
+                os.replace(path, path[:-len(".json")] + ".failed")
+                return False
+            backoff = min(STORAGE_RETRY_BASE_S * 2 ** (entry["attempts"] - 1), STORAGE_RETRY_MAX_BACKOFF_S)
+            entry["next_attempt"] = time.time() + backoff
+            self._save(entry)
+            return True
+
+
+class SegmentUploader:
+    """
+    Uploads the HLS segments of a job while it is still encoding. A watcher thread reads
+    the playlist every STORAGE_SEGMENT_POLL_S; ffmpeg only lists a segment (and the init
+    section) once it is complete, so each one is uploaded exactly when it is final.
+    finish() uploads the remaining segments, then the finished playlist.
+    """
+    def __init__(self, storage, playlist: str, key_prefix: str):
+        self.storage = storage
+        self.playlist = playlist
+        self.key_prefix = key_prefix
+        self.submitted = {}  # segment file name -> Future
+        self._stop = threading.Event()
+        self.thread = threading.Thread(target=self._watch, daemon=True, name="SegmentUploaderThread")
+        self.thread.start()
+
+    def _listed(self):
+        try:
+            with open(self.playlist) as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return []
+        names = []
+        for line in lines:
+            if line.startswith("#EXT-X-MAP:URI="):
+                names.append(line.split("=", 1)[1].strip('"'))
+            elif line and not line.startswith("#"):
+                names.append(line)
+        return names
+
+    def _submit_new(self):
+        directory = os.path.dirname(self.playlist)
+        for name in self._listed():
+            if name not in self.submitted:
+                self.submitted[name] = self.storage.submit(os.path.join(directory, name),
+                                                           f"{self.key_prefix}/{name}", kind="segment")
+
+    def _watch(self):
+        while not self._stop.wait(STORAGE_SEGMENT_POLL_S):
+            self._submit_new()
+
+    def cancel(self):
+        self._stop.set()
+
+    def finish(self) -> Optional[str]:
+        """Blocking: call once the encoder has finished. Returns the playlist URL (None if it failed)."""
+        self._stop.set()
+        self.thread.join()
+        self._submit_new()
+        for future in list(self.submitted.values()):
+            future.result()
+        if not os.path.exists(self.playlist):
+            return None
+        key = f"{self.key_prefix}/{os.path.basename(self.playlist)}"
+        return self.storage.submit(self.playlist, key, kind="playlist").result()
+
+
+class StorageManager:
+    """
+    Uploads processed outputs through one storage backend.
+
+    Uploads of all jobs share a pool of STORAGE_UPLOAD_CONCURRENCY threads. Each is tried
+    once; a failure goes to the durable RetryQueue, which a background thread works through
+    with exponential backoff (also picking up entries left by a previous run).
+    """
+    def __init__(self, backend=STORAGE_BACKEND, concurrency: int = STORAGE_UPLOAD_CONCURRENCY,
+                 retry_dir: str = STORAGE_RETRY_DIR):
+        """`backend`: a backend instance, or a STORAGE_BACKEND setting to create one from."""
+        self.backend = create_backend(backend) if isinstance(backend, str) else backend
+        self.concurrency = max(1, concurrency)
+        self.executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="upload")
+        self.retry_queue = RetryQueue(retry_dir)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._retry_thread = None
+        self.in_flight = 0
+        self.uploads = 0
+        self.uploaded_bytes = 0
+        self.failures = 0
+        self.retried = 0
+        self.given_up = 0
+        self.latencies = []  # Final frame -> URL available, per job
+        logger.info(f"Storage backend: {self.name} ({self.concurrency} concurrent uploads)")
+
+    @property
+    def enabled(self) -> bool:
+        """False in local-only mode: processed outputs are not uploaded anywhere."""
+        return self.backend is not None
+
+    @property
+    def name(self) -> str:
+        return self.backend.name if self.enabled else "none"
+
+    def start(self):
+        """Starts the retry worker (idempotent)."""
+        with self._lock:
+            if self._retry_thread is None and self.enabled:
+                self._retry_thread = threading.Thread(target=self._retry_worker, daemon=True,
+                                                      name="UploadRetryThread")
+                self._retry_thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self.executor.shutdown(wait=False)
+
+    def _put(self, path, key, kind):
+        try:
+            return self.backend.put(path, key, kind)
+        except Exception as e:
+            logger.error(f"Upload of {key} failed: {e}")
+            return None
+
+    def _upload(self, path, key, kind):
+        with self._lock:
+            self.in_flight += 1
+        try:
+            url = self._put(path, key, kind)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+        with self._lock:
+            if url:
+                self.uploads += 1
+                self.uploaded_bytes += os.path.getsize(path)
+            else:
+                self.failures += 1
+        if not url:
+            logger.warning(f"Upload of {key} failed; queued for retry")
+            self.retry_queue.add(path, key, kind)
+        return url
+
+    def submit(self, path: str, key: str, kind: str = "video"):
+        """Queues an upload on the pool. Returns a Future of its URL (None when it was queued for retry)."""
+        return self.executor.submit(self._upload, path, key, kind)
+
+    def segments(self, playlist: str, key_prefix: str) -> SegmentUploader:
+        return SegmentUploader(self, playlist, key_prefix)
+
+    def record_latency(self, seconds: float):
+        with self._lock:
+            self.latencies = (self.latencies + [seconds])[-100:]
+
+    def _retry_worker(self):
+        while not self._stop.wait(STORAGE_RETRY_POLL_S):
+            for entry in self.retry_queue.due():
+                if self._stop.is_set():
+                    return
+                if not os.path.exists(entry["path"]):
+                    logger.warning(f"Dropping queued upload of {entry['key']}: {entry['path']} no longer exists")
+                    self.retry_queue.done(entry)
+                    continue
+                url = self._put(entry["path"], entry["key"], entry["kind"])
+                with self._lock:
+                    if url:
+                        self.retried += 1
+                    elif not self.retry_queue.failed(entry):
+                        self.given_up += 1
+                if url:
+                    self.retry_queue.done(entry)
+                    logger.info(f"Queued upload of {entry['key']} succeeded: {url}")
+                elif entry["attempts"] > STORAGE_RETRY_MAX_ATTEMPTS:
+                    logger.error(f"Giving up on upload of {entry['key']} after {STORAGE_RETRY_MAX_ATTEMPTS} attempts")
+
+    def metrics(self):
+        with self._lock:
+            latencies = list(self.latencies)
+            return {
+                "backend": self.name,
+                "concurrency": self.concurrency,
+                "in_flight": self.in_flight,
+                "uploads": self.uploads,
+                "uploaded_mb": round(self.uploaded_bytes / (1024 * 1024), 1),
+                "failures": self.failures,
+                "retry_queue": len(self.retry_queue),
+                "retried": self.retried,
+                "given_up": self.given_up,
+                "last_final_frame_to_url_s": round(latencies[-1], 2) if latencies else None,
+                "mean_final_frame_to_url_s": round(sum(latencies) / len(latencies), 2) if latencies else None,
+            }
+
+
+# Process-wide singleton, built on first use
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage() -> StorageManager:
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = StorageManager()
+    return _storage
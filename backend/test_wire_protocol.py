@@ -0,0 +1,36 @@
+from wire_protocol import BinaryEncoder, BinaryDecoder
+
+
+def frame(idx, **extras):
+    objects = [{"id": 1, "box": [100.0, 50.0, 40.0, 20.0], "direction": 90.0, "speed": 42.0,
+                "is_wrong_way": False, "is_new_violation": False}]
+    return dict({"objects": objects, "current_frame": idx, "total_frames": 100, "frame_width": 640,
+                 "frame_height": 360, "majority_direction": 90.0}, **extras)
+
+
+def round_trip(messages, keyframe_interval=30):
+    encoder, decoder = BinaryEncoder(keyframe_interval), BinaryDecoder()
+    decoded = []
+    for message in messages:
+        for payload in encoder.encode(message):
+            result = decoder.decode(payload)
+            if result is not None:
+                decoded.append(result)
+    return decoded
+
+
+def test_extras_that_disappear_are_dropped():
+    pipeline = {"infer_ms": 12.5}
+    decoded = round_trip([frame(1), frame(2, predicted=True, pipeline=pipeline), frame(3), frame(4)])
+    assert "predicted" not in decoded[0]
+    assert decoded[1]["predicted"] is True and decoded[1]["pipeline"] == pipeline
+    for result in decoded[2:]:
+        assert "predicted" not in result and "pipeline" not in result
+
+
+def test_extras_match_json_mode():
+    messages = [frame(1, frame_skip=3), frame(2, frame_skip=3, video_playlist=None), frame(3, frame_skip=4),
+                frame(4, predicted=True, frame_skip=4), frame(5)]
+    for message, result in zip(messages, round_trip(messages, keyframe_interval=2)):
+        extras = {key: value for key, value in message.items() if key != "objects"}
+        assert {key: value for key, value in result.items() if key != "objects"} == extras
@@ -0,0 +1,219 @@
+import logging
+import os
+
+import numpy as np
+
+from direction_flow import DirectionFlow, DIRECTION_HISTORY_LEN
+from motion_model import KalmanTracks, KALMAN_KINEMATICS
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Track store configuration (override via environment)
+TRACK_STORE_SLOTS = int(os.getenv("TRACK_STORE_SLOTS", "256"))  # Initial capacity; doubles when full
+# ByteTrack drops a lost track after track_buffer (30) updates; keep its slot twice as long
+# so a re-found track never loses its history
+TRACK_SLOT_TTL = int(os.getenv("TRACK_SLOT_TTL", "60"))
+TRACK_EXPIRE_INTERVAL = 30  # Updates between sweeps for expired tracks
+SPEED_SCALE = 15  # Arbitrary scalar mapping pixels per reference step to roughly 0-100 "km/h"
+
+
+class TrackStore:
+    """
+    Per-job kinematics state for every live track, held in preallocated NumPy arrays.
+
+    Each track ID is mapped to a slot; its centers go into a ring of `history_len`
+    points (slots x history_len x 2), with the source frame index of each point. Speeds
+    are pixels per `frame_step` source frames (the reference sampling step), measured over
+    the elapsed frames rather than the number of points, so they do not depend on how
+    often frames were sampled. With `kalman`, speed and direction come instead from the
+    velocity of a constant-velocity Kalman filter of the centers (`self.motion`, also used
+    to predict positions between analysed frames), which is far less sensitive to box jitter.
+    Speed, direction and wrong-way hysteresis are computed for all of a frame's detections
+    at once; moving tracks vote on the traffic flow through `self.flow` (a DirectionFlow
+    indexed by the same slots).
+
+    A track expires once it has been unseen for `ttl` tracker updates (see advance) and its
+    vote has aged out of the flow window. Its slot is recycled and (track_id, max speed or None) is
+    queued for the owner to fold into its running totals (see pop_expired).
+    """
+    def __init__(self, history_len: int, capacity: int = TRACK_STORE_SLOTS, ttl: int = TRACK_SLOT_TTL,
+                 direction_history: int = DIRECTION_HISTORY_LEN, frame_step: int = 1,
+                 kalman: bool = KALMAN_KINEMATICS):
+        self.history_len = history_len
+        self.frame_step = frame_step
+        self.kalman = kalman
+        self.ttl = ttl
+        self.capacity = 0
+        self.slot_of = {}  # track_id -> slot
+        self.free_slots = []
+        self.tick = 0  # Tracker updates seen so far: the TTL clock
+        self.expired = []  # (track_id, max_speed) of released tracks, until popped
+        self.expired_total = 0
+        self.flow = DirectionFlow(0, window=direction_history)
+        self.motion = KalmanTracks(0)
+        self._allocate(max(1, capacity))
+
+    def _allocate(self, capacity):
+        """Grow every per-slot array to `capacity`, keeping existing slots."""
+        def grow(arr, fill, dtype, shape=()):
+            pad = np.full((capacity - self.capacity,) + shape, fill, dtype=dtype)
+            return pad if arr is None else np.concatenate([arr, pad])
+
+        first = self.capacity == 0
+        old = (lambda name: None) if first else (lambda name: getattr(self, name))
+        self.positions = grow(old("positions"), 0.0, np.float64, (self.history_len, 2))
+        self.frames = grow(old("frames"), 0, np.int64, (self.history_len,))  # Source frame of each point
+        self.appends = grow(old("appends"), 0, np.int64)  # Total centers appended to the ring
+        self.track_ids = grow(old("track_ids"), -1, np.int64)  # -1: free slot
+        self.last_seen = grow(old("last_seen"), 0, np.int64)  # tick of the last update
+        self.max_speed = grow(old("max_speed"), np.nan, np.float64)  # nan: not measured yet
+        self.violation_timer = grow(old("violation_timer"), 0, np.int64)
+        self.counted = grow(old("counted"), False, np.bool_)
+        self.flow.grow(capacity)
+        self.motion.grow(capacity)
+
+        # Lowest slots are handed out first
+        self.free_slots.extend(range(capacity - 1, self.capacity - 1, -1))
+        self.capacity = capacity
+
+    def _slots_for(self, track_ids):
+        """Slot index for every ID, allocating (and recycling or growing) for new ones."""
+        slots = [self.slot_of.get(tid) for tid in track_ids]
+        new_ids = [tid for tid, slot in zip(track_ids, slots) if slot is None]
+        if new_ids:
+            if len(self.free_slots) < len(new_ids):
+                self._recycle()
+            if len(self.free_slots) < len(new_ids):
+                target = self.capacity
+                while target - self.capacity + len(self.free_slots) < len(new_ids):
+                    target *= 2
+                logger.info(f"TrackStore growing to {target} slots")
+                self._allocate(target)
+            for tid in new_ids:
+                slot = self.free_slots.pop()
+                self._reset_slot(slot, tid)
+                self.slot_of[tid] = slot
+            slots = [self.slot_of[tid] for tid in track_ids]
+        return np.asarray(slots, dtype=np.int64)
+
+    def _reset_slot(self, slot, track_id):
+        self.track_ids[slot] = track_id
+        self.appends[slot] = 0
+        self.max_speed[slot] = np.nan
+        self.violation_timer[slot] = 0
+        self.counted[slot] = False
+        self.motion.forget(slot)
+
+    def _recycle(self):
+        """Release slots of tracks that are gone and no longer vote on the traffic flow."""
+        in_use = self.track_ids >= 0
+        expired = in_use & (self.tick - self.last_seen > self.ttl) & ~self.flow.in_window
+        for slot in np.flatnonzero(expired).tolist():
+            tid = int(self.track_ids[slot])
+            max_speed = None if np.isnan(self.max_speed[slot]) else float(self.max_speed[slot])
+            self.expired.append((tid, max_speed))
+            self.expired_total += 1
+            del self.slot_of[tid]
+            self.track_ids[slot] = -1
+            self.free_slots.append(slot)
+
+    def advance(self):
+        """
+        Called once per tracker update, with or without detections. Frames that reuse the
+        previous tracks (motion gate) do not advance the clock: ByteTrack keeps a lost track
+        for a number of its own updates, and a slot freed sooner would count the track again
+        when it is re-found under the same ID.
+        """
+        self.tick += 1
+        if self.tick % TRACK_EXPIRE_INTERVAL == 0:
+            self._recycle()
+
+    def update(self, track_ids, centers, min_speed: float, frame_idx: int):
+        """
+        Append one center per tracked detection and compute their kinematics.
+
+        Args:
+            track_ids: (N,) track IDs of this frame's detections
+            centers: (N, 2) box centers
+            min_speed: Speed below which a vehicle is treated as not moving (no direction)
+            frame_idx: Source frame number of this frame
+
+        Returns:
+            (slots, track_lengths, speeds, directions) arrays of length N
+        """
+        slots = self._slots_for(track_ids)
+
+        # Ring append
+        write = self.appends[slots] % self.history_len
+        self.positions[slots, write] = centers
+        self.frames[slots, write] = frame_idx
+        self.appends[slots] += 1
+        self.last_seen[slots] = self.tick
+        lengths = np.minimum(self.appends[slots], self.history_len)
+
+        # Displacement from the oldest point still in the history
+        oldest = (self.appends[slots] - lengths) % self.history_len
+        delta = centers - self.positions[slots, oldest]
+        dist = np.hypot(delta[:, 0], delta[:, 1])
+        has_history = lengths > 2
+        # Elapsed time in reference steps, plus one: at a constant step this is the number of points,
+        # so fixed-rate sampling gives exactly the original dist / points
+        steps = (frame_idx - self.frames[slots, oldest]) / self.frame_step + 1
+        _, velocity = self.motion.update(slots, centers, frame_idx)
+        if self.kalman:
+            # Filtered velocity in px per source frame, scaled to the same per-reference-step units
+            dist = np.where(self.motion.still(slots), 0.0, np.hypot(velocity[:, 0], velocity[:, 1]) * self.frame_step)
+            delta = velocity
+            steps = 1
+        speeds = np.where(has_history, dist / steps * SPEED_SCALE, 0.0)
+        moving = has_history & (speeds > min_speed)
+        directions = np.where(moving, np.degrees(np.arctan2(delta[:, 1], delta[:, 0])) % 360, 0.0)
+
+        # Per-track max speed, only once there is enough history to measure it
+        measured = slots[has_history]
+        self.max_speed[measured] = np.fmax(self.max_speed[measured], speeds[has_history])
+
+        # Moving tracks vote on the traffic flow
+        self.flow.update(slots[moving], directions[moving], centers[moving])
+
+        return slots, lengths, speeds, directions
+
+    def predict(self, track_ids, frame_idx: int):
+        """(N, 2) Kalman-predicted centers of live tracks at a frame that was not analysed."""
+        slots = np.asarray([self.slot_of[tid] for tid in track_ids], dtype=np.int64)
+        return self.motion.predict(slots, frame_idx)
+
+    def mark_counted(self, slots, track_lengths, min_frames: int):
+        """Flags slots that just reached `min_frames` points; returns a mask of those first-time counts."""
+        newly = (track_lengths >= min_frames) & ~self.counted[slots]
+        self.counted[slots[newly]] = True
+        return newly
+
+    def apply_hysteresis(self, slots, wrong_way, cooldown: int):
+        """
+        Wrong-way detections (re)arm their timer; other detections stay flagged while
+        their timer runs down. Returns the final wrong-way mask.
+        """
+        self.violation_timer[slots[wrong_way]] = cooldown
+        held = ~wrong_way & (self.violation_timer[slots] > 0)
+        self.violation_timer[slots[held]] -= 1
+        return wrong_way | held
+
+    def pop_expired(self):
+        """Returns and clears the (track_id, max_speed) pairs released since the last call."""
+        expired, self.expired = self.expired, []
+        return expired
+
+    def max_speeds(self):
+        """{track_id: max speed} of live tracks that have been measured."""
+        live = (self.track_ids >= 0) & ~np.isnan(self.max_speed)
+        return dict(zip(self.track_ids[live].tolist(), self.max_speed[live].tolist()))
+
+    def metrics(self):
+        return {
+            "capacity": self.capacity,
+            "live": len(self.slot_of),
+            "expired": self.expired_total,
+        }
@@ -0,0 +1,280 @@
+import asyncio
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Upload configuration (override via environment)
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_MB", str(20 * 1024))) * 1024 * 1024
+UPLOAD_FLUSH_BYTES = 4 * 1024 * 1024  # Buffered before each write+hash hop to a worker thread
+PARTIAL_DIR_NAME = ".partial"
+INDEX_FILE_NAME = ".index.json"
+
+
+class UploadError(Exception):
+    """Client-side upload problem; `status` is the HTTP status to answer with."""
+    def __init__(self, message: str, status: int = 400, **details):
+        super().__init__(message)
+        self.status = status
+        self.details = details
+
+
+def sanitize_filename(filename: str) -> str:
+    """Basename only, restricted to [A-Za-z0-9._-], never hidden or empty."""
+    name = os.path.basename((filename or "").replace("\\", "/"))
+    name = re.sub(r"[^A-Za-z0-9._-]", "_", name).lstrip(".")
+    return name[:200] or "upload"
+
+
+class ChunkedUploadManager:
+    """
+    Resumable uploads streamed straight to disk.
+
+    A session is a partial file plus a JSON sidecar in uploads/.partial/. Chunks must
+    arrive at the current offset; the SHA-256 is updated as bytes are written, so on
+    completion the hash is known without re-reading the file, and a file already
+    uploaded (same content) is detected from the hash index instead of stored twice.
+    After a server restart a session can still be resumed: its hash is rebuilt from the
+    partial file on the next chunk.
+    """
+    def __init__(self, upload_dir: str = UPLOAD_DIR, max_bytes: int = UPLOAD_MAX_BYTES):
+        self.upload_dir = upload_dir
+        self.partial_dir = os.path.join(upload_dir, PARTIAL_DIR_NAME)
+        self.index_path = os.path.join(upload_dir, INDEX_FILE_NAME)
+        self.max_bytes = max_bytes
+        os.makedirs(self.partial_dir, exist_ok=True)
+        self._hashers = {}  # upload_id -> running sha256 (in memory only)
+        self._locks = {}  # upload_id -> [asyncio.Lock, holders and waiters], one writer per session
+        self._index_lock = threading.Lock()
+        self._place_lock = threading.Lock()  # Name choice + rename into the upload dir, across sessions
+        self._index = self._load_index()
+
+    # -- Hash index --
+    def _load_index(self):
+        try:
+            with open(self.index_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save_index(self):
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def find_duplicate(self, content_hash: str):
+        """Filename of an existing upload with this content, if it is still on disk."""
+        entry = self._index.get(content_hash)
+        if entry and os.path.exists(os.path.join(self.upload_dir, entry["filename"])):
+            return entry["filename"]
+        return None
+
+    def content_hash(self, path: str):
+        """Hash recorded at upload time for a file in the upload dir, if its size still matches."""
+        if os.path.abspath(os.path.dirname(path)) != os.path.abspath(self.upload_dir):
+            return None
+        name = os.path.basename(path)
+        with self._index_lock:
+            for content_hash, entry in self._index.items():
+                if entry["filename"] == name:
+                    try:
+                        if os.path.getsize(path) == entry["size"]:
+                            return content_hash
+                    except OSError:
+                        return None
+        return None
+
+    def register(self, content_hash: str, filename: str, size: int):
+        with self._index_lock:
+            self._index[content_hash] = {"filename": filename, "size": size, "uploaded_at": time.time()}
+            self._save_index()
+
+    def place(self, filename: str, content_hash: str) -> str:
+        """
+        Free target name in the upload dir; a name taken by other content gets a hash suffix.
+        Only free until the file is moved there: callers hold _place_lock across both.
+        """
+        name = sanitize_filename(filename)
+        if not os.path.exists(os.path.join(self.upload_dir, name)):
+            return name
+        stem, ext = os.path.splitext(name)
+        return f"{stem}_{content_hash[:8]}{ext}"
+
+    # -- Sessions --
+    def _paths(self, upload_id):
+        if not re.fullmatch(r"[0-9a-f]{32}", upload_id or ""):
+            raise UploadError("Unknown upload", status=404)
+        base = os.path.join(self.partial_dir, upload_id)
+        return base + ".part", base + ".json"
+
+    def _load_session(self, upload_id):
+        part_path, meta_path = self._paths(upload_id)
+        try:
+            with open(meta_path) as f:
+                session = json.load(f)
+        except FileNotFoundError:
+            self._hashers.pop(upload_id, None)
+            raise UploadError("Unknown upload", status=404)
+        # The partial file is the source of truth for how much has been received
+        session["offset"] = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        return session
+
+    def create(self, filename: str, size: int = None):
+        if size is not None and size > self.max_bytes:
+            raise UploadError(f"File exceeds the {self.max_bytes // (1024 * 1024)}MB limit", status=413)
+        upload_id = uuid.uuid4().hex
+        part_path, meta_path = self._paths(upload_id)
+        session = {"upload_id": upload_id, "filename": sanitize_filename(filename), "size": size,
+                   "created_at": time.time()}
+        open(part_path, "wb").close()
+        with open(meta_path, "w") as f:
+            json.dump(session, f)
+        self._hashers[upload_id] = hashlib.sha256()
+        logger.info(f"Upload {upload_id} started: {session['filename']} ({size} bytes)")
+        return dict(session, offset=0)
+
+    def status(self, upload_id: str):
+        return self._load_session(upload_id)
+
+    def _hasher(self, upload_id, part_path):
+        """Running hash of the partial file; rebuilt from disk if this process did not write it."""
+        hasher = self._hashers.get(upload_id)
+        if hasher is None:
+            hasher = hashlib.sha256()
+            with open(part_path, "rb") as f:
+                for block in iter(lambda: f.read(UPLOAD_FLUSH_BYTES), b""):
+                    hasher.update(block)
+            self._hashers[upload_id] = hasher
+        return hasher
+
+    @contextlib.asynccontextmanager
+    async def _lock(self, upload_id):
+        """
+        Holds the session's asyncio.Lock: append, complete and abort never overlap on one
+        upload. The lock only exists while an operation holds or waits for it, so failed,
+        finished and abandoned sessions leave no entry behind.
+        """
+        self._paths(upload_id)  # Validate the ID before keeping any state for it
+        entry = self._locks.setdefault(upload_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[upload_id]
+
+    @staticmethod
+    def _write(f, hasher, data):
+        f.write(data)
+        hasher.update(data)
+
+    async def append(self, upload_id: str, offset: int, chunks):
+        """
+        Streams an async iterator of byte chunks onto the upload at `offset`.
+
+        Raises:
+            UploadError: 409 (with the current offset) if `offset` is not where the upload
+                stands, 413 if the upload grows past its declared size or the size limit
+        """
+        async with self._lock(upload_id):
+            session = await asyncio.to_thread(self._load_session, upload_id)
+            if offset != session["offset"]:
+                raise UploadError("Offset mismatch", status=409, offset=session["offset"])
+            limit = min(self.max_bytes, session["size"] or self.max_bytes)
+            part_path, _ = self._paths(upload_id)
+            hasher = await asyncio.to_thread(self._hasher, upload_id, part_path)
+
+            received = session["offset"]
+            f = await asyncio.to_thread(open, part_path, "ab")
+            try:
+                buffer = bytearray()
+                async for chunk in chunks:
+                    received += len(chunk)
+                    if received > limit:
+                        raise UploadError("Upload larger than declared size or limit", status=413)
+                    if not buffer and len(chunk) >= UPLOAD_FLUSH_BYTES:
+                        await asyncio.to_thread(self._write, f, hasher, chunk)
+                        continue
+                    buffer += chunk
+                    if len(buffer) >= UPLOAD_FLUSH_BYTES:
+                        await asyncio.to_thread(self._write, f, hasher, buffer)
+                        buffer = bytearray()
+                if buffer:
+                    await asyncio.to_thread(self._write, f, hasher, buffer)
+            finally:
+                # On a dropped connection the unflushed tail is discarded; file and hash both
+                # stop at the last write, so the client resumes from the offset status() reports
+                await asyncio.to_thread(f.close)
+            return {"upload_id": upload_id, "offset": received}
+
+    async def complete(self, upload_id: str):
+        """
+        Finalizes an upload: moves it into the upload dir, or discards it when the same
+        content was uploaded before. Returns {filename, path, sha256, size, duplicate}.
+        Waits for an append in flight, so the hash and size cover every byte it writes.
+        """
+        async with self._lock(upload_id):
+            return await asyncio.to_thread(self._finalize, upload_id)
+
+    def _finalize(self, upload_id):
+        session = self._load_session(upload_id)
+        part_path, meta_path = self._paths(upload_id)
+        size = session["offset"]
+        if session["size"] is not None and size != session["size"]:
+            raise UploadError("Upload incomplete", status=409, offset=size)
+
+        content_hash = self._hasher(upload_id, part_path).hexdigest()
+        # Sessions complete on separate threads: a free name must stay free until the rename
+        with self._place_lock:
+            existing = self.find_duplicate(content_hash)
+            if existing:
+                os.remove(part_path)
+                filename, duplicate = existing, True
+            else:
+                filename, duplicate = self.place(session["filename"], content_hash), False
+                os.replace(part_path, os.path.join(self.upload_dir, filename))
+                self.register(content_hash, filename, size)
+        os.remove(meta_path)
+        self._hashers.pop(upload_id, None)
+        logger.info(f"Upload {upload_id} complete: {filename} ({size} bytes, duplicate={duplicate})")
+        return {"filename": filename, "path": os.path.join(self.upload_dir, filename),
+                "sha256": content_hash, "size": size, "duplicate": duplicate}
+
+    async def abort(self, upload_id: str):
+        """Discards an upload, once an append in flight has stopped writing to it."""
+        async with self._lock(upload_id):
+            await asyncio.to_thread(self._discard, upload_id)
+
+    def _discard(self, upload_id):
+        part_path, meta_path = self._paths(upload_id)
+        for path in (part_path, meta_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self._hashers.pop(upload_id, None)
+
+
+# Process-wide singleton, built on first use
+_upload_manager = None
+_upload_manager_lock = threading.Lock()
+
+
+def get_upload_manager() -> ChunkedUploadManager:
+    global _upload_manager
+    if _upload_manager is None:
+        with _upload_manager_lock:
+            if _upload_manager is None:
+                _upload_manager = ChunkedUploadManager()
+    return _upload_manager
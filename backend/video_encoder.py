@@ -0,0 +1,139 @@
+import logging
+import os
+import shutil
+import subprocess
+
+import cv2
+import numpy as np
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Encoder settings (override via environment)
+VIDEO_ENCODER = os.getenv("VIDEO_ENCODER", "ffmpeg")  # ffmpeg | opencv
+FFMPEG_BINARY = os.getenv("FFMPEG_BINARY") or shutil.which("ffmpeg")
+FFMPEG_PRESET = os.getenv("FFMPEG_PRESET", "veryfast")  # x264 speed / size trade-off
+FFMPEG_CRF = int(os.getenv("FFMPEG_CRF", "26"))
+FFMPEG_THREADS = int(os.getenv("FFMPEG_THREADS", "2"))  # Encoder threads per output (0: ffmpeg decides)
+# Also write an HLS playlist of fMP4 segments, playable while the job is still running
+VIDEO_SEGMENTS = os.getenv("VIDEO_SEGMENTS", "0") == "1"
+HLS_SEGMENT_S = 2
+HLS_PLAYLIST = "index.m3u8"
+FFMPEG_CLOSE_TIMEOUT_S = 60  # Finishing the output (faststart rewrite) of a long video takes a while
+
+
+def ffmpeg_available() -> bool:
+    return VIDEO_ENCODER == "ffmpeg" and FFMPEG_BINARY is not None
+
+
+class FfmpegWriter:
+    """
+    cv2.VideoWriter-compatible writer that pipes raw BGR frames into an ffmpeg subprocess.
+
+    Output is H.264 / yuv420p with the index at the front of the file (+faststart), so
+    browsers play it as soon as it is complete. With `playlist`, the same encode is also
+    muxed (tee) into an HLS event playlist of short fMP4 segments, which a player can
+    follow while frames are still being written.
+    """
+    def __init__(self, path: str, fps: float, size, playlist: str = None, preset: str = FFMPEG_PRESET,
+                 crf: int = FFMPEG_CRF, threads: int = FFMPEG_THREADS):
+        self.path = path
+        self.size = tuple(size)
+        self.frames = 0
+        width, height = self.size
+        command = [
+            FFMPEG_BINARY, "-hide_banner", "-loglevel", "error", "-y",
+            "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-r", f"{fps:.3f}", "-i", "pipe:0",
+            "-an", "-c:v", "libx264", "-preset", preset, "-crf", str(crf), "-threads", str(threads),
+            "-pix_fmt", "yuv420p",
+        ]
+        if playlist:
+            os.makedirs(os.path.dirname(playlist), exist_ok=True)
+            # Keyframes on segment boundaries so every segment starts cleanly
+            command += ["-force_key_frames", f"expr:gte(t,n_forced*{HLS_SEGMENT_S})", "-map", "0:v", "-f", "tee",
+                        f"[f=mp4:movflags=+faststart]{path}|"
+                        f"[f=hls:hls_time={HLS_SEGMENT_S}:hls_playlist_type=event:hls_segment_type=fmp4:"
+                        f"hls_flags=independent_segments]{playlist}"]
+        else:
+            command += ["-movflags", "+faststart", path]
+        try:
+            self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+        except OSError as e:
+            logger.error(f"Could not start ffmpeg: {e}")
+            self.process = None
+
+    def isOpened(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def write(self, frame):
+        if not self.isOpened():
+            return
+        try:
+            # Straight from the array's memory: no bytes copy of the frame
+            self.process.stdin.write(memoryview(np.ascontiguousarray(frame)))
+            self.frames += 1
+        except (BrokenPipeError, ValueError):
+            logger.error(f"ffmpeg exited while writing {self.path}: {self._stderr()}")
+            self.process = None
+
+    def release(self):
+        if self.process is None:
+            return
+        process, self.process = self.process, None
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+        try:
+            process.wait(timeout=FFMPEG_CLOSE_TIMEOUT_S)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        if process.returncode != 0:
+            logger.error(f"ffmpeg failed on {self.path} (exit {process.returncode}): "
+                         f"{process.stderr.read().decode(errors='replace').strip()}")
+
+    def _stderr(self):
+        try:
+            self.process.wait(timeout=5)
+            return self.process.stderr.read().decode(errors="replace").strip()
+        except Exception:
+            return ""
+
+
+def open_opencv_writer(path: str, fps: float, size):
+    # Use H.264 codec for browser compatibility
+    # Try avc1 first, fallback to mp4v if not available
+    try:
+        fourcc = cv2.VideoWriter_fourcc(*'avc1')
+        writer = cv2.VideoWriter(path, fourcc, fps, size)
+        if not writer.isOpened():
+            raise Exception("avc1 codec not available")
+        logger.info("Using H.264 (avc1) codec for video encoding")
+    except:
+        logger.warning("H.264 codec not available, falling back to mp4v")
+        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+        writer = cv2.VideoWriter(path, fourcc, fps, size)
+    return writer
+
+
+def open_video_writer(path: str, fps: float, size, playlist: str = None):
+    """
+    Writer for an annotated video: an FfmpegWriter when ffmpeg is available (and
+    VIDEO_ENCODER is not "opencv"), otherwise cv2.VideoWriter. `playlist` (HLS
+    segments alongside the MP4) needs ffmpeg and is ignored without it.
+    """
+    if ffmpeg_available():
+        writer = FfmpegWriter(path, fps, size, playlist=playlist)
+        if writer.isOpened():
+            return writer
+        logger.warning("ffmpeg encoder unavailable, falling back to OpenCV")
+    return open_opencv_writer(path, fps, size)
+
+
+def segment_playlist(video_path: str):
+    """Path of the HLS playlist written next to a full video (None when segments are off or ffmpeg is missing)."""
+    if not (VIDEO_SEGMENTS and ffmpeg_available()):
+        return None
+    return os.path.join(os.path.splitext(video_path)[0], HLS_PLAYLIST)
@@ -0,0 +1,165 @@
+import logging
+import math
+import os
+
+import numpy as np
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Violation clip settings (override via environment)
+VIOLATION_CLIPS_ENABLED = os.getenv("VIOLATION_CLIPS", "1") != "0"
+VIOLATION_CLIP_PRE_S = float(os.getenv("VIOLATION_CLIP_PRE_S", "3"))  # Seconds kept before the violation starts
+VIOLATION_CLIP_POST_S = float(os.getenv("VIOLATION_CLIP_POST_S", "2"))  # Seconds recorded after the vehicle leaves
+VIOLATION_CLIP_MAX_S = float(os.getenv("VIOLATION_CLIP_MAX_S", "20"))  # Recording stops this long after the start
+# Upper bound on the frames held for the pre-violation window, which is otherwise sized from
+# VIOLATION_CLIP_PRE_S and the job's frame rate (300 x 640x360 BGR ~ 200MB per job)
+VIOLATION_CLIP_BUFFER_FRAMES = int(os.getenv("VIOLATION_CLIP_BUFFER_FRAMES", "300"))
+
+
+class FrameRing:
+    """
+    The most recent frames of a job in one preallocated (capacity, H, W, 3) array,
+    with the frame number and time of each slot. Pushing copies a frame into the
+    next slot, so steady state costs no allocation at all.
+    """
+    def __init__(self, capacity: int = VIOLATION_CLIP_BUFFER_FRAMES):
+        self.capacity = max(1, capacity)
+        self.frames = None  # Allocated on the first push, once the frame size is known
+        self.frame_idx = np.zeros(self.capacity, dtype=np.int64)
+        self.times = np.zeros(self.capacity, dtype=np.float64)
+        self.pushed = 0
+
+    def __len__(self):
+        return min(self.pushed, self.capacity)
+
+    def push(self, frame, frame_idx: int, time_s: float):
+        if self.frames is None or self.frames.shape[1:] != frame.shape:
+            self.frames = np.empty((self.capacity,) + frame.shape, dtype=frame.dtype)
+            self.pushed = 0
+        slot = self.pushed % self.capacity
+        np.copyto(self.frames[slot], frame)
+        self.frame_idx[slot] = frame_idx
+        self.times[slot] = time_s
+        self.pushed += 1
+
+    def since(self, time_s: float):
+        """
+        (frame_idx, frame) for the buffered frames from time_s on, oldest first. The frames
+        are copies: their slots will be overwritten while the writer may still hold them.
+        """
+        oldest = self.pushed - len(self)
+        slots = [k % self.capacity for k in range(oldest, self.pushed)]
+        return [(int(self.frame_idx[s]), self.frames[s].copy()) for s in slots if self.times[s] >= time_s]
+
+
+class ViolationClips:
+    """
+    Records one short video per violation: VIOLATION_CLIP_PRE_S seconds from before it
+    started (out of a FrameRing) until VIOLATION_CLIP_POST_S seconds after the vehicle
+    left, or VIOLATION_CLIP_MAX_S after it started for long ones.
+
+    Fed every annotated frame, in order, by the annotate stage; the infer stage reports which
+    violations started and ended on that frame. The infer stage opens a clip's writer when it
+    records the violation (see open), so a clip that cannot be written is never referenced.
+    Encoding runs on the job's AsyncVideoWriter.
+    Clips play at `fps` (source fps / reference skip); frames are repeated as in the full
+    video when the sampling step is larger, so clip time matches source time.
+    """
+    def __init__(self, async_writer, open_writer, out_dir: str, video_name: str, fps: float, frame_step: int,
+                 frame_rate: float = None, pre_s: float = VIOLATION_CLIP_PRE_S, post_s: float = VIOLATION_CLIP_POST_S,
+                 max_s: float = VIOLATION_CLIP_MAX_S, buffer_frames: int = VIOLATION_CLIP_BUFFER_FRAMES):
+        """
+        Args:
+            frame_rate: Most frames per second add_frame can see (defaults to fps); sizes the
+                ring so it spans pre_s, up to buffer_frames
+        """
+        self.async_writer = async_writer
+        self.open_writer = open_writer  # (path, fps, (width, height)) -> cv2.VideoWriter
+        self.out_dir = out_dir
+        self.video_name = video_name
+        self.fps = fps
+        self.frame_step = frame_step
+        self.pre_s = pre_s
+        self.post_s = post_s
+        self.max_s = max_s
+        # The frame a violation starts on is the ring's newest entry, hence the extra slot
+        needed = math.ceil(pre_s * (frame_rate or fps)) + 1
+        if needed > buffer_frames:
+            logger.warning(f"Violation clip lead-in limited to {buffer_frames} frames "
+                           f"({needed} needed for {pre_s}s); raise VIOLATION_CLIP_BUFFER_FRAMES")
+        self.ring = FrameRing(min(needed, buffer_frames))
+        self.recording = {}  # track_id -> clip state
+        self.pending = {}  # clip name -> writer opened by the infer stage, not yet started
+        self.written = 0
+
+    def clip_name(self, track_id: int, frame_idx: int) -> str:
+        """File name (under out_dir) of the clip of a violation starting at frame_idx."""
+        return f"{self.video_name}_violation_{track_id}_{frame_idx}.mp4"
+
+    def open(self, track_id: int, frame_idx: int, size):
+        """
+        Opens the clip of a violation starting at frame_idx, with (width, height) frames.
+
+        Returns:
+            (clip name, writer) to pass to add_frame as started, or None if the file cannot be written
+        """
+        name = self.clip_name(track_id, frame_idx)
+        writer = self.open_writer(os.path.join(self.out_dir, name), self.fps, size)
+        if not writer.isOpened():
+            logger.error(f"Could not open violation clip {name}")
+            return None
+        self.pending[name] = writer
+        return name, writer
+
+    def add_frame(self, frame, frame_idx: int, time_s: float, started=(), ended=()):
+        """
+        Args:
+            frame: Annotated frame; not modified afterwards (it may sit in the writer queue)
+            started: (track_id, clip name, writer) of violations starting on this frame (see open)
+            ended: Track IDs whose violation ended on this frame
+        """
+        self.ring.push(frame, frame_idx, time_s)
+        for track_id in self.recording:
+            self._write(self.recording[track_id], frame, frame_idx)
+        for track_id, name, writer in started:
+            self._start(track_id, name, writer, time_s)
+        for track_id in ended:
+            if track_id in self.recording:
+                self.recording[track_id]["stop_time"] = time_s + self.post_s
+        for track_id in [tid for tid, clip in self.recording.items()
+                         if time_s >= clip["stop_time"] or time_s - clip["start_time"] >= self.max_s]:
+            self._close(track_id)
+
+    def _start(self, track_id, name, writer, time_s):
+        if track_id in self.recording:  # Same vehicle again while its last clip was still running
+            self._close(track_id)
+        self.pending.pop(name, None)
+        clip = {"writer": writer, "name": name, "start_time": time_s, "stop_time": float("inf"), "steps": None}
+        self.recording[track_id] = clip
+        # Lead-in from the ring; this frame is its newest entry
+        for buffered_idx, buffered in self.ring.since(time_s - self.pre_s):
+            self._write(clip, buffered, buffered_idx)
+
+    def _write(self, clip, frame, frame_idx):
+        step = frame_idx // self.frame_step
+        copies = 1 if clip["steps"] is None else step - clip["steps"]
+        for _ in range(copies):
+            self.async_writer.write(clip["writer"], frame)
+        if copies > 0:
+            clip["steps"] = step
+
+    def _close(self, track_id):
+        clip = self.recording.pop(track_id)
+        self.async_writer.release(clip["writer"])
+        self.written += 1
+        logger.info(f"Violation clip {clip['name']} queued for writing")
+
+    def close_all(self):
+        for track_id in list(self.recording):
+            self._close(track_id)
+        # Clips of violations whose frame never reached the annotate stage (job stopped early)
+        for writer in self.pending.values():
+            self.async_writer.release(writer)
+        self.pending.clear()
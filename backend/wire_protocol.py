@@ -0,0 +1,194 @@
+import base64
+import json
+import logging
+import math
+import struct
+
+import numpy as np
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PROTOCOLS = ("json", "binary")
+KEYFRAME_INTERVAL = 30  # Binary frames between full object lists (delta frames in between)
+
+# Binary message types (first byte of every binary WebSocket message)
+MSG_FRAME = 1
+MSG_IMAGE = 2
+
+FLAG_KEYFRAME = 1
+FLAG_WRONG_WAY = 1
+FLAG_NEW_VIOLATION = 2
+
+# type, flags, current_frame, total_frames, frame_width, frame_height, records, removed ids, majority direction
+FRAME_HEADER = struct.Struct("<BBIIHHHHf")
+# type, current_frame; raw JPEG bytes follow
+IMAGE_HEADER = struct.Struct("<BI")
+# Object record: id, box centre x/y and size w/h (1/4 px), direction (1/100 degree), speed (1/10 unit), flags
+RECORD_STRUCT = struct.Struct("<IHHHHHHB")
+RECORD = np.dtype([("id", "<u4"), ("box", "<u2", 4), ("direction", "<u2"), ("speed", "<u2"), ("flags", "u1")])
+BOX_SCALE = 4
+DIRECTION_SCALE = 100
+SPEED_SCALE = 10
+UNKNOWN_TOTAL = 0xFFFFFFFF
+_MISSING = object()
+# Key of the JSON tail listing extras the client must drop (they are absent from this frame)
+REMOVED_EXTRAS = "_removed"
+
+# Frame fields carried by the fixed header or the records; any others travel as a JSON tail
+CORE_FRAME_FIELDS = ("objects", "image", "current_frame", "total_frames", "frame_width", "frame_height",
+                     "majority_direction")
+
+
+def _u16(value) -> int:
+    return min(max(round(value), 0), 0xFFFF)
+
+
+def is_frame(message) -> bool:
+    return "objects" in message
+
+
+def encode_json(message) -> str:
+    """JSON text as send_json would produce; a raw JPEG preview is base64-encoded here."""
+    image = message.get("image")
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        message = dict(message, image=base64.b64encode(image).decode("ascii"))
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+
+class JsonEncoder:
+    """Default protocol: every message is one JSON text frame."""
+    protocol = "json"
+
+    def encode(self, message):
+        return [encode_json(message)]
+
+
+class BinaryEncoder:
+    """
+    Compact per-connection encoding of frame results.
+
+    A frame becomes one binary message: a fixed header, the objects as fixed-width
+    records and, if any other field changed since the last frame, a JSON tail with just
+    those fields (fields that are no longer sent are listed under REMOVED_EXTRAS). Objects are delta-encoded against what this client was last sent: only
+    new or changed records plus the ids that left the scene, with a full keyframe every
+    KEYFRAME_INTERVAL frames. The client keeps an id -> object map, cleared on keyframes.
+    Previews go out as a separate binary message holding the raw JPEG. Status, report and
+    error messages stay JSON text.
+    """
+    protocol = "binary"
+
+    def __init__(self, keyframe_interval: int = KEYFRAME_INTERVAL):
+        self.keyframe_interval = keyframe_interval
+        self._sent = {}  # id -> record bytes the client holds
+        self._extras = {}  # Non-core frame fields the client holds
+        self._since_keyframe = None
+
+    @staticmethod
+    def pack_object(obj) -> bytes:
+        x, y, w, h = obj["box"]
+        flags = FLAG_WRONG_WAY * bool(obj["is_wrong_way"]) | FLAG_NEW_VIOLATION * bool(obj["is_new_violation"])
+        return RECORD_STRUCT.pack(obj["id"], _u16(x * BOX_SCALE), _u16(y * BOX_SCALE), _u16(w * BOX_SCALE),
+                                  _u16(h * BOX_SCALE), round(obj["direction"] * DIRECTION_SCALE) % 36000,
+                                  _u16(obj["speed"] * SPEED_SCALE), flags)
+
+    def encode(self, message):
+        if not is_frame(message):
+            return [encode_json(message)]
+        keyframe = self._since_keyframe is None or self._since_keyframe >= self.keyframe_interval
+        self._since_keyframe = 0 if keyframe else self._since_keyframe + 1
+
+        current = {obj["id"]: self.pack_object(obj) for obj in message["objects"]}
+        if keyframe:
+            changed = list(current.values())
+            removed = []
+            self._extras = {}
+        else:
+            sent = self._sent
+            changed = [record for tid, record in current.items() if sent.get(tid) != record]
+            removed = [tid for tid in sent if tid not in current]
+        self._sent = current
+
+        extras = {key: value for key, value in message.items()
+                  if key not in CORE_FRAME_FIELDS and self._extras.get(key, _MISSING) != value}
+        removed_extras = [key for key in self._extras if key not in message]
+        self._extras.update(extras)
+        for key in removed_extras:
+            del self._extras[key]
+        if removed_extras:
+            extras[REMOVED_EXTRAS] = removed_extras
+
+        majority = message.get("majority_direction")
+        total = message.get("total_frames")
+        header = FRAME_HEADER.pack(MSG_FRAME, FLAG_KEYFRAME if keyframe else 0, message.get("current_frame") or 0,
+                                   UNKNOWN_TOTAL if total is None else total,
+                                   message.get("frame_width") or 0, message.get("frame_height") or 0,
+                                   len(changed), len(removed), math.nan if majority is None else majority)
+        parts = [header, *changed, struct.pack(f"<{len(removed)}I", *removed)]
+        if extras:
+            parts.append(json.dumps(extras, separators=(",", ":")).encode("utf-8"))
+        payloads = [b"".join(parts)]
+
+        image = message.get("image")
+        if image is not None:
+            if isinstance(image, str):
+                image = base64.b64decode(image)
+            payloads.append(IMAGE_HEADER.pack(MSG_IMAGE, message.get("current_frame") or 0) + bytes(image))
+        return payloads
+
+
+class BinaryDecoder:
+    """Reference client for BinaryEncoder: rebuilds the JSON-mode frame messages."""
+    def __init__(self):
+        self.objects = {}
+        self.extras = {}
+        self.frame = None
+
+    def decode(self, payload):
+        """Returns the completed frame dict for a frame message, None for an image (it is attached to the frame)."""
+        if payload[0] == MSG_IMAGE:
+            _, current_frame = IMAGE_HEADER.unpack_from(payload)
+            if self.frame is not None and self.frame["current_frame"] == current_frame:
+                self.frame["image"] = bytes(payload[IMAGE_HEADER.size:])
+            return None
+        (_, flags, current_frame, total, width, height, n_records, n_removed,
+         majority) = FRAME_HEADER.unpack_from(payload)
+        offset = FRAME_HEADER.size
+        records = np.frombuffer(payload, dtype=RECORD, count=n_records, offset=offset)
+        offset += records.nbytes
+        removed = struct.unpack_from(f"<{n_removed}I", payload, offset)
+        offset += 4 * n_removed
+        if flags & FLAG_KEYFRAME:
+            self.objects = {}
+            self.extras = {}
+        for tid in removed:
+            self.objects.pop(tid, None)
+        for rec in records:
+            self.objects[int(rec["id"])] = {
+                "id": int(rec["id"]), "box": (rec["box"] / BOX_SCALE).tolist(),
+                "direction": float(rec["direction"]) / DIRECTION_SCALE, "speed": float(rec["speed"]) / SPEED_SCALE,
+                "is_wrong_way": bool(rec["flags"] & FLAG_WRONG_WAY),
+                "is_new_violation": bool(rec["flags"] & FLAG_NEW_VIOLATION),
+            }
+        if offset < len(payload):
+            extras = json.loads(bytes(payload[offset:]))
+            for key in extras.pop(REMOVED_EXTRAS, ()):
+                self.extras.pop(key, None)
+            self.extras.update(extras)
+        self.frame = dict(self.extras, objects=list(self.objects.values()), current_frame=current_frame,
+                          total_frames=None if total == UNKNOWN_TOTAL else total, frame_width=width,
+                          frame_height=height, majority_direction=None if math.isnan(majority) else float(majority))
+        return self.frame
+
+
+def make_encoder(protocol: str = None):
+    """
+    Raises:
+        ValueError: For a protocol other than json / binary
+    """
+    if protocol in (None, "", "json"):
+        return JsonEncoder()
+    if protocol == "binary":
+        return BinaryEncoder()
+    raise ValueError(f"Unknown protocol '{protocol}' (expected one of {', '.join(PROTOCOLS)})")
@@ -808,6 +808,11 @@ const TrackingDashboard = ({ filename, onBack }) => {
                                                 }
                                             }}
                                         />
+                                        {reportData.video_note && (
+                                            <Typography variant="caption" sx={{ display: 'block', px: 2, py: 1, color: '#fbbf24' }}>
+                                                {reportData.video_note}
+                                            </Typography>
+                                        )}
                                     </Box>
                                 )}
 
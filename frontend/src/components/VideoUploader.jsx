@@ -10,6 +10,47 @@ import {
 import { CloudUpload, VideoFile, AutoAwesome } from '@mui/icons-material';
 import { motion } from 'framer-motion';
 
+const CHUNK_SIZE = 8 * 1024 * 1024;
+const CHUNK_RETRIES = 3;
+
+const requestJson = async (url, options) => {
+    const response = await fetch(url, options);
+    const data = await response.json().catch(() => ({}));
+    if (!response.ok) {
+        const error = new Error(data.error || `Server error: ${response.status} ${response.statusText}`);
+        error.status = response.status;
+        error.data = data;
+        throw error;
+    }
+    return data;
+};
+
+// Resumable upload: raw chunks at the server's current offset; a failed chunk is
+// retried from wherever the server says the upload stands.
+const uploadInChunks = async (file) => {
+    const params = new URLSearchParams({ filename: file.name, size: file.size });
+    const session = await requestJson(`/uploads?${params}`, { method: 'POST' });
+    let offset = 0;
+    let retries = 0;
+    while (offset < file.size) {
+        try {
+            const chunk = file.slice(offset, offset + CHUNK_SIZE);
+            const result = await requestJson(`/uploads/${session.upload_id}?offset=${offset}`, {
+                method: 'PUT',
+                body: chunk,
+            });
+            offset = result.offset;
+            retries = 0;
+        } catch (error) {
+            if (error.status && error.status !== 409) throw error;
+            if (++retries > CHUNK_RETRIES) throw error;
+            const status = await requestJson(`/uploads/${session.upload_id}`);
+            offset = status.offset;
+        }
+    }
+    return requestJson(`/uploads/${session.upload_id}/complete`, { method: 'POST' });
+};
+
 const VideoUploader = ({ onUploadComplete }) => {
     const fileInputRef = useRef(null);
     const [uploading, setUploading] = useState(false);
@@ -19,19 +60,9 @@ const VideoUploader = ({ onUploadComplete }) => {
         if (!file) return;
 
         setUploading(true);
-        const formData = new FormData();
-        formData.append('file', file);
 
         try {
-            const response = await fetch('/upload', {
-                method: 'POST',
-                body: formData,
-            });
-            if (!response.ok) {
-                const errorData = await response.json().catch(() => ({}));
-                throw new Error(errorData.error || `Server error: ${response.status} ${response.statusText}`);
-            }
-            const data = await response.json();
+            const data = await uploadInChunks(file);
             onUploadComplete(data.filename);
         } catch (error) {
             console.error('Error uploading file:', error);
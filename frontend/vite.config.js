@@ -6,6 +6,16 @@ export default defineConfig({
   plugins: [react()],
   server: {
     proxy: {
+      // Resumable upload sessions (listed before '/upload', which would also prefix-match them)
+      '/uploads': {
+        target: 'http://127.0.0.1:8000',
+        changeOrigin: true,
+        timeout: 0,
+        proxyTimeout: 0,
+        onError: (err, req, res) => {
+          console.log('Proxy error:', err.message);
+        },
+      },
       '/upload': {
         target: 'http://127.0.0.1:8000',
         changeOrigin: true,